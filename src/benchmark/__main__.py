@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+from benchmark.corpus import build_corpus, corpus_kinds
+from benchmark.mock_servers import start_mineru_server, start_vlm_server
+
+# 运行方式：direct 直接调用 convert_to_markdown_main，api 通过 FastAPI 应用调用 /v1/convert
+# 带 -llm 后缀的方式使用 LLM 逐页解析
+benchmark_modes = ("direct", "direct-llm", "api", "api-llm")
+# 影响测量结果的参数，与基线不同时对比结果仅供参考
+compared_options = (
+    "files",
+    "pages",
+    "concurrency",
+    "warmup",
+    "seed",
+    "mineru_latency",
+    "mineru_page_latency",
+    "vlm_latency",
+    "jitter",
+)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark",
+        description="使用模拟的 MinerU / VLM 服务和合成语料离线测量转换性能，并与基线对比",
+    )
+    parser.add_argument("--kinds", nargs="+", default=list(corpus_kinds), choices=corpus_kinds)
+    parser.add_argument("--modes", nargs="+", default=list(benchmark_modes), choices=benchmark_modes)
+    parser.add_argument("--files", type=int, default=8, help="每种文件类型的文件数")
+    parser.add_argument("--pages", type=int, default=4, help="每个文件的页数/章节数")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1, help="每组预热的文件数，不计入统计")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mineru-latency", type=float, default=0.2, help="MinerU 每个请求的延迟(秒)")
+    parser.add_argument("--mineru-page-latency", type=float, default=0.05, help="MinerU 每页额外延迟(秒)")
+    parser.add_argument("--vlm-latency", type=float, default=0.5, help="VLM 每个请求的延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="模拟服务延迟的抖动比例")
+    parser.add_argument("--output", default=".cache/benchmark/latest.json")
+    parser.add_argument("--baseline", default=".cache/benchmark/baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.2, help="相对基线变差超过该比例记为回退")
+    return parser.parse_args(argv)
+
+
+def configure_environment(mineru_url: str, vlm_url: str):
+    # 配置在导入 utils.config 时读取，必须在导入被测模块之前设置
+    # 关闭结果缓存和逐页缓存，预热和重复运行都测量实际的转换耗时
+    os.environ.update(
+        {
+            "MINERU_API_URL": mineru_url,
+            "BASE_URL": vlm_url,
+            "API_KEY": "benchmark",
+            "MODEL_NAME": "benchmark",
+            "RESULT_CACHE_BACKEND": "none",
+            "PAGE_CACHE_BACKEND": "none",
+            "MINERU_HEALTH_CHECK_INTERVAL": "3600",
+        }
+    )
+
+
+def print_results(results: dict):
+    print(f"{'group':<24}{'files':>7}{'errors':>8}{'files/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>10}")
+    for group, stats in results.items():
+        print(
+            f"{group:<24}{stats['files']:>7}{stats['errors']:>8}{stats['throughput']:>10.2f}"
+            f"{stats['p50'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}{stats['peak_rss_mb']:>10.1f}"
+        )
+        for error in stats["error_samples"]:
+            print(f"    error: {error}")
+
+
+def print_comparison(rows: list, threshold: float):
+    print(f"\n与基线对比(变差超过 {threshold:.0%} 记为回退):")
+    print(f"{'group':<24}{'metric':<14}{'baseline':>12}{'current':>12}{'change':>10}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['group']:<24}{row['metric']:<14}{row['baseline']:>12.3f}{row['current']:>12.3f}"
+            f"{row['change']:>+10.1%}{flag}"
+        )
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    mineru_server = start_mineru_server(args.mineru_latency, args.mineru_page_latency, args.jitter)
+    vlm_server = start_vlm_server(args.vlm_latency, args.jitter)
+    try:
+        configure_environment(mineru_server.base_url, vlm_server.base_url)
+        from benchmark.runner import compare_with_baseline, run_benchmark
+
+        corpus = build_corpus(args.kinds, args.files + args.warmup, args.pages, args.seed)
+        results = run_benchmark(corpus, args.modes, args.concurrency, args.warmup)
+    finally:
+        mineru_server.stop()
+        vlm_server.stop()
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": {option: getattr(args, option) for option in compared_options},
+        },
+        "results": results,
+    }
+    print_results(results)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"\n结果已保存到 {output_path}")
+
+    baseline_path = Path(args.baseline)
+    regressions = 0
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"基线已保存到 {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        if baseline["meta"]["options"] != report["meta"]["options"]:
+            print("警告: 基线使用的参数与本次不同，对比结果仅供参考")
+        rows = compare_with_baseline(results, baseline["results"], args.threshold)
+        print_comparison(rows, args.threshold)
+        regressions = sum(row["regression"] for row in rows)
+        print(f"\n共 {regressions} 项回退")
+
+    # 有文件转换失败或出现回退时返回非零退出码，便于在 CI 中使用
+    failed = sum(stats["errors"] for stats in results.values())
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import io
+import random
+import zipfile
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+import fitz
+from PIL import Image, ImageDraw, ImageFont
+
+# 合成语料的文件种类，pdf_text 为带文本层的 pdf，pdf_scan 为只有页面图片的扫描件
+corpus_kinds = ("pdf_text", "pdf_scan", "png", "jpeg", "docx", "pptx", "xlsx")
+office_kinds = ("docx", "pptx", "xlsx")
+
+words = (
+    "document parser markdown table figure layout page section report analysis result "
+    "quarterly revenue growth model inference latency throughput benchmark service request "
+    "response cache image text paragraph heading summary appendix reference method dataset"
+).split()
+
+# A4 纸 150 dpi 的页面图片尺寸
+page_image_size = (1240, 1754)
+
+
+def make_sentence(rng: random.Random, length: int = 12) -> str:
+    sentence = " ".join(rng.choice(words) for _ in range(length))
+    return sentence[0].upper() + sentence[1:] + "."
+
+
+def make_paragraph(rng: random.Random, sentences: int = 5) -> str:
+    return " ".join(make_sentence(rng) for _ in range(sentences))
+
+
+def render_page_image(rng: random.Random, title: str) -> Image.Image:
+    # 绘制一张带标题、正文和矩形插图的页面图片
+    image = Image.new("RGB", page_image_size, "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=28)
+    draw.text((80, 60), title, fill="black", font=ImageFont.load_default(size=48))
+    y = 160
+    for _ in range(20):
+        draw.text((80, y), make_sentence(rng, 8), fill="black", font=font)
+        y += 40
+    draw.rectangle((100, 1000, 700, 1400), outline="black", fill="lightgray")
+    draw.ellipse((250, 1100, 550, 1300), fill="steelblue")
+    return image
+
+
+def encode_image(image: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    options = {"quality": 85} if image_format == "JPEG" else {}
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def make_text_pdf(rng: random.Random, pages: int) -> bytes:
+    with fitz.open() as doc:
+        for number in range(pages):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Section {number + 1}", fontsize=18)
+            rect = fitz.Rect(72, 100, page.rect.width - 72, page.rect.height - 72)
+            page.insert_textbox(rect, "\n\n".join(make_paragraph(rng) for _ in range(4)), fontsize=10)
+        return doc.tobytes(deflate=True)
+
+
+def make_scanned_pdf(rng: random.Random, pages: int) -> bytes:
+    with fitz.open() as doc:
+        for number in range(pages):
+            page = doc.new_page()
+            image_bytes = encode_image(render_page_image(rng, f"Scanned page {number + 1}"), "JPEG")
+            page.insert_image(page.rect, stream=image_bytes)
+        return doc.tobytes(deflate=True)
+
+
+def make_docx(rng: random.Random, pages: int) -> bytes:
+    # 直接写出最小的 OOXML 结构，不依赖 docx 写入库
+    body = []
+    for number in range(pages):
+        body.append(
+            f'<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr><w:r><w:t>Section {number + 1}</w:t></w:r></w:p>'
+        )
+        for _ in range(6):
+            body.append(f"<w:p><w:r><w:t>{escape(make_paragraph(rng))}</w:t></w:r></w:p>")
+        rows = "".join(
+            f"<w:tr><w:tc><w:p><w:r><w:t>{rng.choice(words)}</w:t></w:r></w:p></w:tc>"
+            f"<w:tc><w:p><w:r><w:t>{rng.randint(1, 1000)}</w:t></w:r></w:p></w:tc></w:tr>"
+            for _ in range(5)
+        )
+        body.append(f"<w:tbl>{rows}</w:tbl>")
+
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/>'
+        "</Relationships>"
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{''.join(body)}</w:body></w:document>"
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", content_types)
+        archive.writestr("_rels/.rels", rels)
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+def make_pptx(rng: random.Random, pages: int) -> bytes:
+    from pptx import Presentation
+
+    presentation = Presentation()
+    for number in range(pages):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {number + 1}"
+        slide.placeholders[1].text = "\n".join(make_sentence(rng, 8) for _ in range(5))
+    buffer = io.BytesIO()
+    presentation.save(buffer)
+    return buffer.getvalue()
+
+
+def make_xlsx(rng: random.Random, pages: int) -> bytes:
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for number in range(pages):
+        sheet = workbook.create_sheet(f"Sheet{number + 1}")
+        sheet.append(["name", "quarter", "revenue", "growth"])
+        for _ in range(100):
+            sheet.append([rng.choice(words), rng.randint(1, 4), rng.randint(1000, 99999), round(rng.random(), 4)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def make_vlm_page_html(rng: random.Random, paragraphs: int = 600, rows: int = 400, columns: int = 8) -> str:
+    # 模拟一页内容很多的 Qwen-VL 输出：带 data-bbox 的标题、段落和表格，用于测量模型输出转 markdown 的耗时
+    parts = ['<html><body>\n<h1 data-bbox="80 40 1100 90">Synthetic Report</h1>']
+    for index in range(paragraphs):
+        y = 100 + index * 2
+        parts.append(f'<p data-bbox="80 {y} 1100 {y + 2}">{escape(make_sentence(rng, 16))}</p>')
+    header = "".join(f"<th>{rng.choice(words)}</th>" for _ in range(columns))
+    body = "".join(
+        "<tr>" + "".join(f"<td>{rng.randint(0, 99999)}</td>" for _ in range(columns)) + "</tr>"
+        for _ in range(rows)
+    )
+    parts.append(f'<table data-bbox="80 1300 1100 1700"><tr>{header}</tr>{body}</table>')
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def make_file(kind: str, rng: random.Random, pages: int) -> bytes:
+    if kind == "pdf_text":
+        return make_text_pdf(rng, pages)
+    elif kind == "pdf_scan":
+        return make_scanned_pdf(rng, pages)
+    elif kind == "png":
+        return encode_image(render_page_image(rng, "Image page"), "PNG")
+    elif kind == "jpeg":
+        return encode_image(render_page_image(rng, "Image page"), "JPEG")
+    elif kind == "docx":
+        return make_docx(rng, pages)
+    elif kind == "pptx":
+        return make_pptx(rng, pages)
+    elif kind == "xlsx":
+        return make_xlsx(rng, pages)
+    else:
+        raise ValueError(f"不支持的语料类型: {kind}")
+
+
+file_extensions = {"pdf_text": "pdf", "pdf_scan": "pdf"}
+
+
+def build_corpus(kinds: List[str], files_per_kind: int, pages: int, seed: int = 0) -> Dict[str, List[Tuple[str, bytes]]]:
+    # 按固定随机种子生成语料，相同参数每次生成的文件内容相同，结果可以与基线对比
+    # pages 对 pdf 为页数，对 docx/pptx/xlsx 为章节/幻灯片/工作表数，图片固定为一页
+    corpus = {}
+    for kind in kinds:
+        rng = random.Random(f"{seed}-{kind}")
+        extension = file_extensions.get(kind, kind)
+        corpus[kind] = [
+            (f"{kind}_{index}.{extension}", make_file(kind, rng, pages))
+            for index in range(files_per_kind)
+        ]
+    return corpus
@@ -0,0 +1,50 @@
+import argparse
+import random
+import time
+
+from bs4 import BeautifulSoup
+
+from benchmark.corpus import make_vlm_page_html
+
+# 模型输出转 markdown 的耗时：分别测量 HTML 解析、清理(postprocess_html)和生成 markdown(soup_to_markdown)
+# 运行方式：python -m benchmark.html_markdown
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.html_markdown")
+    parser.add_argument("--paragraphs", type=int, default=600)
+    parser.add_argument("--rows", type=int, default=400)
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from benchmark.__main__ import configure_environment
+
+    configure_environment("http://127.0.0.1:9", "http://127.0.0.1:9")
+    from qwen_vl_parse.main import html_parser, postprocess_html, soup_to_markdown
+
+    html = make_vlm_page_html(random.Random(args.seed), args.paragraphs, args.rows, args.columns)
+    timings = {"parse": [], "postprocess": [], "emit": []}
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        soup = BeautifulSoup(html, html_parser)
+        parsed = time.perf_counter()
+        postprocess_html(soup)
+        cleaned = time.perf_counter()
+        soup_to_markdown(soup)
+        emitted = time.perf_counter()
+        timings["parse"].append(parsed - start)
+        timings["postprocess"].append(cleaned - parsed)
+        timings["emit"].append(emitted - cleaned)
+
+    print(f"{len(html)} 字符，解析器 {html_parser}，{args.repeat} 次取中位数")
+    for name, values in timings.items():
+        print(f"{name:<12}{sorted(values)[len(values) // 2] * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import base64
+import io
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import fitz
+from fastapi import FastAPI, UploadFile
+from PIL import Image
+
+# 模拟 Qwen-VL 输出的 HTML，包含标题、段落、表格、公式和一张需要裁剪的插图
+canned_vlm_html = """<html><body>
+<h1 data-bbox="80 60 900 120">Benchmark Report</h1>
+<p data-bbox="80 140 1100 260">The quick brown fox jumps over the lazy dog. This paragraph stands in for the body text of a scanned page and is long enough to exercise the markdown post-processing.</p>
+<table data-bbox="80 280 1100 480"><tr><th>Item</th><th>Value</th></tr><tr><td>alpha</td><td>1.25</td></tr><tr><td>beta</td><td>2.50</td></tr></table>
+<div class="formula machine_printed" data-bbox="80 500 600 560">E = mc^2</div>
+<div class="image" data-bbox="100 600 700 1000"><img data-bbox="100 600 700 1000"/></div>
+<p data-bbox="80 1020 1100 1100">Figure 1: a synthetic figure cropped from the page image.</p>
+</body></html>"""
+
+# 模拟 MinerU 返回的插图，每个 pdf 共用一张
+mineru_figure = Image.new("RGB", (64, 64), "gray")
+mineru_figure_buffer = io.BytesIO()
+mineru_figure.save(mineru_figure_buffer, format="JPEG")
+mineru_figure_data_url = "data:image/jpeg;base64," + base64.b64encode(mineru_figure_buffer.getvalue()).decode()
+
+
+def get_delay(latency: float, jitter: float, rng: random.Random) -> float:
+    # 在 latency 上叠加 ±jitter 比例的均匀抖动，模拟服务端延迟的波动
+    return max(0.0, latency * (1 + rng.uniform(-jitter, jitter)))
+
+
+def create_mineru_app(latency: float, page_latency: float, jitter: float, seed: int = 0) -> FastAPI:
+    # MinerU /pdf_parse 接口的替身：按页数模拟解析耗时，返回每页文本层内容和一张插图
+    app = FastAPI()
+    rng = random.Random(seed)
+
+    @app.post("/v1/pdf_parse")
+    async def pdf_parse(pdf_file: UploadFile, return_images: bool = False):
+        data = await pdf_file.read()
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            pages = [page.get_text().strip() or f"Scanned page {page.number + 1}" for page in doc]
+        await asyncio.sleep(get_delay(latency + page_latency * len(pages), jitter, rng))
+
+        md_content = "\n\n".join(f"{text}\n\n![](images/figure.jpg)" for text in pages)
+        res = {"md_content": md_content}
+        if return_images:
+            res["images"] = {"figure.jpg": mineru_figure_data_url}
+        return res
+
+    return app
+
+
+def create_vlm_app(latency: float, jitter: float, seed: int = 0) -> FastAPI:
+    # OpenAI 兼容的 /chat/completions 替身，固定返回 Qwen-VL 风格的 HTML
+    app = FastAPI()
+    rng = random.Random(seed)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        await asyncio.sleep(get_delay(latency, jitter, rng))
+        return {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "benchmark"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": canned_vlm_html},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    return app
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"模拟服务启动失败，退出码 {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"等待模拟服务端口 {port} 超时")
+
+
+class MockServer:
+    # 在独立进程中运行模拟服务，避免与被测代码争用 GIL 影响测量
+    def __init__(self, kind: str, args: List[str]):
+        self.kind = kind
+        self.port = get_free_port()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "benchmark.mock_servers", kind, "--port", str(self.port), *args],
+            cwd=Path(__file__).resolve().parents[1],
+        )
+        wait_for_port(self.port, self.process)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def start_mineru_server(latency: float, page_latency: float, jitter: float) -> MockServer:
+    return MockServer(
+        "mineru",
+        ["--latency", str(latency), "--page-latency", str(page_latency), "--jitter", str(jitter)],
+    )
+
+
+def start_vlm_server(latency: float, jitter: float) -> MockServer:
+    return MockServer("vlm", ["--latency", str(latency), "--jitter", str(jitter)])
+
+
+def main(argv: Optional[List[str]] = None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="MinerU / OpenAI 兼容接口的模拟服务")
+    parser.add_argument("kind", choices=["mineru", "vlm"])
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟(秒)")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="MinerU 每页额外延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动比例")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.kind == "mineru":
+        app = create_mineru_app(args.latency, args.page_latency, args.jitter, args.seed)
+    else:
+        app = create_vlm_app(args.latency, args.jitter, args.seed)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmark.corpus import office_kinds
+# 被测模块在导入时读取配置，本模块需要在设置好模拟服务地址之后导入
+from utils.utils import convert_to_markdown_main
+
+def get_rss_bytes() -> int:
+    # 读取当前进程的常驻内存，不支持 /proc 的系统退回到历史峰值
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class RssSampler:
+    # 后台线程定期采样常驻内存，记录一组测试期间的峰值
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = get_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop_event.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_rss_bytes())
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, get_rss_bytes())
+
+
+def percentile(values: List[float], p: float) -> float:
+    # 线性插值的分位数
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * p
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize_group(latencies: List[float], errors: List[str], elapsed: float, peak_rss: int) -> dict:
+    files = len(latencies) + len(errors)
+    return {
+        "files": files,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "elapsed": elapsed,
+        "throughput": files / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "peak_rss_mb": peak_rss / 1024 / 1024,
+    }
+
+
+def run_direct(files: List[Tuple[str, bytes]], use_llm: bool, concurrency: int) -> Tuple[List[float], List[str]]:
+    def convert(file: Tuple[str, bytes]) -> Tuple[float, str]:
+        file_name, file_bytes = file
+        start = time.perf_counter()
+        try:
+            convert_to_markdown_main(file_bytes, file_name, use_llm)
+        except Exception as e:
+            return time.perf_counter() - start, f"{file_name}: {e}"
+        return time.perf_counter() - start, None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(convert, files))
+    return [elapsed for elapsed, error in results if error is None], [error for _, error in results if error]
+
+
+async def run_api(
+    client: httpx.AsyncClient, files: List[Tuple[str, bytes]], use_llm: bool, concurrency: int
+) -> Tuple[List[float], List[str]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def convert(file: Tuple[str, bytes]) -> Tuple[float, str]:
+        file_name, file_bytes = file
+        async with semaphore:
+            start = time.perf_counter()
+            res = await client.post(
+                "/v1/convert",
+                files={"file": (file_name, file_bytes)},
+                data={"use_llm": str(use_llm).lower()},
+            )
+            elapsed = time.perf_counter() - start
+        if res.status_code != 200:
+            return elapsed, f"{file_name}: {res.status_code} {res.text[:200]}"
+        return elapsed, None
+
+    results = await asyncio.gather(*(convert(file) for file in files))
+    return [elapsed for elapsed, error in results if error is None], [error for _, error in results if error]
+
+
+def get_groups(corpus: Dict[str, List[Tuple[str, bytes]]], modes: List[str]) -> List[Tuple[str, str]]:
+    # office 文件不区分解析引擎，跳过 -llm 方式
+    return [
+        (kind, mode)
+        for mode in modes
+        for kind in corpus
+        if not (kind in office_kinds and mode.endswith("-llm"))
+    ]
+
+
+async def run_benchmark_async(
+    corpus: Dict[str, List[Tuple[str, bytes]]], modes: List[str], concurrency: int, warmup: int
+) -> Dict[str, dict]:
+    # 按 (文件类型, 运行方式) 分组依次运行，每组先用前 warmup 个文件预热，其余文件计入统计
+    # api 方式在进程内通过 ASGI 调用应用，包含 multipart 解析、中间件和 JSON 序列化的开销
+    from main import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=3600) as client:
+            for kind, mode in get_groups(corpus, modes):
+                warmup_files, files = corpus[kind][:warmup], corpus[kind][warmup:]
+                use_llm = mode.endswith("-llm")
+                loop = asyncio.get_running_loop()
+                if mode.startswith("api"):
+                    await run_api(client, warmup_files, use_llm, concurrency)
+                else:
+                    await loop.run_in_executor(None, run_direct, warmup_files, use_llm, concurrency)
+
+                with RssSampler() as sampler:
+                    start = time.perf_counter()
+                    if mode.startswith("api"):
+                        latencies, errors = await run_api(client, files, use_llm, concurrency)
+                    else:
+                        latencies, errors = await loop.run_in_executor(
+                            None, run_direct, files, use_llm, concurrency
+                        )
+                    elapsed = time.perf_counter() - start
+                results[f"{kind}/{mode}"] = summarize_group(latencies, errors, elapsed, sampler.peak)
+    return results
+
+
+def run_benchmark(
+    corpus: Dict[str, List[Tuple[str, bytes]]], modes: List[str], concurrency: int = 4, warmup: int = 1
+) -> Dict[str, dict]:
+    return asyncio.run(run_benchmark_async(corpus, modes, concurrency, warmup))
+
+
+# 与基线对比的指标及其变差的方向：1 表示越大越差，-1 表示越小越差
+compared_metrics = {"p50": 1, "p99": 1, "peak_rss_mb": 1, "throughput": -1}
+
+
+def compare_with_baseline(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[dict]:
+    # 逐组逐指标计算相对基线的变化，变差超过 threshold 比例的记为回退
+    # 基线中没有或有转换失败的组不参与对比
+    rows = []
+    for group, current in results.items():
+        previous = baseline.get(group)
+        if previous is None or previous["errors"]:
+            continue
+        for metric, direction in compared_metrics.items():
+            before, after = previous.get(metric, 0), current.get(metric, 0)
+            change = (after - before) / before if before else 0.0
+            rows.append(
+                {
+                    "group": group,
+                    "metric": metric,
+                    "baseline": before,
+                    "current": after,
+                    "change": change,
+                    "regression": change * direction > threshold,
+                }
+            )
+    return rows
@@ -1,52 +1,388 @@
+import json
+import time
+from contextlib import asynccontextmanager
 from io import BytesIO
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, Form, Request
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 
-from utils.utils import convert_to_markdown_main, get_mime_type
-from pandoc_convert.main import convert_markdown_to_new
+from utils.async_convert import aiter_convert_to_markdown, convert_to_markdown_main_async
+from utils.batch import aiter_batch_zip, aiter_convert_batch, count_batch_files, iter_batch_files
+from utils.executors import run_cpu, shutdown_cpu_executor
+from utils.utils import detect_file_type, get_mime_type, result_cache
+from qwen_vl_parse.main import image_formats, image_modes, page_cache
+from utils.asset_store import asset_store, extension_mimes
+from utils.config import config
+from utils.http_client import (
+    close_mineru_async_client,
+    close_mineru_client,
+    get_mineru_async_client,
+    get_mineru_client,
+)
+from utils.jobs import QueueFullError, job_manager
+from utils.libreoffice_pool import libreoffice_pool
+from utils.metrics import (
+    collect_timings,
+    http_request_seconds,
+    http_requests_in_flight,
+    render_metrics,
+)
+from utils.mineru_balancer import mineru_balancer
+from utils.uploads import UploadTooLargeError, check_content_length, read_upload
+from utils.pandoc_server import pandoc_server
+from pandoc_convert.main import convert_markdown_to_new, render_cache
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时创建共享的 MinerU 连接池和常驻的 pandoc server，关闭时释放连接、任务线程和子进程
+    get_mineru_client()
+    get_mineru_async_client()
+    mineru_balancer.start_health_check()
+    if config.PANDOC_SERVER_ENABLED:
+        await run_cpu(pandoc_server.is_available)
+    yield
+    mineru_balancer.stop_health_check()
+    job_manager.shutdown()
+    libreoffice_pool.shutdown()
+    pandoc_server.shutdown()
+    shutdown_cpu_executor()
+    close_mineru_client()
+    await close_mineru_async_client()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# 各上传接口的文件大小上限
+upload_limits = {
+    "/v1/convert": config.UPLOAD_MAX_BYTES,
+    "/v1/convert/stream": config.UPLOAD_MAX_BYTES,
+    "/v1/convert/batch": config.BATCH_UPLOAD_MAX_BYTES,
+    "/v1/jobs": config.UPLOAD_MAX_BYTES,
+    "/v1/markdown": config.MARKDOWN_UPLOAD_MAX_BYTES,
+}
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # 在解析 multipart 请求体之前按 Content-Length 提前拒绝过大的上传
+    max_bytes = upload_limits.get(request.url.path, 0)
+    try:
+        check_content_length(request.headers.get("content-length"), max_bytes)
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"code": 413, "error": str(e)}, status_code=413)
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    # 按路由模板统计请求耗时，避免任务 ID、图片名等路径参数产生过多标签
+    http_requests_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        http_requests_in_flight.dec()
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        http_request_seconds.observe(path, str(status), value=time.perf_counter() - start)
 
 
 @app.get("/")
 @app.get("/ping")
-def ping():
+async def ping():
     return "pong"
 
 
+@app.get("/v1/cache/stats")
+async def cache_stats():
+    data = {
+        "result": result_cache.stats(),
+        "page": page_cache.stats(),
+        "assets": asset_store.stats(),
+        "render": render_cache.stats(),
+    }
+    return JSONResponse(content={"code": 200, "data": data})
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/v1/mineru/backends")
+async def mineru_backends():
+    return JSONResponse(content={"code": 200, "data": mineru_balancer.stats()})
+
+
+def check_image_options(image_format: str, image_mode: str) -> Optional[str]:
+    if image_format not in image_formats:
+        return f"不支持的图片格式: {image_format}"
+    if image_mode not in image_modes:
+        return f"不支持的图片返回方式: {image_mode}"
+    return None
+
+
 @app.post("/v1/convert")
-def convert(
+async def convert(
     file: UploadFile = File(...),
     return_images: bool = Form(False),
     use_llm: bool = Form(False),
+    image_format: str = Form("jpeg"),
+    image_mode: str = Form(config.IMAGE_MODE),
+    timing: bool = Form(False),
 ):
-    file_bytes = file.file.read()
+    # timing 为 true 时在 report 中返回各阶段耗时
+    try:
+        file_bytes = read_upload(file, config.UPLOAD_MAX_BYTES)
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"code": 413, "error": str(e)}, status_code=413)
     file_name = file.filename
 
+    error = check_image_options(image_format, image_mode)
+    if error is not None:
+        return JSONResponse(content={"code": 400, "error": error}, status_code=400)
+
     try:
-        res = convert_to_markdown_main(file_bytes, file_name, use_llm, return_images)
+        report = {}
+        with collect_timings() as timings:
+            res = await convert_to_markdown_main_async(
+                file_bytes,
+                file_name,
+                use_llm,
+                return_images,
+                report=report,
+                image_format=image_format,
+                image_mode=image_mode,
+            )
+        if timing:
+            report["timings"] = timings
 
-        return JSONResponse(content={"code": 200, "data": res})
+        return JSONResponse(content={"code": 200, "data": res, "report": report})
 
     except Exception as e:
         return JSONResponse(content={"code": 400, "error": str(e)}, status_code=400)
 
 
+def format_stream_event(event: str, data: dict, stream_format: str) -> str:
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
+
+
+@app.post("/v1/convert/stream")
+async def convert_stream(
+    file: UploadFile = File(...),
+    return_images: bool = Form(False),
+    use_llm: bool = Form(False),
+    image_format: str = Form("jpeg"),
+    image_mode: str = Form(config.IMAGE_MODE),
+    stream_format: str = Form("ndjson"),
+    timing: bool = Form(False),
+):
+    # 逐页流式返回 markdown，stream_format 可选 ndjson 或 sse
+    try:
+        file_bytes = read_upload(file, config.UPLOAD_MAX_BYTES)
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"code": 413, "error": str(e)}, status_code=413)
+    file_name = file.filename
+
+    if stream_format not in ("ndjson", "sse"):
+        return JSONResponse(
+            content={"code": 400, "error": f"不支持的流格式: {stream_format}"}, status_code=400
+        )
+    error = check_image_options(image_format, image_mode)
+    if error is not None:
+        return JSONResponse(content={"code": 400, "error": error}, status_code=400)
+    if await run_cpu(detect_file_type, file_bytes, file_name) is None:
+        return JSONResponse(content={"code": 400, "error": "Unsupported file type"}, status_code=400)
+
+    async def generate():
+        start = time.perf_counter()
+        pages = 0
+        try:
+            with collect_timings() as timings:
+                page_results = aiter_convert_to_markdown(
+                    file_bytes, file_name, use_llm, return_images, image_format, image_mode
+                )
+                async for page_result in page_results:
+                    pages += 1
+                    yield format_stream_event("page", page_result, stream_format)
+        except Exception as e:
+            yield format_stream_event("error", {"error": str(e)}, stream_format)
+            return
+
+        done = {"pages": pages, "elapsed": time.perf_counter() - start}
+        if timing:
+            done["timings"] = timings
+        yield format_stream_event("done", done, stream_format)
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(content=generate(), media_type=media_type)
+
+
+@app.post("/v1/convert/batch")
+async def convert_batch(
+    files: List[UploadFile] = File(...),
+    return_images: bool = Form(False),
+    use_llm: bool = Form(False),
+    image_format: str = Form("jpeg"),
+    image_mode: str = Form(config.IMAGE_MODE),
+    output_format: str = Form("ndjson"),
+    timing: bool = Form(False),
+):
+    # 批量转换多个文件或 zip 压缩包，按完成顺序逐个返回结果，单个文件失败不影响其它文件
+    # output_format 可选 ndjson、sse 或 zip(每个文件一个 markdown，附 results.json)
+    if output_format not in ("ndjson", "sse", "zip"):
+        return JSONResponse(
+            content={"code": 400, "error": f"不支持的输出格式: {output_format}"}, status_code=400
+        )
+    error = check_image_options(image_format, image_mode)
+    if error is not None:
+        return JSONResponse(content={"code": 400, "error": error}, status_code=400)
+
+    uploads = []
+    for file in files:
+        try:
+            max_bytes = 0 if file.filename.lower().endswith(".zip") else config.UPLOAD_MAX_BYTES
+            uploads.append((file.filename, read_upload(file, max_bytes)))
+        except UploadTooLargeError as e:
+            uploads.append((file.filename, e))
+    file_count = await run_cpu(count_batch_files, uploads)
+    if file_count > config.BATCH_MAX_FILES:
+        return JSONResponse(
+            content={"code": 400, "error": f"文件数 {file_count} 超过上限 {config.BATCH_MAX_FILES}"},
+            status_code=400,
+        )
+
+    events = aiter_convert_batch(
+        iter_batch_files(uploads, config.UPLOAD_MAX_BYTES),
+        use_llm,
+        return_images,
+        image_format,
+        image_mode,
+        timing,
+    )
+    if output_format == "zip":
+        return StreamingResponse(
+            content=aiter_batch_zip(events),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="results.zip"'},
+        )
+
+    async def generate():
+        async for event, data in events:
+            yield format_stream_event(event, data, output_format)
+
+    media_type = "text/event-stream" if output_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(content=generate(), media_type=media_type)
+
+
+@app.post("/v1/jobs")
+async def submit_job(
+    file: UploadFile = File(...),
+    return_images: bool = Form(False),
+    use_llm: bool = Form(False),
+    image_format: str = Form("jpeg"),
+    image_mode: str = Form(config.IMAGE_MODE),
+):
+    try:
+        file_bytes = read_upload(file, config.UPLOAD_MAX_BYTES)
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"code": 413, "error": str(e)}, status_code=413)
+    file_name = file.filename
+
+    error = check_image_options(image_format, image_mode)
+    if error is not None:
+        return JSONResponse(content={"code": 400, "error": error}, status_code=400)
+
+    try:
+        job = job_manager.submit(
+            file_bytes, file_name, use_llm, return_images, image_format, image_mode
+        )
+    except QueueFullError as e:
+        return JSONResponse(content={"code": 429, "error": str(e)}, status_code=429)
+
+    return JSONResponse(content={"code": 202, "data": job.to_dict()}, status_code=202)
+
+
+@app.get("/v1/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(content={"code": 404, "error": "任务不存在"}, status_code=404)
+
+    return JSONResponse(content={"code": 200, "data": job.to_dict()})
+
+
+@app.get("/v1/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(content={"code": 404, "error": "任务不存在"}, status_code=404)
+    if job.status == "failed":
+        return JSONResponse(content={"code": 400, "error": job.error}, status_code=400)
+    if job.status != "succeeded":
+        return JSONResponse(
+            content={"code": 409, "error": f"任务尚未完成: {job.status}"}, status_code=409
+        )
+
+    return JSONResponse(content={"code": 200, "data": job.result})
+
+
+@app.get("/v1/assets/{name}")
+async def get_asset(name: str, request: Request):
+    # 返回图片存储中的图片，文件名即内容哈希，内容不会变化，ETag 直接使用哈希
+    # 本地存储支持 Range 请求，S3 存储重定向到预签名地址
+    if not asset_store.is_valid_name(name):
+        return JSONResponse(content={"code": 404, "error": "图片不存在"}, status_code=404)
+
+    if asset_store.backend == "s3":
+        return RedirectResponse(asset_store.presigned_url(name))
+
+    path = asset_store.path_for(name)
+    if not path.is_file():
+        return JSONResponse(content={"code": 404, "error": "图片不存在"}, status_code=404)
+
+    headers = {
+        "ETag": f'"{name.split(".", 1)[0]}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    media_type = extension_mimes[name.rsplit(".", 1)[-1]]
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
 @app.post("/v1/markdown")
-def convert_to_new(
+async def convert_to_new(
     file: UploadFile = File(...),
     convert_to: str = Form("docx"),
 ):
-    file_bytes = file.file.read()
+    try:
+        file_bytes = read_upload(file, config.MARKDOWN_UPLOAD_MAX_BYTES)
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"code": 413, "error": str(e)}, status_code=413)
     file_name = file.filename
     return_name = Path(file_name).with_suffix(f".{convert_to}")
 
     try:
-        res = convert_markdown_to_new(file_bytes, convert_to)
+        res = await run_cpu(convert_markdown_to_new, file_bytes, convert_to)
         return StreamingResponse(
             content=BytesIO(res),
-            media_type=get_mime_type(res),
+            media_type=await run_cpu(get_mime_type, res),
             headers={"Content-Disposition": f'attachment; filename="{return_name}"'},
         )
     except Exception as e:
@@ -1,11 +1,56 @@
-from io import BytesIO
+import csv
+from io import BytesIO, StringIO
+from typing import Optional
 
-from markitdown import MarkItDown
+from markitdown import MarkItDown, StreamInfo
 
+from utils.metrics import timed
 
-def convert_office_to_markdown(file: bytes) -> str:
-    md = MarkItDown(enable_plugins=False)
-    result = md.convert(BytesIO(file))
-    return result.markdown
+# csv 常见的编码，utf-8 解码失败时按 gb18030 读取
+csv_encodings = ("utf-8-sig", "gb18030")
+
+
+def escape_table_cell(value: str) -> str:
+    return value.replace("|", "\\|").replace("\r\n", "<br>").replace("\n", "<br>").strip()
+
+
+@timed("csv")
+def convert_csv_to_markdown(file: bytes) -> str:
+    # 将 csv 转为 markdown 表格，第一行作为表头
+    for encoding in csv_encodings:
+        try:
+            text = bytes(file).decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError("无法识别 csv 文件的编码")
 
+    try:
+        dialect = csv.Sniffer().sniff(text[:64 * 1024], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    rows = [row for row in csv.reader(StringIO(text), dialect) if row]
+    if not rows:
+        return ""
 
+    width = max(len(row) for row in rows)
+    lines = []
+    for index, row in enumerate(rows):
+        cells = [escape_table_cell(cell) for cell in row] + [""] * (width - len(row))
+        lines.append("| " + " | ".join(cells) + " |")
+        if index == 0:
+            lines.append("| " + " | ".join(["---"] * width) + " |")
+    return "\n".join(lines)
+
+
+@timed("markitdown")
+def convert_office_to_markdown(file: bytes, file_type: Optional[str] = None) -> str:
+    # file_type 为检测到的文件类型，作为扩展名提示 markitdown 选择转换器
+    if file_type == "csv":
+        return convert_csv_to_markdown(file)
+
+    md = MarkItDown(enable_plugins=False)
+    stream_info = StreamInfo(extension=f".{file_type}") if file_type else None
+    result = md.convert(BytesIO(file), stream_info=stream_info)
+    return result.markdown
@@ -1,59 +1,275 @@
+import base64
+import binascii
+import functools
+import hashlib
+import json
+import queue
+import re
 import subprocess
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
 from loguru import logger
 
+from utils.cache import create_cache, make_cache_key
+from utils.config import config
+from utils.metrics import stage, timed
+from utils.pandoc_server import PandocServerError, pandoc_server
+
+try:
+    # typst 的 python 绑定，编译器在进程内常驻，字体只在创建编译器时扫描一次
+    import typst
+except ImportError:
+    typst = None
+
+docx_variables = {"CJKmainfont": config.PANDOC_CJK_FONT}
+pdf_variables = {"CJKmainfont": config.PANDOC_CJK_FONT, "fontsize": "14pt"}
+typst_font_paths: List[str] = [path.strip() for path in config.TYPST_FONT_PATHS.split(",") if path.strip()]
+
+# markdown 中的图片 ![说明](地址 "标题")，地址为 data URL(return_images 的结果)、http(s) 链接或相对路径
+image_pattern = re.compile(
+    r'!\[(?P<alt>[^\]]*)\]\(\s*<?(?P<url>data:[^)]*?|[^\s)>]+)>?(?P<title>\s+"[^"]*")?\s*\)'
+)
+image_types = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/svg+xml": "svg",
+}
+image_extensions = {"png": "png", "jpg": "jpg", "jpeg": "jpg", "gif": "gif", "webp": "webp", "svg": "svg"}
+
+render_cache = create_cache(
+    config.RENDER_CACHE_BACKEND,
+    config.RENDER_CACHE_MAX_BYTES,
+    config.RENDER_CACHE_DIR,
+)
+
+
+class TypstCompilerPool:
+    # 复用 typst 编译器，避免每次编译都重新加载字体
+    # 单个编译器同一时间只能被一个线程使用，池中最多创建 size 个，用完归还
+    def __init__(self, size: int, font_paths: List[str]):
+        self.font_paths = font_paths
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, size))
+        if typst is None:
+            logger.warning("未安装 typst 模块，pdf 将调用 typst 命令行编译")
+
+    @contextmanager
+    def acquire(self) -> Iterator["typst.Compiler"]:
+        with self._slots:
+            try:
+                compiler = self._idle.get_nowait()
+            except queue.Empty:
+                compiler = typst.Compiler(font_paths=self.font_paths)
+            try:
+                yield compiler
+            finally:
+                self._idle.put(compiler)
+
+    def compile(self, source: bytes, root: str) -> bytes:
+        # source 中的相对路径相对 root 解析，root 之外的文件不可读取
+        # 编译器会沿用上一次编译的 root，每次编译都需要显式传入
+        if typst is None:
+            return self.compile_once(source, root)
+        with self.acquire() as compiler:
+            try:
+                return compiler.compile(input=source, root=root)
+            except typst.TypstError as e:
+                raise ValueError(f"typst 编译失败: {e}") from e
+
+    def compile_once(self, source: bytes, root: str) -> bytes:
+        # 没有 typst 模块时每次启动一个 typst 进程，通过标准输入输出传递内容
+        cmd = ["typst", "compile", "--root", root]
+        for path in self.font_paths:
+            cmd += ["--font-path", path]
+        cmd += ["-", "-"]
+        process = subprocess.run(cmd, input=source, capture_output=True, timeout=config.PANDOC_SERVER_TIMEOUT)
+        if process.returncode != 0:
+            raise ValueError(f"typst 编译失败: {process.stderr.decode('utf-8', 'replace').strip()}")
+        return process.stdout
+
+
+typst_compiler_pool = TypstCompilerPool(config.TYPST_COMPILER_POOL_SIZE, typst_font_paths)
+
+
+def decode_data_url(url: str) -> Optional[Tuple[bytes, str]]:
+    header, _, encoded = url.partition(",")
+    mime_type = header[len("data:"):].split(";", 1)[0]
+    if mime_type not in image_types or ";base64" not in header:
+        return None
+    try:
+        return base64.b64decode("".join(encoded.split())), image_types[mime_type]
+    except binascii.Error:
+        return None
+
+
+def download_image(client: httpx.Client, url: str) -> Optional[Tuple[bytes, str]]:
+    # 限制单张图片的下载时间和大小，超出限制或下载失败时返回 None
+    deadline = time.monotonic() + config.PANDOC_IMAGE_TIMEOUT
+    chunks = []
+    size = 0
+    try:
+        with client.stream("GET", url) as res:
+            res.raise_for_status()
+            for chunk in res.iter_bytes():
+                size += len(chunk)
+                if size > config.PANDOC_IMAGE_MAX_BYTES:
+                    raise ValueError(f"图片超过 {config.PANDOC_IMAGE_MAX_BYTES} 字节")
+                if time.monotonic() > deadline:
+                    raise TimeoutError("下载超时")
+                chunks.append(chunk)
+            mime_type = res.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    except (httpx.HTTPError, ValueError, TimeoutError) as e:
+        logger.warning(f"无法下载图片 {url}: {e}")
+        return None
+    # 按 Content-Type 确定图片格式，类型不明确时按链接中的扩展名
+    extension = image_types.get(mime_type) or image_extensions.get(
+        Path(httpx.URL(url).path).suffix.lstrip(".").lower()
+    )
+    if extension is None:
+        logger.warning(f"无法识别图片格式 {url}: {mime_type}")
+        return None
+    return b"".join(chunks), extension
+
+
+@timed("pandoc_images")
+def collect_images(text: str) -> Tuple[str, Dict[str, bytes]]:
+    # pandoc server 不读取本地文件也不下载远程资源，typst 只能读取根目录下的文件：
+    # 导出前取回 markdown 引用的图片，data URL 直接解码，http(s) 图片限时限大小并发下载，
+    # 按内容哈希命名为 media/<哈希>.<扩展名> 并改为引用该文件；
+    # 无法取回的图片(包括相对路径)与 pandoc 一样替换为说明文字
+    urls = {match.group("url") for match in image_pattern.finditer(text)}
+    images = {url: decode_data_url(url) for url in urls if url.startswith("data:")}
+    remote_urls = [url for url in urls if url.startswith(("http://", "https://"))]
+    if remote_urls:
+        workers = max(1, min(len(remote_urls), config.PANDOC_IMAGE_CONCURRENCY))
+        with httpx.Client(timeout=config.PANDOC_IMAGE_TIMEOUT, follow_redirects=True) as client, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pandoc-image") as executor:
+            images.update(zip(remote_urls, executor.map(functools.partial(download_image, client), remote_urls)))
+
+    files = {}
+    names = {}
+    for url, image in images.items():
+        if image is None:
+            continue
+        data, extension = image
+        name = f"media/{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+        files[name] = data
+        names[url] = name
 
+    def replace(match: re.Match) -> str:
+        name = names.get(match.group("url"))
+        if name is None:
+            return match.group("alt")
+        return f"![{match.group('alt')}]({name}{match.group('title') or ''})"
+
+    return image_pattern.sub(replace, text), files
+
+
+def write_media(files: Dict[str, bytes], root: str):
+    for name, data in files.items():
+        path = Path(root) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def run_pandoc_cli(
+    text: str, convert_to: str, variables: Dict[str, str], files: Optional[Dict[str, bytes]] = None
+) -> bytes:
+    # pandoc server 不可用时调用命令行，通过标准输入输出传递内容
+    # 图片写入临时目录并以该目录为工作目录，与 server 一样只能读取随请求传入的图片
+    cmd = ["pandoc", "--from=markdown", f"--to={convert_to}", "--standalone"]
+    for name, value in variables.items():
+        cmd += ["-V", f"{name}={value}"]
+    cmd += ["-o", "-"]
+    with tempfile.TemporaryDirectory(prefix="pandoc-") as cwd:
+        write_media(files or {}, cwd)
+        process = subprocess.run(
+            cmd, input=text.encode("utf-8"), capture_output=True, timeout=config.PANDOC_SERVER_TIMEOUT, cwd=cwd
+        )
+    if process.returncode != 0:
+        raise ValueError(f"pandoc 转换失败: {process.stderr.decode('utf-8', 'replace').strip()}")
+    return process.stdout
+
+
+@timed("pandoc")
+def run_pandoc(
+    text: str, convert_to: str, variables: Dict[str, str], files: Optional[Dict[str, bytes]] = None
+) -> bytes:
+    # 优先使用常驻的 pandoc server，连接失败时退回命令行
+    if config.PANDOC_SERVER_ENABLED and pandoc_server.is_available():
+        try:
+            return pandoc_server.convert(text, convert_to, variables, files=files)
+        except PandocServerError as e:
+            logger.warning(f"{e}，使用 pandoc 命令行转换")
+    return run_pandoc_cli(text, convert_to, variables, files)
+
+
+def render_cached(file_bytes: bytes, convert_to: str, options: dict, render) -> bytes:
+    # 按 markdown 内容 + 目标格式 + 渲染参数缓存导出结果，重复导出直接返回
+    cache_key = make_cache_key("render", convert_to, json.dumps(options, sort_keys=True), file_bytes)
+    cached = render_cache.get_bytes(cache_key)
+    if cached is not None:
+        return cached
+    result = render()
+    render_cache.set_bytes(cache_key, result)
+    return result
+
+
+def render_docx(file_bytes: bytes) -> bytes:
+    # 图片随请求传给 pandoc，嵌入到 docx 中
+    text, files = collect_images(bytes(file_bytes).decode("utf-8-sig"))
+    return run_pandoc(text, "docx", docx_variables, files)
+
+
+@timed("pandoc_docx")
 def convert_markdown_to_docx(file_bytes: bytes) -> bytes:
     # 使用 pandoc 将 markdown 转换为 docx
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # 创建临时文件
-        input_file = Path(temp_dir) / "input.md"
-        input_file.write_bytes(file_bytes)
-        temp_file = Path(temp_dir) / "temp.docx"
-        cmd = [
-            "pandoc",
-            "--from=markdown",
-            "--to=docx",
-            "-V", "CJKmainfont=Microsoft YaHei",
-            "-o", temp_file,
-            input_file
-        ]
-        try:
-            # 执行命令
-            subprocess.run(cmd, check=True)
-            return temp_file.read_bytes()
-        
-        except Exception as e:
-            logger.error(f"无法将 markdown 文件转换为 DOCX 格式: {e}")
-            raise e
+    try:
+        return render_cached(
+            file_bytes,
+            "docx",
+            {"variables": docx_variables},
+            lambda: render_docx(file_bytes),
+        )
+    except Exception as e:
+        logger.error(f"无法将 markdown 文件转换为 DOCX 格式: {e}")
+        raise e
 
 
+def render_pdf(file_bytes: bytes) -> bytes:
+    # pandoc 生成 typst 源码后由常驻的 typst 编译器生成 pdf，与 --pdf-engine=typst 的结果一致
+    # --pdf-engine=typst 会把 pandoc 取回的图片写到临时目录供 typst 读取，单独生成 typst 源码时没有这一步，
+    # 图片预先写入临时目录，typst 以该目录为根目录编译
+    text, files = collect_images(bytes(file_bytes).decode("utf-8-sig"))
+    with tempfile.TemporaryDirectory(prefix="typst-") as root:
+        write_media(files, root)
+        source = run_pandoc(text, "typst", pdf_variables)
+        with stage("typst"):
+            return typst_compiler_pool.compile(source, root)
+
+
+@timed("pandoc_pdf")
 def convert_markdown_to_pdf(file_bytes: bytes) -> bytes:
-    # 使用 pandoc 将 markdown 转换为 pdf
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # 创建临时文件
-        input_file = Path(temp_dir) / "input.md"
-        input_file.write_bytes(file_bytes)
-        temp_file = Path(temp_dir) / "temp.pdf"
-        cmd = [
-            "pandoc",
-            "--from=markdown",
-            "--to=pdf",
-            "--pdf-engine=typst",
-            "-V", "CJKmainfont=Microsoft YaHei",
-            "-V", "fontsize=14pt",
-            "-o", temp_file,
-            input_file
-        ]
-        try:
-            # 执行命令
-            subprocess.run(cmd, check=True)
-            return temp_file.read_bytes()
-        
-        except Exception as e:
-            logger.error(f"无法将 markdown 文件转换为 PDF 格式: {e}")
-            raise e
+    # 使用 pandoc + typst 将 markdown 转换为 pdf
+    try:
+        return render_cached(
+            file_bytes,
+            "pdf",
+            {"variables": pdf_variables, "font_paths": typst_font_paths},
+            lambda: render_pdf(file_bytes),
+        )
+    except Exception as e:
+        logger.error(f"无法将 markdown 文件转换为 PDF 格式: {e}")
+        raise e
 
 
 def convert_markdown_to_new(file_bytes: bytes, convert_to: str) -> bytes:
@@ -64,4 +280,3 @@ def convert_markdown_to_new(file_bytes: bytes, convert_to: str) -> bytes:
         return convert_markdown_to_pdf(file_bytes)
     else:
         raise ValueError(f"不支持的转换格式: {convert_to}")
-
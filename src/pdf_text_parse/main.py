@@ -0,0 +1,237 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import fitz
+
+from utils.config import config
+from utils.fitz_utils import fitz_lock, open_pdf
+from utils.metrics import timed
+
+min_text_chars = config.PDF_TEXT_MIN_CHARS
+max_image_ratio = config.PDF_TEXT_MAX_IMAGE_RATIO
+max_drawings = config.PDF_TEXT_MAX_DRAWINGS
+# 判断多栏排版时，文本块至少包含的字符数
+column_min_chars = 20
+# 线段两端坐标相差不超过该值时视为水平或竖直的线条，与 find_tables 合并线条的默认容差一致
+rule_tolerance = 3
+
+bullet_pattern = re.compile(r"^\s*[•●○◦▪■□·\-\*–]\s+")
+ordered_pattern = re.compile(r"^\s*(\(?\d{1,3}(?:[\.\)）]\s+|、))")
+cjk_pattern = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+list_item_pattern = re.compile(r"^(- |\d+\. )")
+
+
+def count_rules(drawings: List[dict]) -> Tuple[int, int]:
+    # 统计水平和竖直的线条数，矩形按四条边计，find_tables 只根据这些线条划分单元格
+    horizontal = vertical = 0
+    for drawing in drawings:
+        for item in drawing["items"]:
+            if item[0] == "l":
+                (x0, y0), (x1, y1) = item[1], item[2]
+                if abs(y1 - y0) <= rule_tolerance:
+                    horizontal += 1
+                elif abs(x1 - x0) <= rule_tolerance:
+                    vertical += 1
+            elif item[0] in ("re", "qu"):
+                horizontal += 2
+                vertical += 2
+    return horizontal, vertical
+
+
+def analyze_page(page: fitz.Page) -> dict:
+    # 统计页面文本层字符数、图片覆盖率、矢量图形数量和其中的水平/竖直线条数
+    text = page.get_text("text")
+    chars = len(text.strip())
+    bad_chars = text.count("\ufffd")
+
+    page_area = abs(page.rect) or 1
+    image_infos = page.get_image_info()
+    image_area = 0
+    for info in image_infos:
+        image_area += abs(fitz.Rect(info["bbox"]) & page.rect)
+
+    drawings = page.get_cdrawings()
+    horizontal_rules, vertical_rules = count_rules(drawings)
+    return {
+        "chars": chars,
+        "bad_char_ratio": bad_chars / chars if chars else 0,
+        "image_count": len(image_infos),
+        "image_ratio": min(image_area / page_area, 1),
+        "drawings": len(drawings),
+        "horizontal_rules": horizontal_rules,
+        "vertical_rules": vertical_rules,
+    }
+
+
+def is_multi_column(page: fitz.Page) -> bool:
+    # 存在左右并排(纵向范围重叠、横向范围不重叠)的正文块时视为多栏排版，
+    # 本地按坐标排序会把各栏的段落交错输出；页眉、页码等短文本块不参与判断
+    rects = [
+        fitz.Rect(block[:4])
+        for block in page.get_text("blocks")
+        if block[6] == 0 and len(block[4].strip()) >= column_min_chars
+    ]
+    for index, a in enumerate(rects):
+        for b in rects[index + 1:]:
+            overlap = min(a.y1, b.y1) - max(a.y0, b.y0)
+            if overlap > 0 and (a.x1 <= b.x0 or b.x1 <= a.x0):
+                return True
+    return False
+
+
+def has_tables(page: fitz.Page, stats: dict) -> bool:
+    # 本地提取会把表格拆成零散的段落，有表格的页面交给 MinerU / LLM
+    # find_tables 每页约 50 ms，且只根据线条划分单元格：水平或竖直的线条都不足两条时不可能有表格，不再检测
+    if stats["horizontal_rules"] < 2 or stats["vertical_rules"] < 2:
+        return False
+    return bool(page.find_tables().tables)
+
+
+def classify_page(page: fitz.Page, allow_images: bool = True) -> str:
+    # 页面分类：text 文本层完整的单栏简单页面，scanned 无可用文本层，complex 图表较多、多栏或有表格的页面
+    # 开销较大的多栏和表格检测放在最后，只对前面的条件都满足的页面执行
+    # 各步骤分别加锁，表格检测期间其它请求的渲染可以穿插进行
+    with fitz_lock:
+        stats = analyze_page(page)
+    if stats["chars"] < min_text_chars or stats["bad_char_ratio"] > 0.1:
+        return "scanned"
+    if stats["image_ratio"] > max_image_ratio or stats["drawings"] > max_drawings:
+        return "complex"
+    if not allow_images and stats["image_count"] > 0:
+        return "complex"
+    with fitz_lock:
+        if is_multi_column(page):
+            return "complex"
+    with fitz_lock:
+        if has_tables(page, stats):
+            return "complex"
+    return "text"
+
+
+def classify_pdf_pages(file_bytes: bytes, allow_images: bool = True, page_numbers: Iterable[int] = None) -> List[str]:
+    # 按 page_numbers 的顺序返回各页分类，为空时分类全部页面
+    page_types = []
+    with open_pdf(file_bytes) as doc:
+        if page_numbers is None:
+            page_numbers = range(doc.page_count)
+        for number in page_numbers:
+            with fitz_lock:
+                page = doc[number]
+            page_types.append(classify_page(page, allow_images))
+    return page_types
+
+
+def get_body_font_size(pages: List[dict]) -> float:
+    # 按字符数加权统计出现最多的字号，作为正文字号；pages 为各页 get_text("dict") 的结果
+    sizes = Counter()
+    for page in pages:
+        for block in page["blocks"]:
+            for line in block.get("lines", []):
+                for span in line["spans"]:
+                    sizes[round(span["size"] * 2) / 2] += len(span["text"].strip())
+    if not sizes:
+        return 0
+    return sizes.most_common(1)[0][0]
+
+
+def join_lines(lines: list) -> str:
+    # 合并同一段落的多行文本，处理英文断字和中文换行
+    text = ""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if not text:
+            text = line
+        elif text.endswith("-") and line[:1].islower():
+            text = text[:-1] + line
+        elif cjk_pattern.match(text[-1]) or cjk_pattern.match(line[0]):
+            text += line
+        else:
+            text += " " + line
+    return text
+
+
+def get_heading_prefix(size: float, bold: bool, text: str, body_size: float) -> str:
+    if not body_size or len(text) > 120:
+        return ""
+    ratio = size / body_size
+    if ratio >= 1.8:
+        return "# "
+    if ratio >= 1.4:
+        return "## "
+    if ratio >= 1.15:
+        return "### "
+    if bold and ratio >= 1 and len(text) <= 60:
+        return "#### "
+    return ""
+
+
+def block_to_markdown(block: dict, body_size: float) -> str:
+    lines = []
+    sizes = Counter()
+    bold_chars = 0
+    total_chars = 0
+    for line in block.get("lines", []):
+        lines.append("".join(span["text"] for span in line["spans"]))
+        for span in line["spans"]:
+            length = len(span["text"].strip())
+            sizes[round(span["size"] * 2) / 2] += length
+            total_chars += length
+            if span["flags"] & fitz.TEXT_FONT_BOLD:
+                bold_chars += length
+    if not total_chars:
+        return ""
+
+    # 列表块：每一行以项目符号或序号开头时逐行输出
+    if bullet_pattern.match(lines[0]) or ordered_pattern.match(lines[0]):
+        items = []
+        for line in lines:
+            if bullet_pattern.match(line):
+                items.append("- " + bullet_pattern.sub("", line, count=1))
+            elif ordered_pattern.match(line):
+                number = re.sub(r"\D", "", ordered_pattern.match(line).group(1))
+                items.append(f"{number}. " + ordered_pattern.sub("", line, count=1))
+            elif items:
+                items[-1] = join_lines([items[-1], line])
+        return "\n".join(items)
+
+    text = join_lines(lines)
+    size = sizes.most_common(1)[0][0]
+    prefix = get_heading_prefix(size, bold_chars * 2 > total_chars, text, body_size)
+    return prefix + text
+
+
+def page_to_markdown(page: dict, body_size: float) -> str:
+    blocks = page["blocks"]
+    parts = []
+    previous = ""
+    for block in blocks:
+        if block["type"] != 0:
+            continue
+        markdown = block_to_markdown(block, body_size)
+        if not markdown:
+            continue
+        # 相邻的列表项块合并为同一个列表
+        if parts:
+            both_list = list_item_pattern.match(previous) and list_item_pattern.match(markdown)
+            parts.append("\n" if both_list else "\n\n")
+        parts.append(markdown)
+        previous = markdown.rsplit("\n", 1)[-1]
+    return "".join(parts)
+
+
+@timed("pdf_text")
+def convert_pdf_text_to_markdown(file_bytes: bytes, page_numbers: List[int] = None) -> Dict[int, str]:
+    # 直接从 pdf 文本层生成 markdown，按字号识别标题，按行首符号识别列表
+    # 返回 {页码: markdown}，正文字号按本地提取的页面统计，每页只提取一次文本
+    pages = {}
+    with open_pdf(file_bytes) as doc:
+        if page_numbers is None:
+            page_numbers = range(doc.page_count)
+        for number in page_numbers:
+            with fitz_lock:
+                pages[number] = doc[number].get_text("dict", sort=True)
+    body_size = get_body_font_size(list(pages.values()))
+    return {number: page_to_markdown(page, body_size) for number, page in pages.items()}
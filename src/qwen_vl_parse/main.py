@@ -1,13 +1,20 @@
 import base64
+import hashlib
 import io
 import re
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
-from bs4 import BeautifulSoup, Tag
-from openai import OpenAI
+import numpy as np
+from bs4 import BeautifulSoup, NavigableString, Tag
+from openai import AsyncOpenAI, OpenAI
 from PIL import Image
 from qwen_vl_utils import smart_resize
+from utils.asset_store import asset_store
+from utils.cache import create_cache, make_cache_key
 from utils.config import config
+from utils.executors import run_cpu
+from utils.metrics import count_bytes, stage, timed
 
 API_KEY = config.API_KEY
 BASE_URL = config.BASE_URL
@@ -19,119 +26,166 @@ prompt = "QwenVL HTML "
 min_pixels = config.min_pixels
 max_pixels = config.max_pixels
 
+heading_levels = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+inline_tags = {"a", "img", "code", "br", "strong", "b", "em", "i", "span", "sub", "sup", "u"}
+whitespace_pattern = re.compile(r"\s+")
+color_pattern = re.compile(r"\bcolor:[^;]+;?")
+formula_classes = {"formula.machine_printed", "formula.handwritten"}
+classes_to_clean = {"music sheet", "chemical formula", "chart"}
+
+# 解析模型输出使用的 BeautifulSoup 解析器，可选 html.parser 或 lxml
+html_parser = config.HTML_PARSER
+
+# 插图输出格式
+image_formats = {
+    "jpeg": {"pil_format": "JPEG", "mime_type": "image/jpeg", "extension": "jpg"},
+    "png": {"pil_format": "PNG", "mime_type": "image/png", "extension": "png"},
+    "webp": {"pil_format": "WEBP", "mime_type": "image/webp", "extension": "webp"},
+}
+# 图片返回方式：base64 内联，或写入图片存储后返回 URL
+image_modes = ("base64", "url")
+figure_quality = config.FIGURE_QUALITY
+figure_executor = ThreadPoolExecutor(
+    max_workers=max(1, config.FIGURE_ENCODE_WORKERS), thread_name_prefix="figure"
+)
+
 
 client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+async_client = AsyncOpenAI(api_key=API_KEY, base_url=BASE_URL)
+
+page_cache = create_cache(
+    config.PAGE_CACHE_BACKEND,
+    config.PAGE_CACHE_MAX_BYTES,
+    config.PAGE_CACHE_DIR,
+)
+
+
+def postprocess_html(soup: BeautifulSoup) -> list:
+    """
+    单次遍历模型输出的文档树，完成图片定位、属性清理和类名改写
 
+    参数:
+        soup (BeautifulSoup): 模型输出解析得到的文档树，原地修改
 
-# Function to draw bounding boxes and text on images based on HTML content
-def save_images(image, resized_width, resized_height, full_predict):
-    original_width = image.width
-    original_height = image.height
+    返回:
+        list: [(img 标签, bbox 字符串)]，需要从页面图片中裁剪的插图
+    """
+    figures = []
+    bboxes = {}
+    for tag in soup.find_all(True):
+        # 已被清空或删除的子树不再处理
+        if tag.decomposed:
+            continue
 
-    # Parse the provided HTML content
-    soup = BeautifulSoup(full_predict, "html.parser")
+        # Remove 'data-bbox' and 'data-polygon' attributes, keeping bbox for figure cropping
+        bbox_str = tag.attrs.pop("data-bbox", None)
+        tag.attrs.pop("data-polygon", None)
+        if bbox_str is not None:
+            bboxes[id(tag)] = bbox_str
+
+        if tag.name == "img" and bbox_str is not None:
+            parent = tag.parent
+            if bboxes.get(id(parent)) == bbox_str and parent.find_all("div"):
+                tag.decompose()
+                continue
+            figures.append((tag, bbox_str))
+            tag["src"] = f"img-{len(figures)}.jpg"
+
+        # Remove 'color' styles from style attributes
+        style = tag.get("style")
+        if style is not None:
+            new_style = color_pattern.sub("", style)
+            if not new_style.strip():
+                del tag["style"]
+            else:
+                tag["style"] = new_style.rstrip(";")
 
-    # Draw bounding boxes and text for each element
-    image_number = 1
-    image_path_list = {}
-    for element in soup.find_all("img", attrs={"data-bbox": True}):
-        parent_bbox_str = element.parent["data-bbox"]
-        bbox_str = element["data-bbox"]
-        if parent_bbox_str == bbox_str and element.parent.find_all("div"):
-            element.decompose()
+        classes = tag.get("class")
+        if not classes:
             continue
 
-        x1, y1, x2, y2 = map(int, bbox_str.split())
+        # Update specific class names and deduplicate
+        classes = list(dict.fromkeys("formula" if cls in formula_classes else cls for cls in classes))
+        tag["class"] = classes
+        class_name = " ".join(classes)
 
-        # Calculate scaling factors
-        scale_x = resized_width / original_width
-        scale_y = resized_height / original_height
+        # Clear contents of image captions and of tags with specific class names
+        if tag.name == "div" and class_name == "image caption":
+            tag.clear(decompose=True)
+            tag["class"] = ["image"]
+        elif class_name in classes_to_clean or any(cls in classes_to_clean for cls in classes):
+            tag.clear(decompose=True)
+            tag.attrs.pop("format", None)
 
-        # Scale coordinates accordingly
-        x1_resized = int(x1 / scale_x)
-        y1_resized = int(y1 / scale_y)
-        x2_resized = int(x2 / scale_x)
-        y2_resized = int(y2 / scale_y)
+    return figures
 
-        if x1_resized > x2_resized:
-            x1_resized, x2_resized = x2_resized, x1_resized
-        if y1_resized > y2_resized:
-            y1_resized, y2_resized = y2_resized, y1_resized
 
-        cropped_image = image.crop((x1_resized, y1_resized, x2_resized, y2_resized))
-        image_path = f"img-{image_number}.jpg"
-        # cropped_image.save(image_path)
+def parse_bbox(bbox_str: str):
+    try:
+        bbox = [int(value) for value in bbox_str.split()]
+    except ValueError:
+        return None
+    return bbox if len(bbox) == 4 else None
 
-        buffer = io.BytesIO()
-        cropped_image.save(buffer, format=format)
-        image_path_list[image_path] = encode_image(buffer.getvalue())
-        buffer.close()
 
-        element["src"] = image_path
+def encode_figure(image, box, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    image.crop(box).save(
+        buffer, format=image_formats[image_format]["pil_format"], quality=figure_quality
+    )
+    return buffer.getvalue()
+
+
+@timed("figure_crop")
+def crop_figures(image, resized_width, resized_height, figures, image_format: str = "jpeg"):
+    """
+    从页面图片中裁剪插图并编码
+
+    页面图片只解码一次，所有 bbox 用 numpy 批量从模型输入尺寸换算到原图尺寸，
+    裁剪和编码在线程池中并行执行
 
-        image_number += 1
+    返回:
+        dict: {图片占位路径: 编码后的图片字节}
+    """
+    figures = [(element, parse_bbox(bbox_str)) for element, bbox_str in figures]
+    figures = [(element, bbox) for element, bbox in figures if bbox is not None]
+    if not figures:
+        return {}
+
+    # JPEG 不支持透明通道和调色板，统一转换为 RGB 后再裁剪
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.load()
+
+    boxes = np.array([bbox for _, bbox in figures], dtype=np.float64)
+    scale = np.array([image.width / resized_width, image.height / resized_height] * 2)
+    boxes = (boxes * scale).astype(np.int64)
+    boxes = np.concatenate(
+        [np.minimum(boxes[:, :2], boxes[:, 2:]), np.maximum(boxes[:, :2], boxes[:, 2:])], axis=1
+    )
+    boxes = np.clip(boxes, 0, [image.width, image.height, image.width, image.height])
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
 
-    return soup, image_path_list
+    futures = {
+        element["src"]: figure_executor.submit(encode_figure, image, tuple(box.tolist()), image_format)
+        for (element, _), box, is_valid in zip(figures, boxes, valid)
+        if is_valid
+    }
+    return {src: future.result() for src, future in futures.items()}
 
 
-# Function to clean and format HTML content
-def clean_and_format_html(soup: BeautifulSoup):
-    # soup = BeautifulSoup(full_predict, "html.parser")
+def store_figures(figure_map: dict, image_format: str) -> dict:
+    # 插图写入内容寻址存储，返回 {图片占位路径: URL}
+    extension = image_formats[image_format]["extension"]
+    return {src: asset_store.put(data, extension) for src, data in figure_map.items()}
 
-    # Regular expression pattern to match 'color' styles in style attributes
-    color_pattern = re.compile(r"\bcolor:[^;]+;?")
 
-    # Find all tags with style attributes and remove 'color' styles
-    for tag in soup.find_all(style=True):
-        original_style = tag.get("style", "")
-        new_style = color_pattern.sub("", original_style)
-        if not new_style.strip():
-            del tag["style"]
-        else:
-            new_style = new_style.rstrip(";")
-            tag["style"] = new_style
-
-    # Remove 'data-bbox' and 'data-polygon' attributes from all tags
-    for attr in ["data-bbox", "data-polygon"]:
-        for tag in soup.find_all(attrs={attr: True}):
-            del tag[attr]
-
-    classes_to_update = ["formula.machine_printed", "formula.handwritten"]
-    # Update specific class names in div tags
-    for tag in soup.find_all(class_=True):
-        if isinstance(tag, Tag) and "class" in tag.attrs:
-            new_classes = [
-                cls if cls not in classes_to_update else "formula"
-                for cls in tag.get("class", [])
-            ]
-            tag["class"] = list(
-                dict.fromkeys(new_classes)
-            )  # Deduplicate and update class names
-
-    # Clear contents of divs with specific class names and rename their classes
-    for div in soup.find_all("div", class_="image caption"):
-        div.clear()
-        div["class"] = ["image"]
-
-    classes_to_clean = ["music sheet", "chemical formula", "chart"]
-    # Clear contents and remove 'format' attributes of tags with specific class names
-    for class_name in classes_to_clean:
-        for tag in soup.find_all(class_=class_name):
-            if isinstance(tag, Tag):
-                tag.clear()
-                if "format" in tag.attrs:
-                    del tag["format"]
-
-    # Manually build the output string
-    output = []
-    for child in soup.body.children:
-        if isinstance(child, Tag):
-            output.append(str(child))
-            output.append("\n")  # Add newline after each top-level element
-        elif isinstance(child, str) and not child.strip():
-            continue  # Ignore whitespace text nodes
-    complete_html = f"""```html\n<html><body>\n{" ".join(output)}</body></html>\n```"""
-    return complete_html
+def inline_figures(figure_map: dict, image_format: str) -> dict:
+    # 插图内联为 base64 data URL，返回 {图片占位路径: data URL}
+    mime_type = image_formats[image_format]["mime_type"]
+    return {
+        src: f"data:{mime_type};base64,{encode_image(data)}" for src, data in figure_map.items()
+    }
 
 
 #  base 64 编码格式
@@ -139,19 +193,12 @@ def encode_image(image):
     if isinstance(image, str):
         with open(image, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode("utf-8")
-    elif isinstance(image, bytes):
+    elif isinstance(image, (bytes, bytearray, memoryview)):
         return base64.b64encode(image).decode("utf-8")
 
 
-def inference_with_api(
-    image_url,
-    prompt=prompt,
-    sys_prompt=system_prompt,
-    model_id=MODEL_NAME,
-    min_pixels=512 * 28 * 28,
-    max_pixels=2048 * 28 * 28,
-):
-    messages = [
+def build_messages(image_url, prompt, sys_prompt, min_pixels, max_pixels):
+    return [
         {"role": "system", "content": [{"type": "text", "text": sys_prompt}]},
         {
             "role": "user",
@@ -166,6 +213,18 @@ def inference_with_api(
             ],
         },
     ]
+
+
+@timed("vlm_inference")
+def inference_with_api(
+    image_url,
+    prompt=prompt,
+    sys_prompt=system_prompt,
+    model_id=MODEL_NAME,
+    min_pixels=512 * 28 * 28,
+    max_pixels=2048 * 28 * 28,
+):
+    messages = build_messages(image_url, prompt, sys_prompt, min_pixels, max_pixels)
     completion = client.chat.completions.create(
         model=model_id,
         messages=messages,
@@ -176,6 +235,25 @@ def inference_with_api(
     return completion.choices[0].message.content
 
 
+@timed("vlm_inference")
+async def inference_with_api_async(
+    image_url,
+    prompt=prompt,
+    sys_prompt=system_prompt,
+    model_id=MODEL_NAME,
+    min_pixels=512 * 28 * 28,
+    max_pixels=2048 * 28 * 28,
+):
+    messages = build_messages(image_url, prompt, sys_prompt, min_pixels, max_pixels)
+    completion = await async_client.chat.completions.create(
+        model=model_id,
+        messages=messages,
+        max_tokens=8192,
+        timeout=3600,
+    )
+    return completion.choices[0].message.content
+
+
 def html_to_markdown(html_content):
     """
     将 HTML 转换为 Markdown
@@ -187,213 +265,335 @@ def html_to_markdown(html_content):
         str: 转换后的 Markdown 内容
     """
     # 创建 BeautifulSoup 对象
-    soup = BeautifulSoup(html_content, "html.parser")
+    soup = BeautifulSoup(html_content, html_parser)
+    return soup_to_markdown(soup)
+
 
+def soup_to_markdown(soup: BeautifulSoup) -> str:
     # 移除 script 和 style 标签
     for script in soup(["script", "style"]):
         script.extract()
 
-    # 初始化 Markdown 内容
-    markdown_content = ""
-
-    # 递归处理 HTML 元素
-    def process_element(element):
-        nonlocal markdown_content
-
-        # 如果是字符串，直接添加
-        if isinstance(element, str):
-            markdown_content += element
-            return
+    # 单次遍历文档树，输出片段写入列表，最后统一拼接
+    parts = []
+    root = soup.body or soup
+    for element in root.children:
+        emit_block(element, parts)
 
-        # 处理不同类型的标签
-        tag_name = element.name
+    # 清理多余的空行
+    markdown_content = re.sub(r"\n{3,}", "\n\n", "".join(parts))
 
-        if tag_name is None:
-            # 处理纯文本
-            text = element.string
-            if text:
-                markdown_content += text
+    return markdown_content.strip()
 
-        elif tag_name == "h1":
-            markdown_content += f"# {element.get_text().strip()}\n\n"
 
-        elif tag_name == "h2":
-            markdown_content += f"## {element.get_text().strip()}\n\n"
+def emit_block(element, parts: list, list_depth: int = 0):
+    # 处理块级元素，行内元素交给 emit_inline
+    if isinstance(element, NavigableString):
+        if type(element) is NavigableString:
+            parts.append(str(element))
+        return
 
-        elif tag_name == "h3":
-            markdown_content += f"### {element.get_text().strip()}\n\n"
+    tag_name = element.name
 
-        elif tag_name == "h4":
-            markdown_content += f"#### {element.get_text().strip()}\n\n"
+    if tag_name in heading_levels:
+        text = render_inline(element)
+        parts.append(f"{'#' * heading_levels[tag_name]} {text}\n\n")
 
-        elif tag_name == "h5":
-            markdown_content += f"##### {element.get_text().strip()}\n\n"
+    elif tag_name == "p":
+        parts.append(f"{render_inline(element)}\n\n")
 
-        elif tag_name == "h6":
-            markdown_content += f"###### {element.get_text().strip()}\n\n"
+    elif tag_name == "div":
+        for child in element.children:
+            emit_block(child, parts, list_depth)
+        parts.append("\n")
 
-        elif tag_name == "p":
-            markdown_content += f"{element.get_text().strip()}\n\n"
+    elif tag_name == "table":
+        emit_table(element, parts)
 
-        elif tag_name == "a":
-            href = element.get("href", "")
-            text = element.get_text().strip()
-            markdown_content += f"[{text}]({href})"
+    elif tag_name in ("ul", "ol"):
+        emit_list(element, parts, list_depth)
+        if list_depth == 0:
+            parts.append("\n")
 
-        elif tag_name == "img":
-            alt = element.get("alt", "")
-            src = element.get("src", "")
-            markdown_content += f"![{alt}]({src})"
+    elif tag_name == "blockquote":
+        inner = []
+        for child in element.children:
+            emit_block(child, inner, list_depth)
+        text = re.sub(r"\n{3,}", "\n\n", "".join(inner)).strip()
+        for line in text.split("\n"):
+            parts.append(f"> {line}\n" if line else ">\n")
+        parts.append("\n")
 
-        elif tag_name == "div":
-            # 处理 div 内的内容
-            for child in element.children:
-                process_element(child)
-            markdown_content += "\n"
+    elif tag_name == "pre":
+        code = element.get_text().strip()
+        parts.append(f"```\n{code}\n```\n\n")
 
-        elif tag_name == "table":
-            # 处理表格头部
-            headers = []
-            header_row = element.find("thead")
-            if header_row:
-                for th in header_row.find_all("th"):
-                    headers.append(th.get_text().strip())
-            else:
-                # 如果没有 thead，尝试从第一行获取标题
-                first_row = element.find("tr")
-                if first_row:
-                    for th in first_row.find_all(["th", "td"]):
-                        headers.append(th.get_text().strip())
+    elif tag_name == "hr":
+        parts.append("---\n\n")
 
-            if headers:
-                markdown_content += "| " + " | ".join(headers) + " |\n"
-                markdown_content += "| " + " | ".join(["---"] * len(headers)) + " |\n"
+    elif tag_name == "address":
+        parts.append(f"*{render_inline(element)}*\n\n")
 
-            # 处理表格内容
-            tbody = element.find("tbody") or element
-            rows = tbody.find_all("tr")
+    elif tag_name in inline_tags:
+        emit_inline(element, parts)
 
-            # 如果我们已经处理了第一行作为标题，并且没有 thead，跳过第一行
-            start_idx = 1 if not element.find("thead") and headers else 0
-
-            for row in rows[start_idx:]:
-                cells = []
-                for cell in row.find_all(["td", "th"]):
-                    cells.append(cell.get_text().strip())
-                if cells:
-                    markdown_content += "| " + " | ".join(cells) + " |\n"
+    else:
+        # 递归处理其他标签的子元素
+        for child in element.children:
+            emit_block(child, parts, list_depth)
 
-            markdown_content += "\n"
 
-        elif tag_name == "ul":
-            for li in element.find_all("li", recursive=False):
-                markdown_content += f"* {li.get_text().strip()}\n"
-            markdown_content += "\n"
+def emit_inline(element, parts: list):
+    # 处理行内元素，文本中的连续空白压缩为一个空格
+    if isinstance(element, NavigableString):
+        if type(element) is NavigableString:
+            parts.append(whitespace_pattern.sub(" ", str(element)))
+        return
 
-        elif tag_name == "ol":
-            for i, li in enumerate(element.find_all("li", recursive=False), 1):
-                markdown_content += f"{i}. {li.get_text().strip()}\n"
-            markdown_content += "\n"
+    tag_name = element.name
 
-        elif tag_name == "blockquote":
-            lines = element.get_text().strip().split("\n")
-            for line in lines:
-                markdown_content += f"> {line}\n"
-            markdown_content += "\n"
+    if tag_name == "a":
+        href = element.get("href", "")
+        parts.append(f"[{render_inline(element)}]({href})")
 
-        elif tag_name == "pre":
-            code = element.get_text().strip()
-            markdown_content += f"```\n{code}\n```\n\n"
+    elif tag_name == "img":
+        alt = element.get("alt", "")
+        src = element.get("src", "")
+        parts.append(f"![{alt}]({src})")
 
-        elif tag_name == "code":
-            code = element.get_text().strip()
-            markdown_content += f"`{code}`"
+    elif tag_name == "code":
+        parts.append(f"`{element.get_text().strip()}`")
 
-        elif tag_name == "br":
-            markdown_content += "\n"
+    elif tag_name == "br":
+        parts.append("\n")
 
-        elif tag_name == "hr":
-            markdown_content += "---\n\n"
+    elif tag_name in ("strong", "b"):
+        parts.append(f"**{render_inline(element)}**")
 
-        elif tag_name == "strong" or tag_name == "b":
-            markdown_content += f"**{element.get_text().strip()}**"
+    elif tag_name in ("em", "i"):
+        parts.append(f"*{render_inline(element)}*")
 
-        elif tag_name == "em" or tag_name == "i":
-            markdown_content += f"*{element.get_text().strip()}*"
+    elif tag_name in ("ul", "ol", "table"):
+        # 行内上下文中出现的块级结构(如单元格中的列表)只保留文本
+        parts.append(whitespace_pattern.sub(" ", element.get_text(" ")))
 
-        elif tag_name == "address":
-            address_text = element.get_text().strip()
-            markdown_content += f"*{address_text}*\n\n"
+    else:
+        for child in element.children:
+            emit_inline(child, parts)
+
+
+def render_inline(element) -> str:
+    parts = []
+    for child in element.children:
+        emit_inline(child, parts)
+    return "".join(parts).strip()
+
+
+def emit_list(element, parts: list, list_depth: int):
+    # 嵌套列表每层缩进 4 个空格，ol 支持 start 属性
+    ordered = element.name == "ol"
+    try:
+        number = int(element.get("start", 1))
+    except ValueError:
+        number = 1
+    indent = "    " * list_depth
+
+    for li in element.find_all("li", recursive=False):
+        inline_parts = []
+        nested_lists = []
+        for child in li.children:
+            if isinstance(child, Tag) and child.name in ("ul", "ol"):
+                nested_lists.append(child)
+            elif isinstance(child, Tag) and child.name in ("p", "div"):
+                inline_parts.append(" ")
+                for grandchild in child.children:
+                    emit_inline(grandchild, inline_parts)
+                inline_parts.append(" ")
+            else:
+                emit_inline(child, inline_parts)
+
+        marker = f"{number}." if ordered else "*"
+        text = whitespace_pattern.sub(" ", "".join(inline_parts)).strip()
+        parts.append(f"{indent}{marker} {text}\n")
+        for nested in nested_lists:
+            emit_list(nested, parts, list_depth + 1)
+        number += 1
+
+
+def get_span(cell, name: str) -> int:
+    try:
+        return max(1, int(cell.get(name, 1)))
+    except ValueError:
+        return 1
+
+
+def emit_table(element, parts: list):
+    # 只处理属于当前表格的行，colspan 展开为空单元格，各行补齐到相同列数
+    # rowspan 占用的列在后续行中补空单元格，后面的单元格不会错位到前一列
+    rows = []
+    header_rows = 0
+    # {列号: 还要占用的行数}
+    spanned = {}
+
+    def fill_spanned(cells: list, to_end: bool = False):
+        # 在 cells 末尾补上被上方 rowspan 占用的列，to_end 为 True 时补到最后一个被占用的列
+        last = max((column for column, rows_left in spanned.items() if rows_left), default=-1)
+        while spanned.get(len(cells)) or (to_end and len(cells) <= last):
+            if spanned.get(len(cells)):
+                spanned[len(cells)] -= 1
+            cells.append("")
+
+    for tr in element.find_all("tr"):
+        if tr.find_parent("table") is not element:
+            continue
+        cells = []
+        for cell in tr.find_all(["td", "th"], recursive=False):
+            fill_spanned(cells)
+            text = render_inline(cell).replace("\n", " ").replace("|", "\\|")
+            rowspan = get_span(cell, "rowspan")
+            for index in range(get_span(cell, "colspan")):
+                if rowspan > 1:
+                    spanned[len(cells)] = rowspan - 1
+                cells.append(text if index == 0 else "")
+        fill_spanned(cells, to_end=True)
+        if not cells:
+            continue
+        if tr.parent.name == "thead":
+            header_rows += 1
+        rows.append(cells)
 
-        else:
-            # 递归处理其他标签的子元素
-            for child in element.children:
-                process_element(child)
+    if not rows:
+        return
 
-    # 处理整个文档
-    for element in soup.body.children:
-        process_element(element)
+    # 有 thead 时使用 thead 的第一行作为表头，否则使用第一行
+    header = rows[0]
+    body = rows[max(header_rows, 1):]
+    column_count = max(len(row) for row in rows)
 
-    # 清理多余的空行
-    markdown_content = re.sub(r"\n{3,}", "\n\n", markdown_content)
+    def format_row(cells):
+        cells = cells + [""] * (column_count - len(cells))
+        return "| " + " | ".join(cells) + " |\n"
 
-    return markdown_content.strip()
+    parts.append(format_row(header))
+    parts.append("| " + " | ".join(["---"] * column_count) + " |\n")
+    for row in body:
+        parts.append(format_row(row))
+    parts.append("\n")
 
 
-def replace_image_with_base64(markdown_text, image_map):
+def replace_image_with_url(markdown_text, url_map):
     # 匹配Markdown中的图片标签
     pattern = r"\!\[(?:[^\]]*)\]\(([^)]+)\)"
 
     # 替换图片链接
     def replace(match):
         relative_path = match.group(1)
-        base64_image = image_map.get(relative_path, "")
-        return f"![{relative_path}](data:image/jpeg;base64,{base64_image})"
+        url = url_map.get(relative_path, "")
+        return f"![{relative_path}]({url})"
 
     # 应用替换
     return re.sub(pattern, replace, markdown_text)
 
 
-def parse_image(
-    image_bytes: bytes, image_name: str = None, return_images: bool = False
-):
-    image = Image.open(BytesIO(image_bytes))
-    width, height = image.size
-    input_height, input_width = smart_resize(
-        height, width, min_pixels=min_pixels, max_pixels=max_pixels
-    )
-    image_url = build_image_url(image_bytes, image_name)
-    output = inference_with_api(
-        image_url,
+def get_page_cache_key(image_bytes: bytes) -> str:
+    # 只有页面像素变化时才重新请求模型，未变化的页面直接读取缓存的模型输出
+    return make_cache_key(
+        hashlib.sha256(image_bytes).hexdigest(),
         prompt,
-        sys_prompt=system_prompt,
-        min_pixels=min_pixels,
-        max_pixels=max_pixels,
+        system_prompt,
+        MODEL_NAME,
+        min_pixels,
+        max_pixels,
     )
 
-    # print(output)
-    soup, image_map = save_images(image, input_width, input_height, output)
-    ordinary_html = clean_and_format_html(soup)
-    markdown_result = html_to_markdown(ordinary_html)
+
+def render_output(
+    output: str,
+    image_bytes: bytes,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+) -> str:
+    # 模型输出只解析一次，清理后直接生成 markdown，需要返回图片时才裁剪插图
+    with stage("html_postprocess"):
+        soup = BeautifulSoup(output, html_parser)
+        figures = postprocess_html(soup)
+        markdown_result = soup_to_markdown(soup)
     if return_images:
-        return replace_image_with_base64(markdown_result, image_map).strip()
+        image = Image.open(BytesIO(image_bytes))
+        input_height, input_width = smart_resize(
+            image.height, image.width, min_pixels=min_pixels, max_pixels=max_pixels
+        )
+        figure_map = crop_figures(image, input_width, input_height, figures, image_format)
+        if image_mode == "url":
+            url_map = store_figures(figure_map, image_format)
+        else:
+            url_map = inline_figures(figure_map, image_format)
+        return replace_image_with_url(markdown_result, url_map).strip()
 
     return markdown_result.strip()
 
 
+def parse_image(
+    image_bytes: bytes,
+    image_name: str = None,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+):
+    cache_key = get_page_cache_key(image_bytes)
+    output = page_cache.get(cache_key)
+    if output is None:
+        image_url = build_image_url(image_bytes, image_name)
+        output = inference_with_api(
+            image_url,
+            prompt,
+            sys_prompt=system_prompt,
+            min_pixels=min_pixels,
+            max_pixels=max_pixels,
+        )
+        page_cache.set(cache_key, output)
+
+    return render_output(output, image_bytes, return_images, image_format, image_mode)
+
+
+async def parse_image_async(
+    image_bytes: bytes,
+    image_name: str = None,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+):
+    # 等待模型输出时不占用线程，HTML 解析和插图裁剪放到 CPU 线程池
+    # 计算哈希和读写磁盘缓存同样放到线程池，避免阻塞事件循环
+    cache_key = await run_cpu(get_page_cache_key, image_bytes)
+    output = await run_cpu(page_cache.get, cache_key)
+    if output is None:
+        image_url = build_image_url(image_bytes, image_name)
+        output = await inference_with_api_async(
+            image_url,
+            prompt,
+            sys_prompt=system_prompt,
+            min_pixels=min_pixels,
+            max_pixels=max_pixels,
+        )
+        await run_cpu(page_cache.set, cache_key, output)
+
+    return await run_cpu(
+        render_output, output, image_bytes, return_images, image_format, image_mode
+    )
+
+
+@timed("base64_encode")
 def build_image_url(image_bytes: bytes, image_name: str = None):
+    count_bytes("vlm_image", len(image_bytes))
     base64_image = encode_image(image_bytes)
+    image_format = "jpeg"
     if image_name is not None:
         if image_name.endswith("png"):
             image_format = "png"
-        elif image_name.endswith("jpeg"):
-            image_format = "jpeg"
-        elif image_name.endswith("jpg"):
-            image_format = "jpeg"
         elif image_name.endswith("webp"):
             image_format = "webp"
-    else:
-        image_format = "jpeg"
 
     return f"data:image/{image_format};base64,{base64_image}"
 
@@ -0,0 +1,292 @@
+import base64
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional, Set, Tuple
+
+from loguru import logger
+
+from utils.config import config
+
+try:
+    # 仅在使用 S3 兼容存储时需要
+    import boto3
+except ImportError:
+    boto3 = None
+
+mime_extensions = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+extension_mimes = {extension: mime for mime, extension in mime_extensions.items()}
+
+# 当前请求写入或引用的图片，不为空时 put 会把图片加入其中，请求结束前不会被淘汰
+held_assets: ContextVar[Optional[Set[str]]] = ContextVar("held_assets", default=None)
+
+
+class AssetStore:
+    # 按内容哈希寻址的图片存储基类，相同内容只保存一份，子类实现具体存储
+    backend = "none"
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.url_pattern = re.compile(re.escape(self.base_url) + r"/([0-9a-f]{64}\.[a-z]+)")
+        self.writes = 0
+        self.dedup_hits = 0
+        # {文件名: 持有该图片的请求数}
+        self._held = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_valid_name(name: str) -> bool:
+        # 文件名格式为 sha256.扩展名，拒绝其它名称避免路径穿越
+        digest, _, extension = name.partition(".")
+        return (
+            len(digest) == 64
+            and all(c in "0123456789abcdef" for c in digest)
+            and extension in extension_mimes
+        )
+
+    @contextmanager
+    def hold(self) -> Iterator[Set[str]]:
+        # 在当前上下文中持有本次请求写入或引用的图片，退出前这些图片不会被淘汰
+        names = set()
+        token = held_assets.set(names)
+        try:
+            yield names
+        finally:
+            held_assets.reset(token)
+            with self._lock:
+                for name in names:
+                    self._held[name] -= 1
+                    if self._held[name] <= 0:
+                        del self._held[name]
+
+    def _hold(self, name: str):
+        names = held_assets.get()
+        if names is None:
+            return
+        with self._lock:
+            if name not in names:
+                names.add(name)
+                self._held[name] += 1
+
+    def refresh(self, text: str) -> bool:
+        # 结果缓存命中时确认 markdown 引用的图片仍然存在，同时持有并刷新其淘汰时间
+        # 有图片已被淘汰时返回 False，由调用方重新转换
+        for name in set(self.url_pattern.findall(text)):
+            self._hold(name)
+            if not self._exists(name):
+                return False
+        return True
+
+    def put(self, data: bytes, extension: str) -> str:
+        # 写入图片并返回可访问的 URL，已存在的内容不会重复写入
+        name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        self._hold(name)
+        if self._exists(name):
+            with self._lock:
+                self.dedup_hits += 1
+        else:
+            self._write(name, data)
+            with self._lock:
+                self.writes += 1
+        return f"{self.base_url}/{name}"
+
+    def put_data_url(self, data_url: str) -> str:
+        # 将 data:image/...;base64,... 形式的图片写入存储
+        header, _, encoded = data_url.partition(",")
+        mime_type = header[len("data:"):].split(";", 1)[0]
+        extension = mime_extensions.get(mime_type, "jpg")
+        return self.put(base64.b64decode(encoded), extension)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": self.backend, "writes": self.writes, "dedup_hits": self.dedup_hits}
+
+    def _exists(self, name: str) -> bool:
+        return False
+
+    def _write(self, name: str, data: bytes):
+        raise NotImplementedError
+
+
+class DiskAssetStore(AssetStore):
+    # 本地目录存储，按哈希前两位分子目录
+    # 超过 max_bytes 时按最后写入时间淘汰最旧的图片，超过 ttl 秒未再写入的图片在写入新图片时删除；
+    # 重复写入相同内容或结果缓存命中时会刷新时间，同一份图片被持续引用时不会过期；
+    # 进行中的请求持有的图片(hold)不会被淘汰
+    backend = "disk"
+
+    def __init__(self, root_dir: str, base_url: str, max_bytes: int = 0, ttl: float = 0):
+        super().__init__(base_url)
+        self.root_dir = Path(root_dir)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        # {文件名: (最后写入时间, 大小)}，按写入时间从旧到新排列
+        self._index: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._total = 0
+        self._load_index()
+
+    def path_for(self, name: str) -> Path:
+        return self.root_dir / name[:2] / name
+
+    def _load_index(self):
+        # 启动时扫描已有文件，按修改时间恢复淘汰顺序
+        entries = []
+        for path in self.root_dir.glob("*/*"):
+            if path.is_file() and self.is_valid_name(path.name):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path.name, stat.st_size))
+        for mtime, name, size in sorted(entries):
+            self._index[name] = (mtime, size)
+            self._total += size
+        with self._lock:
+            self._evict()
+
+    def _exists(self, name: str) -> bool:
+        path = self.path_for(name)
+        try:
+            os.utime(path)
+            size = path.stat().st_size
+        except FileNotFoundError:
+            with self._lock:
+                self._remove(name)
+            return False
+        with self._lock:
+            self._add(name, size)
+        return True
+
+    def _write(self, name: str, data: bytes):
+        path = self.path_for(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._add(name, len(data))
+            self._evict()
+
+    def _add(self, name: str, size: int):
+        self._remove(name)
+        self._index[name] = (time.time(), size)
+        self._total += size
+
+    def _remove(self, name: str):
+        entry = self._index.pop(name, None)
+        if entry is not None:
+            self._total -= entry[1]
+
+    def _evict(self):
+        # 从最旧的图片开始淘汰，跳过进行中的请求持有的图片；最新写入的一张总是保留，刚返回的 URL 不会立即失效
+        expire_before = time.time() - self.ttl
+        newest = next(reversed(self._index), None)
+        total = self._total
+        victims = []
+        for name, (mtime, size) in self._index.items():
+            over_size = 0 < self.max_bytes < total
+            expired = self.ttl > 0 and mtime < expire_before
+            if not over_size and not expired:
+                break
+            if name == newest or name in self._held:
+                continue
+            victims.append(name)
+            total -= size
+        for name in victims:
+            self._remove(name)
+            self.path_for(name).unlink(missing_ok=True)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        data = super().stats()
+        with self._lock:
+            data.update(
+                {
+                    "entries": len(self._index),
+                    "size_bytes": self._total,
+                    "max_bytes": self.max_bytes,
+                    "evictions": self.evictions,
+                    "held": len(self._held),
+                }
+            )
+        return data
+
+
+class S3AssetStore(AssetStore):
+    # S3 兼容对象存储(MinIO 等)，读取时重定向到预签名地址，由对象存储处理 Range 和 ETag
+    backend = "s3"
+
+    def __init__(self, bucket: str, prefix: str, endpoint_url: str, base_url: str, presign_expires: int):
+        if boto3 is None:
+            raise ImportError("使用 S3 图片存储需要安装 boto3: pip install 'doc-parser[s3]'")
+        super().__init__(base_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_expires = presign_expires
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        # 进程内记录已确认存在的对象，避免重复的 HEAD 请求
+        self._known = set()
+
+    def key_for(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def presigned_url(self, name: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self.key_for(name)},
+            ExpiresIn=self.presign_expires,
+        )
+
+    def _exists(self, name: str) -> bool:
+        if name in self._known:
+            return True
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key_for(name))
+        except self.client.exceptions.ClientError:
+            return False
+        self._known.add(name)
+        return True
+
+    def _write(self, name: str, data: bytes):
+        extension = name.rsplit(".", 1)[-1]
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.key_for(name),
+            Body=data,
+            ContentType=extension_mimes.get(extension, "application/octet-stream"),
+            CacheControl="public, max-age=31536000, immutable",
+        )
+        self._known.add(name)
+
+
+def create_asset_store(backend: str) -> AssetStore:
+    # 根据配置创建图片存储：disk / s3
+    if backend == "disk":
+        return DiskAssetStore(
+            config.ASSET_STORE_DIR,
+            config.ASSET_BASE_URL,
+            config.ASSET_STORE_MAX_BYTES,
+            config.ASSET_STORE_TTL,
+        )
+    elif backend == "s3":
+        logger.info(f"图片存储使用 S3 bucket: {config.ASSET_S3_BUCKET}")
+        return S3AssetStore(
+            config.ASSET_S3_BUCKET,
+            config.ASSET_S3_PREFIX,
+            config.ASSET_S3_ENDPOINT_URL,
+            config.ASSET_BASE_URL,
+            config.ASSET_S3_PRESIGN_EXPIRES,
+        )
+    else:
+        raise ValueError(f"不支持的图片存储类型: {backend}")
+
+
+asset_store = create_asset_store(config.ASSET_STORE_BACKEND)
@@ -0,0 +1,443 @@
+import asyncio
+import time
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+
+import httpx
+from loguru import logger
+
+from qwen_vl_parse.main import parse_image_async
+from utils.asset_store import asset_store
+from utils.executors import run_cpu
+from utils.http_client import get_mineru_async_client
+from utils.image_pages import ImageTiler
+from utils.metrics import timed
+from utils.mineru_balancer import mineru_balancer
+from utils.pipeline import (
+    PageCollector,
+    PagePlan,
+    ProgressCallback,
+    TileCollector,
+    can_retry_mineru,
+    get_cached_result,
+    get_conversion_kind,
+    get_mineru_request,
+    get_result_cache_key,
+    get_retry_delay,
+    get_shard_name,
+    llm_max_concurrency,
+    make_page_result,
+    merge_mineru_results,
+    mineru_shard_concurrency,
+    mineru_shard_pages,
+    pdf_file_types,
+    set_cached_result,
+    should_shard,
+    split_stream_pages,
+)
+from utils.utils import (
+    convert_image_to_pdf,
+    convert_pdf_text_to_markdown,
+    convert_pdf_to_image,
+    convert_to_markdown,
+    detect_file_type,
+    extract_pdf_pages,
+    format_mineru_result,
+    get_page_engines,
+    get_pdf_page_count,
+    split_pdf,
+)
+
+# utils.utils 中同步流程的 I/O 部分的协程版本，路由、重试、结果合并等逻辑共用 utils.pipeline
+# 等待 MinerU 和 LLM 时不占用线程，渲染、文本层提取、拆分 pdf、markitdown 等 CPU 密集步骤放到 CPU 线程池
+
+
+@timed("mineru_request")
+async def post_mineru_pdf_parse_async(file_bytes: bytes, file_name: str, return_images: bool) -> dict:
+    # 选择最空闲的 MinerU 节点解析 pdf，连接失败时换一个节点重试
+    request = get_mineru_request(file_bytes, file_name, return_images)
+    tried = []
+    while True:
+        try:
+            with mineru_balancer.backend(exclude=tried) as backend:
+                tried.append(backend)
+                res = await get_mineru_async_client().post(backend.base_url + "/pdf_parse", **request)
+                res.raise_for_status()
+                return res.json()
+        except httpx.ConnectError as e:
+            if not can_retry_mineru(tried, e):
+                raise
+
+
+async def fetch_mineru_shards_async(file_bytes: bytes, file_name: str, return_images: bool) -> dict:
+    # 大文件拆分为多个分片并行发送给 MinerU，结果按页序合并
+    shards = await run_cpu(split_pdf, file_bytes, mineru_shard_pages)
+    logger.info(f"{file_name} 拆分为 {len(shards)} 个分片发送给 MinerU")
+    semaphore = asyncio.Semaphore(mineru_shard_concurrency)
+
+    async def post_shard(index: int, shard: bytes) -> dict:
+        async with semaphore:
+            return await post_mineru_pdf_parse_async(
+                shard, get_shard_name(file_name, f"part{index}"), return_images
+            )
+
+    results = await asyncio.gather(*(post_shard(i, shard) for i, shard in enumerate(shards)))
+    return merge_mineru_results(results)
+
+
+async def fetch_mineru_api_async(
+    file_bytes: bytes, file_name: str, return_images: bool, image_mode: str = "base64"
+):
+    if should_shard(await run_cpu(get_pdf_page_count, file_bytes)):
+        res = await fetch_mineru_shards_async(file_bytes, file_name, return_images)
+    else:
+        res = await post_mineru_pdf_parse_async(file_bytes, file_name, return_images)
+    return await run_cpu(format_mineru_result, res, return_images, image_mode)
+
+
+async def parse_page_async(
+    page_index: int,
+    image_bytes: bytes,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+    image_name: Optional[str] = None,
+) -> dict:
+    # 解析单页图片，失败时按 get_retry_delay 只重试该页，image_name 与 parse_page 相同
+    start = time.perf_counter()
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            markdown = await parse_image_async(
+                image_bytes, image_name, return_images, image_format, image_mode
+            )
+            return make_page_result(page_index, markdown, None, attempts, time.perf_counter() - start)
+        except Exception as e:
+            delay = get_retry_delay(page_index, attempts, e)
+            if delay is None:
+                return make_page_result(page_index, "", str(e), attempts, time.perf_counter() - start)
+            await asyncio.sleep(delay)
+
+
+async def aiter_render_pdf_pages(file_bytes: bytes, page_numbers: List[int]) -> AsyncIterator[bytes]:
+    # 在 CPU 线程池中逐页渲染，fitz 调用由 convert_pdf_to_image 内部的全局 fitz_lock 串行
+    images_iter = convert_pdf_to_image(file_bytes, page_numbers)
+    try:
+        while True:
+            image_bytes = await run_cpu(next, images_iter, None)
+            if image_bytes is None:
+                return
+            yield image_bytes
+    finally:
+        await run_cpu(images_iter.close)
+
+
+async def aiter_parse_pages(
+    images_bytes: AsyncIterator[bytes],
+    return_images: bool = False,
+    page_numbers: Optional[List[int]] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+    image_names: Optional[List[str]] = None,
+) -> AsyncIterator[dict]:
+    # 有界并发地解析每一页，按页码顺序产出每页结果，提交窗口为并发数的两倍
+    window = llm_max_concurrency * 2
+    semaphore = asyncio.Semaphore(llm_max_concurrency)
+
+    async def parse(page_index: int, image_bytes: bytes, image_name: Optional[str]) -> dict:
+        async with semaphore:
+            return await parse_page_async(
+                page_index, image_bytes, return_images, image_format, image_mode, image_name
+            )
+
+    pending = deque()
+    index = 0
+    try:
+        async for image_bytes in images_bytes:
+            page_index = page_numbers[index] if page_numbers is not None else index
+            image_name = image_names[index] if image_names is not None else None
+            index += 1
+            pending.append(asyncio.create_task(parse(page_index, image_bytes, image_name)))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+        aclose = getattr(images_bytes, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def aiter_pdf_pages_by_engine(
+    file_bytes: bytes,
+    file_name: str,
+    page_engines: List[str],
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+    first_page: int = 0,
+) -> AsyncIterator[dict]:
+    # 按页码顺序产出每页(或每段连续 MinerU 页)的结果，与 iter_pdf_pages_by_engine 一致
+    plan = PagePlan(page_engines, first_page)
+    local_results = {}
+    if plan.local_pages:
+        local_results = await run_cpu(convert_pdf_text_to_markdown, file_bytes, plan.local_pages)
+
+    semaphore = asyncio.Semaphore(mineru_shard_concurrency)
+
+    async def fetch_run(start: int, end: int):
+        async with semaphore:
+            part = await run_cpu(extract_pdf_pages, file_bytes, start, end)
+            res = await post_mineru_pdf_parse_async(part, plan.get_run_name(file_name, start), return_images)
+            return await run_cpu(format_mineru_result, res, return_images, image_mode)
+
+    mineru_tasks = {
+        start: asyncio.create_task(fetch_run(start, end)) for start, end in plan.mineru_runs.items()
+    }
+    vlm_results = aiter_parse_pages(
+        aiter_render_pdf_pages(file_bytes, plan.vlm_pages),
+        return_images,
+        page_numbers=plan.vlm_pages,
+        image_format=image_format,
+        image_mode=image_mode,
+    )
+    try:
+        for page_index, engine, page_count in plan.steps():
+            if engine == "local":
+                result = make_page_result(page_index, local_results[page_index])
+            elif engine == "vlm":
+                result = await anext(vlm_results)
+            else:
+                start = time.perf_counter()
+                try:
+                    markdown = await mineru_tasks[page_index]
+                    result = plan.mineru_result(page_index, page_count, time.perf_counter() - start, markdown)
+                except Exception as e:
+                    result = plan.mineru_result(page_index, page_count, time.perf_counter() - start, error=e)
+            yield plan.finish(result, engine, page_count)
+    finally:
+        await vlm_results.aclose()
+        for task in mineru_tasks.values():
+            task.cancel()
+
+
+async def aiter_pdf_pages_in_stages(
+    file_bytes: bytes,
+    file_name: str,
+    head_engines: List[str],
+    rest: range,
+    use_llm: bool = False,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+) -> AsyncIterator[dict]:
+    # 与 iter_pdf_pages_in_stages 一致，其余页面在 CPU 线程池中分类
+    rest_engines = asyncio.ensure_future(run_cpu(get_page_engines, file_bytes, use_llm, return_images, rest))
+    try:
+        async for page_result in aiter_pdf_pages_by_engine(
+            file_bytes, file_name, head_engines, return_images, image_format, image_mode
+        ):
+            yield page_result
+        async for page_result in aiter_pdf_pages_by_engine(
+            file_bytes, file_name, await rest_engines, return_images, image_format, image_mode, rest.start
+        ):
+            yield page_result
+    finally:
+        rest_engines.cancel()
+
+
+async def convert_pdf_to_markdown_async(
+    file_bytes: bytes,
+    file_name: str,
+    use_llm: bool = False,
+    return_images: bool = False,
+    progress_callback: ProgressCallback = None,
+    report: Optional[dict] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+):
+    plan = PagePlan(await run_cpu(get_page_engines, file_bytes, use_llm, return_images))
+    plan.report(file_name, report)
+    if plan.all_mineru:
+        result = await fetch_mineru_api_async(file_bytes, file_name, return_images, image_mode)
+        if progress_callback is not None:
+            progress_callback(plan.page_total, plan.page_total)
+        return result
+
+    collector = PageCollector(plan.page_total, progress_callback)
+    async for page_result in aiter_pdf_pages_by_engine(
+        file_bytes, file_name, plan.page_engines, return_images, image_format, image_mode
+    ):
+        collector.add(page_result)
+    return collector.merge()
+
+
+async def convert_image_to_markdown_async(
+    file_bytes: bytes,
+    file_type: str,
+    return_images: bool = False,
+    progress_callback: ProgressCallback = None,
+    report: Optional[dict] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+) -> str:
+    # 与 convert_image_to_markdown 相同，切片的解码和编码在 CPU 线程池中逐片进行
+    tiler = await run_cpu(ImageTiler, file_bytes, file_type)
+    try:
+        collector = TileCollector(tiler, progress_callback, report)
+
+        async def aiter_tile_images() -> AsyncIterator[bytes]:
+            tiles_iter = iter(tiler)
+            while True:
+                tile = await run_cpu(next, tiles_iter, None)
+                if tile is None:
+                    return
+                yield collector.track(tile)
+
+        tile_results = aiter_parse_pages(
+            aiter_tile_images(),
+            return_images,
+            image_format=image_format,
+            image_mode=image_mode,
+            image_names=collector.image_names,
+        )
+        async for tile_result in tile_results:
+            collector.add(tile_result)
+    finally:
+        await run_cpu(tiler.close)
+
+    return await run_cpu(collector.merge)
+
+
+async def convert_to_markdown_async(
+    file_bytes: bytes,
+    file_name: str,
+    use_llm: bool = False,
+    return_images: bool = False,
+    progress_callback: ProgressCallback = None,
+    report: Optional[dict] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+):
+    file_type = await run_cpu(detect_file_type, file_bytes, file_name)
+    kind = get_conversion_kind(file_type, use_llm)
+
+    if kind == "pdf":
+        return await convert_pdf_to_markdown_async(
+            file_bytes,
+            file_name,
+            use_llm,
+            return_images,
+            progress_callback,
+            report,
+            image_format,
+            image_mode,
+        )
+
+    elif kind == "image_llm":
+        return await convert_image_to_markdown_async(
+            file_bytes,
+            file_type,
+            return_images,
+            progress_callback,
+            report,
+            image_format,
+            image_mode,
+        )
+
+    elif kind == "image_pdf":
+        pdf_bytes = await run_cpu(convert_image_to_pdf, file_bytes, file_type)
+        return await convert_pdf_to_markdown_async(
+            pdf_bytes,
+            str(Path(file_name).with_suffix(".pdf")),
+            return_images=return_images,
+            progress_callback=progress_callback,
+            report=report,
+            image_format=image_format,
+            image_mode=image_mode,
+        )
+
+    # office 文档由 LibreOffice / markitdown 在线程池中同步转换
+    return await run_cpu(convert_to_markdown, file_bytes, file_name, use_llm, return_images)
+
+
+async def convert_to_markdown_main_async(
+    file_bytes: bytes,
+    file_name: str,
+    use_llm: bool = False,
+    return_images: bool = False,
+    progress_callback: ProgressCallback = None,
+    report: Optional[dict] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+):
+    # 与 convert_to_markdown_main 相同的结果缓存逻辑
+    # 转换期间持有写入和引用的图片，返回结果之前不会被图片存储淘汰
+    with asset_store.hold():
+        cache_key = await run_cpu(
+            get_result_cache_key, file_bytes, use_llm, return_images, image_format, image_mode
+        )
+        cached = get_cached_result(cache_key, file_name, report, image_mode)
+        if cached is not None:
+            return cached
+
+        result = await convert_to_markdown_async(
+            file_bytes,
+            file_name,
+            use_llm,
+            return_images,
+            progress_callback,
+            report,
+            image_format,
+            image_mode,
+        )
+        set_cached_result(cache_key, result)
+        return result
+
+
+async def aiter_convert_to_markdown(
+    file_bytes: bytes,
+    file_name: str,
+    use_llm: bool = False,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+) -> AsyncIterator[dict]:
+    # 流式转换，与 iter_convert_to_markdown 一致
+    with asset_store.hold():
+        start = time.perf_counter()
+        cache_key = await run_cpu(
+            get_result_cache_key, file_bytes, use_llm, return_images, image_format, image_mode
+        )
+        markdown = get_cached_result(cache_key, file_name, image_mode=image_mode)
+        if markdown is None and await run_cpu(detect_file_type, file_bytes, file_name) in pdf_file_types:
+            page_count = await run_cpu(get_pdf_page_count, file_bytes)
+            head, rest = split_stream_pages(page_count)
+            head_engines = await run_cpu(get_page_engines, file_bytes, use_llm, return_images, head)
+            if rest or not PagePlan(head_engines).all_mineru:
+                collector = PageCollector(page_count)
+                async for page_result in aiter_pdf_pages_in_stages(
+                    file_bytes, file_name, head_engines, rest, use_llm, return_images, image_format, image_mode
+                ):
+                    yield collector.add(page_result)
+
+                if not collector.failed:
+                    set_cached_result(cache_key, collector.markdown)
+                return
+
+        if markdown is None:
+            markdown = await convert_to_markdown_async(
+                file_bytes,
+                file_name,
+                use_llm,
+                return_images,
+                image_format=image_format,
+                image_mode=image_mode,
+            )
+            set_cached_result(cache_key, markdown)
+
+        yield make_page_result(0, markdown, elapsed=time.perf_counter() - start)
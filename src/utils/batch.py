@@ -0,0 +1,275 @@
+import asyncio
+import io
+import json
+import posixpath
+import statistics
+import time
+import zipfile
+from pathlib import PurePosixPath
+from typing import AsyncIterator, Iterator, List, Tuple
+
+from loguru import logger
+
+from utils.async_convert import convert_to_markdown_main_async
+from utils.config import config
+from utils.executors import run_cpu
+from utils.metrics import collect_timings
+from utils.uploads import BufferReader, UploadTooLargeError
+from utils.utils import detect_file_type, image_file_types, pdf_file_types
+
+# 按文件类型限制批量转换的并发数：pdf 走 MinerU/LLM，图片走 LLM/MinerU，office 走 LibreOffice/markitdown
+batch_concurrency = {
+    "pdf": max(1, config.BATCH_PDF_CONCURRENCY),
+    "image": max(1, config.BATCH_IMAGE_CONCURRENCY),
+    "office": max(1, config.BATCH_OFFICE_CONCURRENCY),
+}
+# 同时读入内存等待转换的文件数
+batch_window = sum(batch_concurrency.values()) * 2
+
+
+def is_zip_upload(file_name: str) -> bool:
+    return file_name.lower().endswith(".zip")
+
+
+def is_batch_member(info: zipfile.ZipInfo) -> bool:
+    # 跳过目录、隐藏文件和 macOS 元数据
+    parts = PurePosixPath(info.filename).parts
+    return not info.is_dir() and not any(part.startswith((".", "__MACOSX")) for part in parts)
+
+
+def iter_zip_members(file_bytes: bytes, zip_name: str, max_bytes: int) -> Iterator[Tuple[str, bytes]]:
+    # 逐个读取压缩包中的文件，无法读取或超过大小上限的文件以异常代替内容产出，由调用方记为该文件失败
+    with zipfile.ZipFile(BufferReader(file_bytes)) as archive:
+        for info in filter(is_batch_member, archive.infolist()):
+            name = f"{zip_name}/{info.filename}"
+            if 0 < max_bytes < info.file_size:
+                yield name, UploadTooLargeError(f"文件超过大小上限 {max_bytes} 字节")
+                continue
+            try:
+                yield name, archive.read(info)
+            except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                yield name, e
+
+
+def iter_batch_files(uploads: List[Tuple[str, bytes]], max_bytes: int) -> Iterator[Tuple[str, bytes]]:
+    # 展开上传的文件列表，zip 压缩包按其中的文件逐个产出
+    for file_name, file_bytes in uploads:
+        if isinstance(file_bytes, Exception) or not is_zip_upload(file_name):
+            yield file_name, file_bytes
+            continue
+        try:
+            yield from iter_zip_members(file_bytes, file_name, max_bytes)
+        except zipfile.BadZipFile as e:
+            yield file_name, e
+
+
+def count_batch_files(uploads: List[Tuple[str, bytes]]) -> int:
+    # 只读取压缩包的目录统计文件数，用于在开始转换前检查文件数上限
+    count = 0
+    for file_name, file_bytes in uploads:
+        if isinstance(file_bytes, Exception) or not is_zip_upload(file_name):
+            count += 1
+            continue
+        try:
+            with zipfile.ZipFile(BufferReader(file_bytes)) as archive:
+                count += sum(1 for info in archive.infolist() if is_batch_member(info))
+        except zipfile.BadZipFile:
+            count += 1
+    return count
+
+
+def get_batch_category(file_type: str) -> str:
+    if file_type in pdf_file_types:
+        return "pdf"
+    if file_type in image_file_types:
+        return "image"
+    return "office"
+
+
+async def convert_batch_file(
+    index: int,
+    file_name: str,
+    file_bytes,
+    semaphores: dict,
+    use_llm: bool,
+    return_images: bool,
+    image_format: str,
+    image_mode: str,
+    timing: bool = False,
+) -> dict:
+    # 转换批量中的单个文件，失败只记录在该文件的结果中，timing 为 true 时在 report 中记录各阶段耗时
+    start = time.perf_counter()
+    result = {
+        "index": index,
+        "file_name": file_name,
+        "file_type": None,
+        "status": "failed",
+        "markdown": None,
+        "error": None,
+        "report": {},
+        "wait": 0,
+        "elapsed": 0,
+    }
+    with collect_timings() as timings:
+        try:
+            if isinstance(file_bytes, Exception):
+                raise file_bytes
+            file_type = await run_cpu(detect_file_type, file_bytes, posixpath.basename(file_name))
+            if file_type is None:
+                raise Exception("Unsupported file type")
+            result["file_type"] = file_type
+
+            async with semaphores[get_batch_category(file_type)]:
+                result["wait"] = time.perf_counter() - start
+                result["markdown"] = await convert_to_markdown_main_async(
+                    file_bytes,
+                    posixpath.basename(file_name),
+                    use_llm,
+                    return_images,
+                    report=result["report"],
+                    image_format=image_format,
+                    image_mode=image_mode,
+                )
+            result["status"] = "succeeded"
+        except Exception as e:
+            logger.warning(f"批量转换中 {file_name} 转换失败: {e}")
+            result["error"] = str(e)
+    if timing:
+        result["report"]["timings"] = timings
+
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+def summarize_batch(results: List[dict], elapsed: float) -> dict:
+    # 汇总批量转换的耗时统计，耗时分位数只统计成功的文件
+    durations = sorted(r["elapsed"] for r in results if r["status"] == "succeeded")
+    by_type = {}
+    for r in results:
+        stats = by_type.setdefault(r["file_type"] or "unknown", {"files": 0, "failed": 0, "elapsed": 0})
+        stats["files"] += 1
+        stats["failed"] += r["status"] != "succeeded"
+        stats["elapsed"] += r["elapsed"]
+
+    def percentile(p: float) -> float:
+        return durations[min(len(durations) - 1, int(len(durations) * p))] if durations else 0
+
+    return {
+        "files": len(results),
+        "succeeded": sum(r["status"] == "succeeded" for r in results),
+        "failed": sum(r["status"] != "succeeded" for r in results),
+        "cache_hits": sum(r["report"].get("cache") == "hit" for r in results),
+        "elapsed": elapsed,
+        "files_per_second": len(results) / elapsed if elapsed > 0 else 0,
+        "file_elapsed_mean": statistics.fmean(durations) if durations else 0,
+        "file_elapsed_p50": percentile(0.5),
+        "file_elapsed_p90": percentile(0.9),
+        "file_elapsed_max": durations[-1] if durations else 0,
+        "wait_total": sum(r["wait"] for r in results),
+        "by_type": by_type,
+    }
+
+
+async def aiter_convert_batch(
+    files: Iterator[Tuple[str, bytes]],
+    use_llm: bool = False,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+    timing: bool = False,
+) -> AsyncIterator[Tuple[str, dict]]:
+    # 按完成顺序产出 ("file", 单个文件结果)，最后产出 ("done", 汇总统计)
+    # 压缩包中的文件在窗口有空位时才读入内存，同类文件的并发数受 batch_concurrency 限制
+    start = time.perf_counter()
+    semaphores = {category: asyncio.Semaphore(limit) for category, limit in batch_concurrency.items()}
+    results = []
+    pending = set()
+    index = 0
+    exhausted = False
+    try:
+        while not exhausted or pending:
+            while not exhausted and len(pending) < batch_window:
+                item = await run_cpu(next, files, None)
+                if item is None:
+                    exhausted = True
+                    break
+                file_name, file_bytes = item
+                pending.add(
+                    asyncio.create_task(
+                        convert_batch_file(
+                            index,
+                            file_name,
+                            file_bytes,
+                            semaphores,
+                            use_llm,
+                            return_images,
+                            image_format,
+                            image_mode,
+                            timing,
+                        )
+                    )
+                )
+                index += 1
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                results.append({k: v for k, v in result.items() if k != "markdown"})
+                yield "file", result
+    finally:
+        for task in pending:
+            task.cancel()
+
+    yield "done", summarize_batch(results, time.perf_counter() - start)
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    # 不可 seek 的输出流，zipfile 写入后由调用方取走已生成的数据，实现边转换边输出压缩包
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def get_markdown_name(file_name: str, used_names: set) -> str:
+    # 压缩包中的 markdown 文件名，同名文件追加序号
+    name = str(PurePosixPath(file_name).with_suffix(".md"))
+    stem, count = name[:-3], 1
+    while name in used_names:
+        count += 1
+        name = f"{stem}_{count}.md"
+    used_names.add(name)
+    return name
+
+
+async def aiter_batch_zip(events: AsyncIterator[Tuple[str, dict]]) -> AsyncIterator[bytes]:
+    # 将批量结果写成 zip：每个成功的文件一个 markdown，results.json 记录每个文件的状态和汇总统计
+    buffer = ZipStreamBuffer()
+    archive = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED)
+    used_names = set()
+    file_results = []
+    async for event, data in events:
+        if event == "file":
+            result = {k: v for k, v in data.items() if k != "markdown"}
+            if data["status"] == "succeeded":
+                result["output"] = get_markdown_name(data["file_name"], used_names)
+                await run_cpu(archive.writestr, result["output"], data["markdown"])
+                yield buffer.drain()
+            file_results.append(result)
+        else:
+            summary = {"files": sorted(file_results, key=lambda r: r["index"]), "stats": data}
+            archive.writestr("results.json", json.dumps(summary, ensure_ascii=False, indent=2))
+    archive.close()
+    yield buffer.drain()
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+from loguru import logger
+
+
+def make_cache_key(*parts) -> str:
+    # 将多个字段拼接后计算 sha256 作为缓存键
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            digest.update(part)
+        else:
+            digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # 缓存后端基类，统计命中、未命中和淘汰次数，子类实现具体存储
+    backend = "none"
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        data = self.get_bytes(key)
+        return None if data is None else data.decode("utf-8")
+
+    def set(self, key: str, value: str):
+        self.set_bytes(key, value.encode("utf-8"))
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        # 二进制条目(如导出的 docx / pdf)直接按字节读写
+        with self._lock:
+            data = self._get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return data
+
+    def set_bytes(self, key: str, data: bytes):
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._set(key, data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": self._entries(),
+                "size_bytes": self._size(),
+                "max_bytes": self.max_bytes,
+            }
+
+    def _get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def _set(self, key: str, data: bytes):
+        pass
+
+    def _entries(self) -> int:
+        return 0
+
+    def _size(self) -> int:
+        return 0
+
+
+class MemoryLRUCache(ResultCache):
+    # 内存 LRU 缓存，按字节预算淘汰最久未使用的条目
+    backend = "memory"
+
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes)
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+        self._total = 0
+
+    def _get(self, key: str) -> Optional[bytes]:
+        data = self._items.get(key)
+        if data is None:
+            return None
+        self._items.move_to_end(key)
+        return data
+
+    def _set(self, key: str, data: bytes):
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._total -= len(old)
+        self._items[key] = data
+        self._total += len(data)
+        while self._total > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self._total -= len(evicted)
+            self.evictions += 1
+
+    def _entries(self) -> int:
+        return len(self._items)
+
+    def _size(self) -> int:
+        return self._total
+
+
+class DiskCache(ResultCache):
+    # 磁盘目录缓存，每个条目一个文件，超出容量时按访问时间淘汰
+    # 锁只保护内存中的索引和统计，文件读写和删除在锁外进行，慢盘上的 I/O 不会阻塞其它请求
+    backend = "disk"
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        super().__init__(max_bytes)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+        self._load_index()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _load_index(self):
+        # 启动时扫描已有文件，按修改时间恢复 LRU 顺序
+        entries = []
+        for path in self.cache_dir.glob("*/*"):
+            if path.is_file() and not path.name.endswith(".tmp"):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total += size
+        self._unlink(self._evict())
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            known = key in self._index
+        data = None
+        if known:
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except FileNotFoundError:
+                data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                # 文件已被删除(如被其它进程淘汰)时从索引中移除
+                if known and key in self._index and not self._path(key).exists():
+                    self._total -= self._index.pop(key)
+            else:
+                self.hits += 1
+                if key in self._index:
+                    self._index.move_to_end(key)
+        return data
+
+    def set_bytes(self, key: str, data: bytes):
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+        # 先写入唯一的临时文件再原子替换，多个线程或进程同时写入同一条目时互不干扰
+        path = self._path(key)
+        temp_path = path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            temp_path.unlink(missing_ok=True)
+            logger.warning(f"写入磁盘缓存失败: {e}")
+            return
+        with self._lock:
+            self._total -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._total += len(data)
+            victims = self._evict()
+        self._unlink(victims)
+
+    def _evict(self) -> List[str]:
+        # 在锁内从索引中移除最久未使用的条目，返回需要删除的键，由调用方在锁外删除文件
+        victims = []
+        while self._total > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            victims.append(key)
+        return victims
+
+    def _unlink(self, keys: List[str]):
+        for key in keys:
+            self._path(key).unlink(missing_ok=True)
+
+    def _entries(self) -> int:
+        return len(self._index)
+
+    def _size(self) -> int:
+        return self._total
+
+
+def create_cache(backend: str, max_bytes: int, cache_dir: str = None) -> ResultCache:
+    # 根据配置创建缓存后端：memory / disk / none
+    if backend == "memory":
+        return MemoryLRUCache(max_bytes)
+    elif backend == "disk":
+        return DiskCache(cache_dir, max_bytes)
+    elif backend == "none":
+        return ResultCache()
+    else:
+        raise ValueError(f"不支持的缓存类型: {backend}")
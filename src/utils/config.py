@@ -8,9 +8,126 @@ class Config(BaseSettings):
     MODEL_NAME: str
     min_pixels: int = 512 * 28 * 28
     max_pixels: int = 2048 * 28 * 28
+    # 解析模型输出的 HTML 解析器：html.parser 或 lxml(更快)
+    HTML_PARSER: str = "html.parser"
+    # LLM 插图裁剪：编码质量、并行编码线程数
+    FIGURE_QUALITY: int = 85
+    FIGURE_ENCODE_WORKERS: int = 4
 
+    # 返回图片的默认方式：base64 内联，或 url 写入图片存储后以 URL 引用
+    IMAGE_MODE: str = "base64"
+    # 图片存储：disk / s3，对外访问的 URL 前缀
+    ASSET_STORE_BACKEND: str = "disk"
+    ASSET_STORE_DIR: str = ".cache/assets"
+    # 本地图片存储的容量上限(字节)和保留时间(秒)，0 表示不限制
+    ASSET_STORE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    ASSET_STORE_TTL: int = 7 * 24 * 3600
+    ASSET_BASE_URL: str = "/v1/assets"
+    # S3 兼容存储(需要安装 s3 可选依赖)，访问密钥使用 boto3 默认的环境变量/配置文件
+    ASSET_S3_BUCKET: str = ""
+    ASSET_S3_PREFIX: str = "assets/"
+    ASSET_S3_ENDPOINT_URL: str = ""
+    ASSET_S3_PRESIGN_EXPIRES: int = 3600
+
+    # 文件类型检测：交给 libmagic 的文件开头长度、复用的 libmagic 检测器数量
+    MAGIC_HEADER_BYTES: int = 16 * 1024
+    MAGIC_POOL_SIZE: int = 4
+
+    # 上传文件大小上限(字节)，0 表示不限制
+    UPLOAD_MAX_BYTES: int = 512 * 1024 * 1024
+    MARKDOWN_UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+
+    # 异步接口中执行 CPU 密集步骤的线程数，0 表示使用 CPU 核数
+    CPU_EXECUTOR_WORKERS: int = 0
+
+    # 批量转换：文件数上限、整个请求的大小上限、各类文件的并发数
+    BATCH_MAX_FILES: int = 1000
+    BATCH_UPLOAD_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    BATCH_PDF_CONCURRENCY: int = 8
+    BATCH_IMAGE_CONCURRENCY: int = 16
+    BATCH_OFFICE_CONCURRENCY: int = 2
+
+    # LLM 逐页解析的最大并发数与单页重试次数
+    LLM_MAX_CONCURRENCY: int = 4
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BACKOFF: float = 1.0
+
+    # 视觉模型解析大图：整图缩放比例低于该值时切分为横条(超宽的图片先切成竖条)、相邻切片的重叠比例、切片最大宽度(0 表示按 max_pixels 计算)
+    IMAGE_TILE_MIN_SCALE: float = 0.35
+    IMAGE_TILE_OVERLAP: float = 0.1
+    IMAGE_TILE_MAX_WIDTH: int = 0
+
+    # PDF 渲染分辨率上限，实际分辨率按 max_pixels 计算
+    PDF_RENDER_MAX_DPI: int = 300
+
+    # 文本型 pdf 直接读取文本层转换：最少字符数、图片覆盖率上限、矢量图形数量上限
+    PDF_TEXT_FAST_PATH: bool = True
+    PDF_TEXT_MIN_CHARS: int = 50
+    PDF_TEXT_MAX_IMAGE_RATIO: float = 0.3
+    PDF_TEXT_MAX_DRAWINGS: int = 200
+    # 流式转换时先分类并开始解析的页数，其余页面在后台分类
+    PDF_STREAM_HEAD_PAGES: int = 8
+
+    # /v1/convert 结果缓存：memory / disk / none
+    RESULT_CACHE_BACKEND: str = "memory"
+    RESULT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    RESULT_CACHE_DIR: str = ".cache/results"
+
+    # LLM 逐页结果缓存，按页面图片哈希 + 提示词 + 模型命中
+    PAGE_CACHE_BACKEND: str = "memory"
+    PAGE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    PAGE_CACHE_DIR: str = ".cache/pages"
+
+    # 异步任务：工作线程数、排队上限、结果保留时间(秒)
+    JOB_MAX_WORKERS: int = 2
+    JOB_MAX_QUEUE: int = 16
+    JOB_RESULT_TTL: int = 3600
+
+    # LibreOffice 实例池：实例数、单次转换超时(秒)、实例回收条件
+    LIBREOFFICE_POOL_SIZE: int = 2
+    LIBREOFFICE_TIMEOUT: int = 120
+    LIBREOFFICE_MAX_CONVERSIONS: int = 200
+    LIBREOFFICE_MAX_MEMORY_MB: int = 1024
+    LIBREOFFICE_STARTUP_TIMEOUT: int = 30
+
+    # markdown 导出 docx / pdf：常驻 pandoc server(PANDOC_SERVER_URL 为空时在本机 PANDOC_SERVER_PORT 启动)，
+    # 不可用时退回 pandoc 命令行；单次转换超时(秒)
+    PANDOC_SERVER_ENABLED: bool = True
+    PANDOC_SERVER_URL: str = ""
+    PANDOC_SERVER_PORT: int = 3030
+    PANDOC_SERVER_TIMEOUT: int = 60
+    PANDOC_SERVER_STARTUP_TIMEOUT: int = 10
+    PANDOC_CJK_FONT: str = "Microsoft YaHei"
+    # typst 编译 pdf：复用的编译器数量，额外的字体目录用逗号分隔
+    TYPST_COMPILER_POOL_SIZE: int = 2
+    TYPST_FONT_PATHS: str = ""
+    # 导出时下载 markdown 中 http(s) 图片：单张图片的超时(秒)和大小上限，同时下载的图片数
+    PANDOC_IMAGE_TIMEOUT: int = 10
+    PANDOC_IMAGE_MAX_BYTES: int = 20 * 1024 * 1024
+    PANDOC_IMAGE_CONCURRENCY: int = 4
+    # 导出结果缓存，按 markdown 哈希 + 目标格式 + 渲染参数命中
+    RENDER_CACHE_BACKEND: str = "memory"
+    RENDER_CACHE_MAX_BYTES: int = 128 * 1024 * 1024
+    RENDER_CACHE_DIR: str = ".cache/renders"
+
+    # 多个 MinerU 节点用逗号分隔
     MINERU_API_URL: str
     MINERU_API_TIMEOUT: int = 600
+    # MinerU 客户端连接池
+    MINERU_MAX_CONNECTIONS: int = 32
+    MINERU_MAX_KEEPALIVE_CONNECTIONS: int = 16
+    MINERU_KEEPALIVE_EXPIRY: float = 60
+    MINERU_HTTP2: bool = False
+    # 超过阈值页数的 pdf 按页范围拆分后并行发送给 MinerU，阈值为 0 时不拆分
+    MINERU_SHARD_THRESHOLD_PAGES: int = 100
+    MINERU_SHARD_PAGES: int = 50
+    MINERU_SHARD_CONCURRENCY: int = 4
+    # MinerU 负载均衡：健康检查、熔断与延迟 EWMA
+    MINERU_HEALTH_CHECK_PATH: str = "/docs"
+    MINERU_HEALTH_CHECK_INTERVAL: float = 10
+    MINERU_FAILURE_THRESHOLD: int = 3
+    MINERU_CIRCUIT_OPEN_SECONDS: float = 30
+    MINERU_LATENCY_EWMA_ALPHA: float = 0.3
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,32 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+from utils.config import config
+
+# 异步接口中 CPU 密集的步骤(渲染、HTML 解析、markitdown 等)统一放到该线程池执行
+cpu_executor = ThreadPoolExecutor(
+    max_workers=config.CPU_EXECUTOR_WORKERS or os.cpu_count() or 4, thread_name_prefix="cpu"
+)
+
+
+async def run_cpu(func, *args, **kwargs):
+    # 复制当前上下文到线程中执行，使请求级的耗时统计在线程池中仍然生效
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        cpu_executor, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+def submit_in_context(executor: Executor, func, *args, **kwargs) -> Future:
+    # 同步流程中提交到线程池时同样复制当前上下文，工作线程中的阶段耗时计入当前请求
+    # 每个任务使用各自的上下文副本，同一个 Context 不能在多个线程中同时进入
+    context = contextvars.copy_context()
+    return executor.submit(context.run, func, *args, **kwargs)
+
+
+def shutdown_cpu_executor():
+    cpu_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,157 @@
+import queue
+import threading
+import zipfile
+from contextlib import contextmanager
+from pathlib import PurePosixPath
+from typing import Iterator, Optional
+
+import magic
+
+from utils.config import config
+from utils.metrics import timed
+from utils.uploads import BufferReader
+
+# 交给 libmagic 检测的文件开头长度，文本、html 等类型只需要开头一段内容
+magic_header_bytes = max(1024, config.MAGIC_HEADER_BYTES)
+# 旧版 office 的 OLE 复合文档需要读取目录扇区，按 libmagic 默认的最大读取长度截取
+ole_magic_bytes = 8 * 1024 * 1024
+ole_signature = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+# 文件开头的魔数，按顺序匹配
+file_signatures = (
+    (b"%PDF-", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+zip_signatures = (b"PK\x03\x04", b"PK\x05\x06")
+
+# zip 容器中标识文档类型的目录
+ooxml_prefixes = (
+    ("word/", "docx"),
+    ("ppt/", "pptx"),
+    ("xl/", "xlsx"),
+)
+
+mime_file_types = {
+    "application/pdf": "pdf",
+    "image/png": "png",
+    "image/jpeg": "jpeg",
+    "image/webp": "webp",
+    "image/tiff": "tiff",
+    "application/msword": "doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": "pptx",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "application/epub+zip": "epub",
+    "text/html": "html",
+    "text/csv": "csv",
+    "application/csv": "csv",
+}
+file_type_mimes = {file_type: mime for mime, file_type in mime_file_types.items()}
+file_type_mimes["csv"] = "text/csv"
+
+# libmagic 对内容不够典型的纯文本只能识别为 text/plain，按扩展名区分
+text_extensions = {
+    ".csv": "csv",
+    ".html": "html",
+    ".htm": "html",
+}
+
+
+class MagicPool:
+    # 复用 libmagic 检测器，避免每次检测都重新加载 magic 数据库
+    # 单个检测器同一时间只能被一个线程使用，池中最多创建 size 个，用完归还
+    def __init__(self, size: int):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, size))
+
+    @contextmanager
+    def acquire(self) -> Iterator[magic.Magic]:
+        with self._slots:
+            try:
+                detector = self._idle.get_nowait()
+            except queue.Empty:
+                detector = magic.Magic(mime=True)
+            try:
+                yield detector
+            finally:
+                self._idle.put(detector)
+
+    def from_buffer(self, buffer: bytes) -> str:
+        with self.acquire() as detector:
+            return detector.from_buffer(buffer)
+
+
+magic_pool = MagicPool(config.MAGIC_POOL_SIZE)
+
+
+def get_header(file_bytes, size: int) -> bytes:
+    # libmagic 只接受 bytes，memoryview(mmap 映射的上传文件)只复制开头这一段
+    return bytes(file_bytes[:size])
+
+
+def detect_zip_type(file_bytes) -> Optional[str]:
+    # 只读取 zip 末尾的中央目录，按其中的文件名区分 docx / pptx / xlsx / epub，不解压内容
+    try:
+        with zipfile.ZipFile(BufferReader(file_bytes)) as archive:
+            names = archive.namelist()
+            if "mimetype" in names and archive.read("mimetype").strip() == b"application/epub+zip":
+                return "epub"
+    except (zipfile.BadZipFile, KeyError, RuntimeError, NotImplementedError):
+        return None
+
+    if "[Content_Types].xml" not in names:
+        return None
+    for prefix, file_type in ooxml_prefixes:
+        if any(name.startswith(prefix) for name in names):
+            return file_type
+    return None
+
+
+def match_signature(file_bytes) -> Optional[str]:
+    # 按魔数识别常见格式，返回 None 表示需要交给 libmagic
+    header = get_header(file_bytes, 16)
+    for signature, file_type in file_signatures:
+        if header.startswith(signature):
+            return file_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header.startswith(zip_signatures):
+        return detect_zip_type(file_bytes) or "zip"
+    return None
+
+
+def detect_mime_type(file_bytes) -> str:
+    # 交给 libmagic 检测，OLE 复合文档需要更长的内容才能识别具体类型
+    header_size = ole_magic_bytes if get_header(file_bytes, 8) == ole_signature else magic_header_bytes
+    return magic_pool.from_buffer(get_header(file_bytes, header_size))
+
+
+@timed("detect_file_type")
+def detect_file_type(file_bytes, file_name: str) -> Optional[str]:
+    # 按扩展名识别 markdown，按魔数识别 pdf、图片和 zip 容器，其余类型由 libmagic 检测文件开头
+    extension = PurePosixPath(file_name or "").suffix.lower()
+    if extension in (".md", ".markdown"):
+        return "markdown"
+
+    file_type = match_signature(file_bytes)
+    if file_type == "zip":
+        return None
+    if file_type is not None:
+        return file_type
+
+    mime_type = detect_mime_type(file_bytes)
+    if mime_type == "text/plain":
+        return text_extensions.get(extension)
+    return mime_file_types.get(mime_type)
+
+
+def get_mime_type(file_bytes) -> str:
+    file_type = match_signature(file_bytes)
+    if file_type == "zip":
+        return "application/zip"
+    if file_type is not None:
+        return file_type_mimes[file_type]
+    return detect_mime_type(file_bytes)
@@ -0,0 +1,22 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+import fitz
+
+# PyMuPDF 以单线程模式初始化 MuPDF，所有文档共用一个全局上下文，不支持多个线程同时调用，
+# 不同文档之间也不例外；CPU 线程池、任务线程和批量转换中的 fitz 调用都通过该锁串行
+# 长文档按页或按分片加锁，其它请求的渲染可以穿插进行
+fitz_lock = threading.RLock()
+
+
+@contextmanager
+def open_pdf(file_bytes: bytes = None, filetype: str = "pdf") -> Iterator[fitz.Document]:
+    # 在锁内打开和关闭文档，调用方对页面的操作另行加锁；file_bytes 为空时创建新文档
+    with fitz_lock:
+        doc = fitz.open(stream=file_bytes, filetype=filetype) if file_bytes is not None else fitz.open()
+    try:
+        yield doc
+    finally:
+        with fitz_lock:
+            doc.close()
@@ -0,0 +1,70 @@
+import threading
+from typing import Optional
+
+import httpx
+from loguru import logger
+
+from utils.config import config
+
+_mineru_client: Optional[httpx.Client] = None
+_mineru_async_client: Optional[httpx.AsyncClient] = None
+_mineru_client_lock = threading.Lock()
+
+
+def get_client_options() -> dict:
+    # 带连接池和 keep-alive 的 MinerU 客户端参数，HTTP/2 需要额外安装 h2
+    http2 = config.MINERU_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("未安装 h2 (httpx[http2])，MinerU 客户端回退到 HTTP/1.1")
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=config.MINERU_MAX_CONNECTIONS,
+        max_keepalive_connections=config.MINERU_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.MINERU_KEEPALIVE_EXPIRY,
+    )
+    return {"limits": limits, "timeout": config.MINERU_API_TIMEOUT, "http2": http2}
+
+
+def create_mineru_client() -> httpx.Client:
+    return httpx.Client(**get_client_options())
+
+
+def create_mineru_async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(**get_client_options())
+
+
+def get_mineru_client() -> httpx.Client:
+    # 获取共享的 MinerU 客户端，未初始化时(如 gradio 入口)按需创建
+    global _mineru_client
+    if _mineru_client is None:
+        with _mineru_client_lock:
+            if _mineru_client is None:
+                _mineru_client = create_mineru_client()
+    return _mineru_client
+
+
+def close_mineru_client():
+    global _mineru_client
+    with _mineru_client_lock:
+        if _mineru_client is not None:
+            _mineru_client.close()
+            _mineru_client = None
+
+
+def get_mineru_async_client() -> httpx.AsyncClient:
+    # 获取异步接口共享的 MinerU 客户端，只在事件循环线程中使用
+    global _mineru_async_client
+    if _mineru_async_client is None:
+        _mineru_async_client = create_mineru_async_client()
+    return _mineru_async_client
+
+
+async def close_mineru_async_client():
+    global _mineru_async_client
+    if _mineru_async_client is not None:
+        await _mineru_async_client.aclose()
+        _mineru_async_client = None
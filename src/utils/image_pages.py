@@ -0,0 +1,225 @@
+import math
+import re
+from io import BytesIO
+from typing import Iterator, List, NamedTuple, Tuple
+
+from PIL import Image
+
+from utils.config import config
+from utils.metrics import count_bytes, stage, timed
+from utils.uploads import BufferReader
+
+max_pixels = config.max_pixels
+# 视觉模型对整张图片的缩放比例低于该值时切分为多片，避免文字缩小到无法识别
+image_tile_min_scale = config.IMAGE_TILE_MIN_SCALE
+# 相邻切片重叠部分占切片高度的比例，保证被切开的文字行完整出现在其中一片
+image_tile_overlap = min(max(config.IMAGE_TILE_OVERLAP, 0.0), 0.5)
+# 切片的最大宽度，更宽的图片先等比缩小，默认按 max_pixels 计算
+image_tile_max_width = config.IMAGE_TILE_MAX_WIDTH or int(math.sqrt(max_pixels) * 2)
+tile_jpeg_quality = 90
+
+# 按页拆分的多帧图片格式，其它格式的动图只取第一帧
+multi_page_image_types = {"tiff"}
+# 视觉模型接口不一定支持的图片格式，发送前先转为 png
+vlm_unsupported_image_types = {"tiff"}
+
+# 去重时比较的最多行数，被截断的行至少保留的字符数
+overlap_max_lines = 20
+overlap_min_fragment = 8
+whitespace_pattern = re.compile(r"\s+")
+
+Box = Tuple[int, int, int, int]
+
+
+class ImageTile(NamedTuple):
+    frame: int
+    index: int
+    count: int
+    image_bytes: bytes
+    # 带扩展名的切片文件名，发送给视觉模型时据此确定图片的 MIME 类型
+    image_name: str
+
+
+@timed("image_transcode")
+def transcode_image_to_png(file_bytes: bytes) -> bytes:
+    # 使用 PIL 将图片转为 png，CMYK 等 png 不支持的模式先转为 RGB
+    with Image.open(BufferReader(file_bytes)) as image:
+        return encode_png(image)
+
+
+def encode_png(image: Image.Image) -> bytes:
+    if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def get_tile_format(image: Image.Image) -> str:
+    # 黑白、灰度和调色板图片(传真、扫描件)用 png 无损且体积小，彩色图片用 jpeg
+    return "png" if image.mode in ("1", "L", "P") else "jpeg"
+
+
+def encode_tile(image: Image.Image, tile_format: str) -> bytes:
+    if tile_format == "png":
+        return encode_png(image)
+    buffer = BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=tile_jpeg_quality)
+    return buffer.getvalue()
+
+
+def needs_tiling(width: int, height: int) -> bool:
+    return width * height * image_tile_min_scale ** 2 > max_pixels
+
+
+def get_tile_spans(length: int, span: int) -> List[Tuple[int, int]]:
+    # 将 [0, length) 切成长度为 span 的若干段，相邻两段重叠 image_tile_overlap
+    overlap = int(span * image_tile_overlap)
+    spans = []
+    start = 0
+    while True:
+        end = min(start + span, length)
+        spans.append((start, end))
+        if end >= length:
+            return spans
+        start = end - overlap
+
+
+def get_tile_scale(width: int) -> float:
+    return min(1.0, image_tile_max_width / width)
+
+
+def get_tile_boxes(width: int, height: int) -> List[Box]:
+    # 按阅读顺序自上而下切成等宽的横条，每条缩放到 image_tile_max_width 以内后约为 max_pixels
+    # 整宽缩放后比例仍低于 image_tile_min_scale 的超宽图片先切成重叠的竖条，各竖条再自上而下切成横条
+    column_width = width
+    columns = 1
+    while get_tile_scale(column_width) < image_tile_min_scale:
+        columns += 1
+        column_width = math.ceil(width / (columns - (columns - 1) * image_tile_overlap))
+
+    boxes = []
+    for left, right in get_tile_spans(width, column_width):
+        scale = get_tile_scale(right - left)
+        strip_height = max(1, int(max_pixels / ((right - left) * scale * scale)))
+        for top, bottom in get_tile_spans(height, strip_height):
+            boxes.append((left, top, right, bottom))
+    return boxes
+
+
+class ImageTiler:
+    # 将图片拆分为视觉模型逐次解析的切片：多帧 tiff 按帧拆页，过大的帧切成重叠的横条(超宽时先切竖条)
+    # 打开时只读取各帧的尺寸；迭代时逐帧解码、逐片编码，同一时间只保留一帧在内存中
+    def __init__(self, file_bytes: bytes, file_type: str):
+        self.file_bytes = file_bytes
+        self.file_type = file_type
+        self.image = Image.open(BufferReader(file_bytes))
+        frame_count = getattr(self.image, "n_frames", 1) if file_type in multi_page_image_types else 1
+        self.plan: List[List[Box]] = []
+        for frame in range(frame_count):
+            self.image.seek(frame)
+            width, height = self.image.size
+            if needs_tiling(width, height):
+                self.plan.append(get_tile_boxes(width, height))
+            else:
+                self.plan.append([(0, 0, width, height)])
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.plan)
+
+    @property
+    def tile_count(self) -> int:
+        return sum(len(boxes) for boxes in self.plan)
+
+    def __enter__(self) -> "ImageTiler":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.image.close()
+
+    def __iter__(self) -> Iterator[ImageTile]:
+        # 单帧且无需切分的图片直接使用原文件，不重新编码
+        if self.tile_count == 1:
+            image_bytes, image_format = self.file_bytes, self.file_type
+            if self.file_type in vlm_unsupported_image_types:
+                image_bytes, image_format = transcode_image_to_png(image_bytes), "png"
+            yield ImageTile(0, 0, 1, image_bytes, f"image.{image_format}")
+            return
+
+        for frame, boxes in enumerate(self.plan):
+            self.image.seek(frame)
+            tile_format = get_tile_format(self.image)
+            for index, box in enumerate(boxes):
+                with stage("image_tiling"):
+                    tile = self.image.crop(box)
+                    scale = get_tile_scale(tile.width)
+                    if scale < 1.0:
+                        size = (max(1, round(tile.width * scale)), max(1, round(tile.height * scale)))
+                        tile = tile.resize(size, Image.Resampling.LANCZOS)
+                    image_bytes = encode_tile(tile, tile_format)
+                count_bytes("image_tile", len(image_bytes))
+                yield ImageTile(frame, index, len(boxes), image_bytes, f"frame{frame}-tile{index}.{tile_format}")
+
+
+def normalize_line(line: str) -> str:
+    return whitespace_pattern.sub(" ", line).strip()
+
+
+def is_same_line(a: str, b: str) -> bool:
+    # 切片边界处的行可能只识别出一部分，较短的行是另一行的开头或结尾时也视为同一行
+    if a == b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    return len(shorter) >= overlap_min_fragment and (longer.startswith(shorter) or longer.endswith(shorter))
+
+
+def find_overlap(previous: List[str], current: List[str]) -> int:
+    # 返回 current 开头与 previous 结尾重复的行数，从最长的候选开始比较
+    # 只重复一行时要求该行足够长，避免误删表格分隔线等恰好相同的短行
+    limit = min(len(previous), len(current), overlap_max_lines)
+    for size in range(limit, 0, -1):
+        if size == 1 and min(len(previous[-1]), len(current[0])) < overlap_min_fragment:
+            return 0
+        if all(is_same_line(a, b) for a, b in zip(previous[-size:], current[:size])):
+            return size
+    return 0
+
+
+def merge_tile_markdown(texts: List[str]) -> str:
+    # 按顺序拼接同一帧各切片的识别结果，相邻切片重叠区域被两次识别的行只保留一份
+    # 只比较非空行，保留空行以维持段落和表格结构；重复的行保留较长的版本，
+    # 被切片边界截断的行通常在另一片中识别得更完整
+    merged: List[str] = []
+    for text in texts:
+        lines = text.strip("\n").splitlines()
+        if not lines:
+            continue
+        previous = [i for i, line in enumerate(merged) if line.strip()][-overlap_max_lines:]
+        current = [i for i, line in enumerate(lines) if line.strip()][:overlap_max_lines]
+        overlap = find_overlap(
+            [normalize_line(merged[i]) for i in previous],
+            [normalize_line(lines[i]) for i in current],
+        )
+        if overlap == 0:
+            if merged:
+                merged.append("")
+            merged.extend(lines)
+            continue
+        for merged_index, line_index in zip(previous[-overlap:], current[:overlap]):
+            if len(lines[line_index].strip()) > len(merged[merged_index].strip()):
+                merged[merged_index] = lines[line_index]
+        merged.extend(lines[current[overlap - 1] + 1:])
+    return "\n".join(merged)
+
+
+def merge_image_results(tiles: List[Tuple[int, int]], texts: List[str]) -> str:
+    # tiles 为各切片的 (帧序号, 切片序号)，同一帧的切片去重拼接，各帧之间按页拼接
+    frames = {}
+    for (frame, _), text in zip(tiles, texts):
+        frames.setdefault(frame, []).append(text)
+    pages = [merge_tile_markdown(frames[frame]) for frame in sorted(frames)]
+    return "\n\n".join(page for page in pages if page)
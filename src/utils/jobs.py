@@ -0,0 +1,153 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from loguru import logger
+
+from utils.config import config
+from utils.utils import convert_to_markdown_main
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    # 单个转换任务的状态：pending / running / succeeded / failed
+    def __init__(self, file_name: str):
+        self.job_id = uuid.uuid4().hex
+        self.file_name = file_name
+        self.status = "pending"
+        self.pages_done = 0
+        self.pages_total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def update_progress(self, pages_done: int, pages_total: int):
+        self.pages_done = pages_done
+        self.pages_total = pages_total
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    # 有界工作线程池执行转换任务，排队 + 运行中的任务数超过上限时拒绝新任务
+    def __init__(self, max_workers: int, max_queue: int, result_ttl: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        file_bytes: bytes,
+        file_name: str,
+        use_llm: bool = False,
+        return_images: bool = False,
+        image_format: str = "jpeg",
+        image_mode: str = "base64",
+    ) -> Job:
+        with self._lock:
+            self._purge_expired()
+            if self._active >= self.max_workers + self.max_queue:
+                raise QueueFullError("任务队列已满，请稍后重试")
+            job = Job(file_name)
+            self._jobs[job.job_id] = job
+            self._active += 1
+
+        self._executor.submit(
+            self._run, job, file_bytes, file_name, use_llm, return_images, image_format, image_mode
+        )
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == "running")
+            return {
+                "active": self._active,
+                "running": running,
+                "queued": self._active - running,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "total": len(self._jobs),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(
+        self,
+        job: Job,
+        file_bytes: bytes,
+        file_name: str,
+        use_llm: bool,
+        return_images: bool,
+        image_format: str,
+        image_mode: str,
+    ):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = convert_to_markdown_main(
+                file_bytes,
+                file_name,
+                use_llm,
+                return_images,
+                job.update_progress,
+                image_format=image_format,
+                image_mode=image_mode,
+            )
+            job.status = "succeeded"
+        except Exception as e:
+            logger.exception(f"任务 {job.job_id} 执行失败: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active -= 1
+
+    def _purge_expired(self):
+        # 清理超过保留时间的已完成任务
+        now = time.time()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_manager = JobManager(
+    max_workers=max(1, config.JOB_MAX_WORKERS),
+    max_queue=max(0, config.JOB_MAX_QUEUE),
+    result_ttl=config.JOB_RESULT_TTL,
+)
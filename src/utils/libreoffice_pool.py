@@ -0,0 +1,246 @@
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from pathlib import Path
+from typing import List, Optional
+
+from loguru import logger
+
+from utils.config import config
+
+try:
+    # UNO 仅在 LibreOffice 自带或系统安装的 python3-uno 中可用
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+filter_names = {
+    "docx": "MS Word 2007 XML",
+}
+
+
+def _make_property(name: str, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _process_tree_rss(pid: int) -> int:
+    # 读取 /proc 统计进程及其子进程的常驻内存(字节)，soffice 启动脚本会再派生 soffice.bin
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            for line in Path(f"/proc/{current}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+            for task in Path(f"/proc/{current}/task").iterdir():
+                children = (task / "children").read_text().split()
+                pending.extend(int(child) for child in children)
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total
+
+
+class LibreOfficeWorker:
+    # 常驻的 LibreOffice 实例，使用独立的用户配置目录，通过 UNO 命名管道调用转换
+    # 管道名和配置目录都带上进程号，多个 uvicorn / gunicorn 工作进程各自的实例池互不冲突
+    def __init__(self, index: int):
+        self.index = index
+        self.pipe_name = f"lo_{os.getpid()}_{index}"
+        # 配置目录由 LibreOffice 首次启动时自动创建
+        self.profile_dir = Path(tempfile.gettempdir()) / f"lo_profile_{os.getpid()}_{index}"
+        self.process: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.conversions = 0
+
+    @property
+    def profile_arg(self) -> str:
+        return f"-env:UserInstallation={self.profile_dir.as_uri()}"
+
+    @property
+    def connection(self) -> str:
+        # soffice --accept 和 UnoUrlResolver 使用的连接描述
+        return f"pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+
+    def start(self):
+        cmd = [
+            "soffice",
+            "--headless",
+            "--invisible",
+            "--nologo",
+            "--norestore",
+            "--nodefault",
+            self.profile_arg,
+            f"--accept={self.connection}",
+        ]
+        # 独立的进程组，停止时连同 soffice 启动脚本派生的 soffice.bin 一起结束
+        self.process = subprocess.Popen(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        self.desktop = self._connect(config.LIBREOFFICE_STARTUP_TIMEOUT)
+        self.conversions = 0
+        logger.info(f"LibreOffice 实例 {self.index} 已启动，管道 {self.pipe_name}")
+
+    def _connect(self, timeout: float):
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context
+        )
+        url = f"uno:{self.connection}"
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                context = resolver.resolve(url)
+                return context.ServiceManager.createInstanceWithContext(
+                    "com.sun.star.frame.Desktop", context
+                )
+            except Exception:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise RuntimeError(f"LibreOffice 实例 {self.index} 启动失败")
+                time.sleep(0.5)
+
+    def convert(self, input_file: Path, output_file: Path, convert_to: str):
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+
+        document = self.desktop.loadComponentFromURL(
+            input_file.as_uri(), "_blank", 0, (_make_property("Hidden", True),)
+        )
+        try:
+            document.storeToURL(
+                output_file.as_uri(), (_make_property("FilterName", filter_names[convert_to]),)
+            )
+        finally:
+            document.close(True)
+        self.conversions += 1
+
+    def convert_once(self, input_file: Path, output_dir: Path, convert_to: str, timeout: float):
+        # 没有 UNO 时每次启动一个进程转换，仍使用该实例独立的用户配置目录避免并发冲突
+        cmd = [
+            "soffice",
+            "--headless",
+            "--norestore",
+            self.profile_arg,
+            "--convert-to",
+            convert_to,
+            "--outdir",
+            str(output_dir),
+            str(input_file),
+        ]
+        subprocess.run(
+            cmd, check=True, timeout=timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.conversions += 1
+
+    def need_recycle(self) -> bool:
+        if self.conversions >= config.LIBREOFFICE_MAX_CONVERSIONS:
+            return True
+        if self.process is None or self.process.poll() is not None:
+            return False
+        return _process_tree_rss(self.process.pid) > config.LIBREOFFICE_MAX_MEMORY_MB * 1024 * 1024
+
+    def stop(self):
+        # 先结束进程再丢弃 UNO 连接：超时时另一个线程可能仍阻塞在该连接上的调用中，
+        # 此时通过连接调用 terminate 也会阻塞；进程退出后连接断开，阻塞的调用随之返回
+        if self.process is not None:
+            self._signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._signal(signal.SIGKILL)
+                self.process.wait()
+            self.process = None
+        self.desktop = None
+
+    def _signal(self, sig: int):
+        try:
+            os.killpg(self.process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def restart(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+        self.conversions = 0
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class LibreOfficePool:
+    # LibreOffice 实例池，转换超时或转换次数/内存超过上限时回收实例
+    def __init__(self, size: int, timeout: float):
+        self.size = size
+        self.timeout = timeout
+        self.workers: List[LibreOfficeWorker] = [LibreOfficeWorker(index) for index in range(size)]
+        self._idle: "queue.Queue[LibreOfficeWorker]" = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="libreoffice")
+        if uno is None:
+            logger.warning("未找到 UNO 模块，LibreOffice 转换将为每个文件启动独立进程")
+
+    def convert(self, file_bytes: bytes, source_type: str, convert_to: str) -> bytes:
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("等待空闲的 LibreOffice 实例超时")
+
+        try:
+            return self._convert_with(worker, file_bytes, source_type, convert_to)
+        finally:
+            self._idle.put(worker)
+
+    def _convert_with(
+        self, worker: LibreOfficeWorker, file_bytes: bytes, source_type: str, convert_to: str
+    ) -> bytes:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_file = Path(temp_dir) / f"input.{source_type}"
+            input_file.write_bytes(file_bytes)
+            output_file = Path(temp_dir) / f"input.{convert_to}"
+
+            if uno is None:
+                worker.convert_once(input_file, Path(temp_dir), convert_to, self.timeout)
+            else:
+                future = self._executor.submit(worker.convert, input_file, output_file, convert_to)
+                try:
+                    future.result(timeout=self.timeout)
+                except TimeoutError:
+                    # 终止进程使阻塞中的 UNO 调用返回，下次使用时重新启动
+                    logger.error(f"LibreOffice 实例 {worker.index} 转换超时，重启实例")
+                    worker.restart()
+                    raise
+                except Exception:
+                    worker.restart()
+                    raise
+
+                if worker.need_recycle():
+                    logger.info(f"LibreOffice 实例 {worker.index} 达到回收条件，重启实例")
+                    worker.restart()
+
+            if not output_file.exists():
+                raise RuntimeError(f"LibreOffice 未生成 {convert_to} 文件")
+            return output_file.read_bytes()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for worker in self.workers:
+            worker.close()
+
+
+libreoffice_pool = LibreOfficePool(
+    size=max(1, config.LIBREOFFICE_POOL_SIZE),
+    timeout=config.LIBREOFFICE_TIMEOUT,
+)
@@ -0,0 +1,192 @@
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+# 各阶段耗时的直方图分桶(秒)
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 当前请求的分阶段耗时，不为空时 stage 会把耗时累加进去
+request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+
+def format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    # Prometheus 文本格式的指标基类，按标签值分别记录
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = default_buckets,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+        # {标签值: [各分桶计数..., 总数, 总和]}
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, *labels: str, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    bucket_labels = format_labels(self.label_names, labels, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                inf_labels = format_labels(self.label_names, labels, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {series[-2]}")
+                lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {series[-2]}")
+                lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {series[-1]}")
+        return "\n".join(lines)
+
+
+stage_seconds = Histogram(
+    "doc_parser_stage_seconds", "Time spent in each conversion stage", ("stage",)
+)
+stage_in_flight = Gauge(
+    "doc_parser_stage_in_flight", "Conversion stages currently running", ("stage",)
+)
+stage_errors = Counter(
+    "doc_parser_stage_errors_total", "Conversion stages that raised an exception", ("stage",)
+)
+bytes_total = Counter(
+    "doc_parser_bytes_total", "Bytes processed by kind", ("kind",)
+)
+http_request_seconds = Histogram(
+    "doc_parser_http_request_seconds", "HTTP request latency", ("path", "status")
+)
+http_requests_in_flight = Gauge(
+    "doc_parser_http_requests_in_flight", "HTTP requests currently being handled"
+)
+registry = [
+    stage_seconds,
+    stage_in_flight,
+    stage_errors,
+    bytes_total,
+    http_request_seconds,
+    http_requests_in_flight,
+]
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+timings_lock = threading.Lock()
+
+
+def record_timing(name: str, elapsed: float):
+    timings = request_timings.get()
+    if timings is None:
+        return
+    with timings_lock:
+        entry = timings.setdefault(name, {"count": 0, "seconds": 0})
+        entry["count"] += 1
+        entry["seconds"] += elapsed
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    # 记录一个转换阶段的耗时、并发数和异常次数，同时累加到当前请求的耗时明细
+    stage_in_flight.inc(name)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_in_flight.dec(name)
+        stage_seconds.observe(name, value=elapsed)
+        record_timing(name, elapsed)
+
+
+def timed(name: str):
+    # 函数装饰器形式的 stage，同时支持同步函数和协程函数
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count_bytes(kind: str, size: int):
+    bytes_total.inc(kind, amount=size)
+
+
+@contextmanager
+def collect_timings() -> Iterator[dict]:
+    # 在当前上下文中收集分阶段耗时，返回 {阶段: {count, seconds}}
+    timings = {}
+    token = request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        request_timings.reset(token)
@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import httpx
+from loguru import logger
+
+from utils.config import config
+from utils.http_client import get_mineru_client
+
+
+class MineruBackend:
+    # 单个 MinerU 节点的负载与健康状态
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.healthy = True
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and time.monotonic() >= self.open_until
+
+    def score(self) -> float:
+        # 预估排队时间：(在途请求数 + 1) * 平均延迟，尚无延迟数据时按 1 秒估计
+        latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+        return (self.in_flight + 1) * latency
+
+    def to_dict(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "available": self.available,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "latency_ewma": self.latency_ewma,
+            "consecutive_failures": self.consecutive_failures,
+            "circuit_open": time.monotonic() < self.open_until,
+        }
+
+
+class MineruBalancer:
+    # 按在途请求数和延迟 EWMA 选择最空闲的节点，连续失败的节点熔断一段时间
+    def __init__(
+        self,
+        base_urls: List[str],
+        health_check_path: str = "/docs",
+        health_check_interval: float = 10,
+        failure_threshold: int = 3,
+        circuit_open_seconds: float = 30,
+        ewma_alpha: float = 0.3,
+    ):
+        if not base_urls:
+            raise ValueError("至少需要配置一个 MinerU 地址")
+        self.backends = [MineruBackend(url) for url in base_urls]
+        self.health_check_path = health_check_path
+        self.health_check_interval = health_check_interval
+        self.failure_threshold = failure_threshold
+        self.circuit_open_seconds = circuit_open_seconds
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def acquire(self, exclude: List[MineruBackend] = None) -> MineruBackend:
+        with self._lock:
+            candidates = [b for b in self.backends if not exclude or b not in exclude]
+            available = [b for b in candidates if b.available]
+            # 所有节点都不可用时仍然尝试，避免健康检查误判导致整体不可用
+            backend = min(available or candidates or self.backends, key=MineruBackend.score)
+            backend.in_flight += 1
+            return backend
+
+    def release(self, backend: MineruBackend, elapsed: float, success: Optional[bool]):
+        # success 为 None 表示请求未完成(如任务被取消)，只归还在途计数，不影响延迟和熔断统计
+        with self._lock:
+            backend.in_flight -= 1
+            if success is None:
+                return
+            if success:
+                backend.consecutive_failures = 0
+                if backend.latency_ewma is None:
+                    backend.latency_ewma = elapsed
+                else:
+                    backend.latency_ewma = (
+                        self.ewma_alpha * elapsed + (1 - self.ewma_alpha) * backend.latency_ewma
+                    )
+                return
+
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.failure_threshold:
+                backend.open_until = time.monotonic() + self.circuit_open_seconds
+                logger.warning(
+                    f"MinerU 节点 {backend.base_url} 连续失败 {backend.consecutive_failures} 次，"
+                    f"熔断 {self.circuit_open_seconds} 秒"
+                )
+
+    @contextmanager
+    def backend(self, exclude: List[MineruBackend] = None) -> Iterator[MineruBackend]:
+        # 在 finally 中归还节点：asyncio.CancelledError 不是 Exception 的子类，
+        # 客户端断开或任务被取消时同样需要减少在途计数
+        backend = self.acquire(exclude)
+        start = time.monotonic()
+        success = None
+        try:
+            yield backend
+            success = True
+        except Exception as e:
+            # 4xx 属于请求本身的问题，不计入节点失败
+            success = isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500
+            raise
+        finally:
+            self.release(backend, time.monotonic() - start, success)
+
+    def check_health(self):
+        client = get_mineru_client()
+        for backend in self.backends:
+            url = httpx.URL(backend.base_url).join(self.health_check_path)
+            try:
+                healthy = client.get(url, timeout=5).status_code < 500
+            except httpx.HTTPError:
+                healthy = False
+
+            if healthy != backend.healthy:
+                logger.info(f"MinerU 节点 {backend.base_url} 健康状态变为: {healthy}")
+            backend.healthy = healthy
+
+    def start_health_check(self):
+        if self._health_thread is not None:
+            return
+        self._stop_event.clear()
+        self._health_thread = threading.Thread(
+            target=self._health_check_loop, name="mineru-health", daemon=True
+        )
+        self._health_thread.start()
+
+    def stop_health_check(self):
+        self._stop_event.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=5)
+            self._health_thread = None
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [backend.to_dict() for backend in self.backends]
+
+    def _health_check_loop(self):
+        while not self._stop_event.wait(self.health_check_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"MinerU 健康检查失败: {e}")
+
+
+mineru_balancer = MineruBalancer(
+    [url.strip() for url in config.MINERU_API_URL.split(",") if url.strip()],
+    health_check_path=config.MINERU_HEALTH_CHECK_PATH,
+    health_check_interval=config.MINERU_HEALTH_CHECK_INTERVAL,
+    failure_threshold=config.MINERU_FAILURE_THRESHOLD,
+    circuit_open_seconds=config.MINERU_CIRCUIT_OPEN_SECONDS,
+    ewma_alpha=config.MINERU_LATENCY_EWMA_ALPHA,
+)
@@ -0,0 +1,129 @@
+import base64
+import subprocess
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+from loguru import logger
+
+from utils.config import config
+
+# 本机 pandoc server 启动失败后，间隔一段时间再尝试重新启动(秒)
+restart_interval = 30
+
+
+class PandocServerError(RuntimeError):
+    pass
+
+
+class PandocServer:
+    # 常驻的 pandoc server，模板和 Lua 环境只在进程启动时加载一次，各请求在同一进程内并发转换
+    # url 为空时在本机端口启动 pandoc server 子进程，进程退出后下次调用时重新启动
+    def __init__(self, url: str, port: int, timeout: float, startup_timeout: float):
+        self.managed = not url
+        self.url = (url or f"http://127.0.0.1:{port}").rstrip("/")
+        self.port = port
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.process: Optional[subprocess.Popen] = None
+        self._client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+        self._failed_at = 0.0
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            # 给 pandoc server 自身的超时留出余量，由服务端先返回超时错误
+            self._client = httpx.Client(base_url=self.url, timeout=self.timeout + 5)
+        return self._client
+
+    def start(self):
+        cmd = [
+            "pandoc",
+            "server",
+            "--port", str(self.port),
+            "--timeout", str(self.timeout),
+        ]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                version = self.client.get("/version", timeout=1).text.strip()
+                logger.info(f"pandoc server {version} 已启动，端口 {self.port}")
+                return
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise PandocServerError("pandoc server 启动失败")
+                time.sleep(0.1)
+
+    def is_available(self) -> bool:
+        # 外部服务总是视为可用，请求失败时由调用方退回命令行；本机进程未运行时尝试启动
+        if not self.managed:
+            return True
+        with self._lock:
+            if self.process is not None and self.process.poll() is None:
+                return True
+            if time.monotonic() - self._failed_at < restart_interval:
+                return False
+            try:
+                self.start()
+                return True
+            except (OSError, PandocServerError) as e:
+                self._failed_at = time.monotonic()
+                logger.warning(f"无法启动 pandoc server，使用 pandoc 命令行转换: {e}")
+                return False
+
+    def convert(
+        self,
+        text: str,
+        convert_to: str,
+        variables: Dict[str, str],
+        from_format: str = "markdown",
+        files: Optional[Dict[str, bytes]] = None,
+    ) -> bytes:
+        # 返回原始输出，docx 为二进制文件，typst 等文本格式为 utf-8 编码的文本
+        # pandoc server 不读取本地文件也不下载远程资源，文中引用的图片通过 files 随请求发送
+        payload = {
+            "text": text,
+            "from": from_format,
+            "to": convert_to,
+            "standalone": True,
+            "variables": variables,
+        }
+        if files:
+            payload["files"] = {name: base64.b64encode(data).decode("ascii") for name, data in files.items()}
+        try:
+            res = self.client.post("/", json=payload, headers={"Accept": "application/octet-stream"})
+        except httpx.TransportError as e:
+            raise PandocServerError(f"无法连接 pandoc server: {e}") from e
+        if res.status_code != 200:
+            # 转换错误(如超时、格式不支持)返回 500，正文为错误信息
+            raise ValueError(f"pandoc 转换失败: {res.text.strip()}")
+        return res.content
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+    def shutdown(self):
+        with self._lock:
+            self.stop()
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+pandoc_server = PandocServer(
+    url=config.PANDOC_SERVER_URL,
+    port=config.PANDOC_SERVER_PORT,
+    timeout=config.PANDOC_SERVER_TIMEOUT,
+    startup_timeout=config.PANDOC_SERVER_STARTUP_TIMEOUT,
+)
@@ -0,0 +1,320 @@
+import hashlib
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from utils.asset_store import asset_store
+from utils.cache import create_cache, make_cache_key
+from utils.config import config
+from utils.image_pages import ImageTile, ImageTiler, merge_image_results
+from utils.metrics import count_bytes
+from utils.mineru_balancer import MineruBackend, mineru_balancer
+from utils.uploads import BufferReader
+
+# 转换流程中与 I/O 无关的部分：引擎路由、重试策略、逐页结果的组装与合并、结果缓存
+# utils.utils(线程)和 utils.async_convert(协程)共用，两边只各自实现请求 MinerU / LLM 和并发调度
+
+mineru_timeout = config.MINERU_API_TIMEOUT
+mineru_shard_threshold_pages = config.MINERU_SHARD_THRESHOLD_PAGES
+mineru_shard_pages = max(1, config.MINERU_SHARD_PAGES)
+mineru_shard_concurrency = max(1, config.MINERU_SHARD_CONCURRENCY)
+
+llm_max_concurrency = max(1, config.LLM_MAX_CONCURRENCY)
+llm_max_retries = max(0, config.LLM_MAX_RETRIES)
+llm_retry_backoff = config.LLM_RETRY_BACKOFF
+
+stream_head_pages = max(1, config.PDF_STREAM_HEAD_PAGES)
+
+# 按页面类型选择解析引擎：文本页本地提取，扫描页和图表较多的页面交给 LLM 或 MinerU
+page_engine_map = {
+    False: {"text": "local", "scanned": "mineru", "complex": "mineru"},
+    True: {"text": "local", "scanned": "vlm", "complex": "vlm"},
+}
+
+result_cache = create_cache(
+    config.RESULT_CACHE_BACKEND,
+    config.RESULT_CACHE_MAX_BYTES,
+    config.RESULT_CACHE_DIR,
+)
+
+pdf_file_types = [
+    "pdf",
+]
+
+image_file_types = [
+    "png",
+    "jpg",
+    "jpeg",
+    "webp",
+    "tiff",
+]
+
+office_file_types = ["doc", "docx", "pptx", "xlsx", "html", "csv", "epub"]
+
+ProgressCallback = Optional[Callable[[int, int], None]]
+
+
+def get_conversion_kind(file_type: Optional[str], use_llm: bool) -> str:
+    # 按文件类型选择转换方式：pdf / image_llm(LLM 直接解析图片) / image_pdf(图片转 pdf 后解析) / office
+    if file_type is None:
+        raise Exception("Unsupported file type")
+    if file_type in pdf_file_types:
+        return "pdf"
+    if file_type in image_file_types:
+        return "image_llm" if use_llm else "image_pdf"
+    return "office"
+
+
+def get_mineru_request(file_bytes: bytes, file_name: str, return_images: bool) -> dict:
+    # /pdf_parse 的请求参数，以文件对象分块发送，不为 multipart 请求体再复制一份文件
+    # MinerU 从查询参数读取 return_images，放在表单中会被忽略
+    count_bytes("mineru_upload", len(file_bytes))
+    return {
+        "files": {"pdf_file": (file_name, BufferReader(file_bytes), "application/pdf")},
+        "params": {"return_images": return_images},
+        "timeout": mineru_timeout,
+    }
+
+
+def can_retry_mineru(tried: List[MineruBackend], error: httpx.ConnectError) -> bool:
+    # 连接失败时换一个节点重试，所有节点都尝试过后放弃
+    if len(tried) >= len(mineru_balancer.backends):
+        return False
+    logger.warning(f"MinerU 节点 {tried[-1].base_url} 连接失败，切换节点重试: {error}")
+    return True
+
+
+def should_shard(page_count: int) -> bool:
+    return 0 < mineru_shard_threshold_pages < page_count
+
+
+def get_shard_name(file_name: str, label: str) -> str:
+    # MinerU 以文件名第一个 "." 之前的部分作为输出目录，去掉 stem 中的 "." 并加上随机后缀，
+    # 同一文件的各分片以及其它请求中同名文件的分片不会写入同一目录、互相覆盖图片
+    stem = Path(file_name).stem.replace(".", "_")
+    return f"{stem}_{label}_{uuid.uuid4().hex[:8]}.pdf"
+
+
+def merge_mineru_results(results: List[dict]) -> dict:
+    # 按分片顺序合并 md_content 和 images，不同分片中同名但内容不同的图片重命名
+    md_list = []
+    images = {}
+    for index, res in enumerate(results):
+        md_content = res["md_content"]
+        for name, content in res.get("images", {}).items():
+            if name in images and images[name] != content:
+                new_name = f"part{index}-{name}"
+                md_content = md_content.replace(f"](images/{name})", f"](images/{new_name})")
+                name = new_name
+            images[name] = content
+        md_list.append(md_content)
+
+    return {"md_content": "\n\n".join(md_list), "images": images}
+
+
+def make_page_result(
+    page_index: int, markdown: str, error: Optional[str] = None, attempts: int = 1, elapsed: float = 0
+) -> dict:
+    return {
+        "page": page_index,
+        "markdown": markdown,
+        "error": error,
+        "attempts": attempts,
+        "elapsed": elapsed,
+    }
+
+
+def get_retry_delay(page_index: int, attempts: int, error: Exception) -> Optional[float]:
+    # 单页解析失败后只重试该页：返回重试前等待的秒数，超过重试次数时返回 None
+    if attempts > llm_max_retries:
+        logger.error(f"第 {page_index + 1} 页解析失败，已尝试 {attempts} 次: {error}")
+        return None
+    logger.warning(f"第 {page_index + 1} 页解析失败，准备第 {attempts} 次重试: {error}")
+    return llm_retry_backoff * attempts
+
+
+def split_stream_pages(page_count: int) -> Tuple[range, range]:
+    # 流式转换分两部分路由：前 stream_head_pages 页分类后就开始解析，其余页面在解析前几页的同时分类，
+    # 首页结果不必等待整个文档分类完成
+    head = min(page_count, stream_head_pages)
+    return range(head), range(head, page_count)
+
+
+def get_mineru_runs(page_engines: List[str], first_page: int = 0) -> Dict[int, int]:
+    # 合并连续的 MinerU 页为 {起始页: 结束页}，连续页数超过分片阈值时按分片大小拆成多段
+    # page_engines 从第 first_page 页开始，返回的页码为文档中的页码
+    mineru_runs = {}
+    page_index = 0
+    while page_index < len(page_engines):
+        if page_engines[page_index] != "mineru":
+            page_index += 1
+            continue
+        run_end = page_index
+        while run_end + 1 < len(page_engines) and page_engines[run_end + 1] == "mineru":
+            run_end += 1
+        run_size = run_end - page_index + 1
+        if should_shard(run_size):
+            run_size = mineru_shard_pages
+        for start in range(page_index, run_end + 1, run_size):
+            mineru_runs[first_page + start] = first_page + min(start + run_size, run_end + 1) - 1
+        page_index = run_end + 1
+    return mineru_runs
+
+
+class PagePlan:
+    # 按各页的解析引擎划分：本地提取的页、LLM 解析的页、连续的 MinerU 段
+    # page_engines 为从第 first_page 页开始的连续页面，各属性中的页码均为文档中的页码
+    def __init__(self, page_engines: List[str], first_page: int = 0):
+        self.page_engines = page_engines
+        self.first_page = first_page
+        self.page_total = len(page_engines)
+        self.engine_counts = Counter(page_engines)
+        self.mineru_runs = get_mineru_runs(page_engines, first_page)
+        self.local_pages = [first_page + i for i, engine in enumerate(page_engines) if engine == "local"]
+        self.vlm_pages = [first_page + i for i, engine in enumerate(page_engines) if engine == "vlm"]
+
+    @property
+    def all_mineru(self) -> bool:
+        # 整个文档都交给 MinerU 时直接发送原文件，大文件按分片并行解析
+        return set(self.engine_counts) == {"mineru"}
+
+    def report(self, file_name: str, report: Optional[dict]):
+        if report is not None:
+            report["engines"] = dict(self.engine_counts)
+        logger.info(f"{file_name} 各解析引擎页数: {dict(self.engine_counts)}")
+
+    def steps(self) -> Iterator[Tuple[int, str, int]]:
+        # 按页码顺序产出 (起始页, 引擎, 页数)，MinerU 段整体作为一步
+        page_index = self.first_page
+        while page_index < self.first_page + self.page_total:
+            engine = self.page_engines[page_index - self.first_page]
+            page_count = self.mineru_runs[page_index] - page_index + 1 if engine == "mineru" else 1
+            yield page_index, engine, page_count
+            page_index += page_count
+
+    def get_run_name(self, file_name: str, start: int) -> str:
+        return get_shard_name(file_name, f"p{start + 1}-{self.mineru_runs[start] + 1}")
+
+    @staticmethod
+    def finish(result: dict, engine: str, page_count: int) -> dict:
+        result["engine"] = engine
+        result["page_count"] = page_count
+        return result
+
+    @staticmethod
+    def mineru_result(
+        page_index: int, page_count: int, elapsed: float, markdown: str = "", error: Optional[Exception] = None
+    ) -> dict:
+        if error is not None:
+            logger.error(f"第 {page_index + 1} 页起的 {page_count} 页 MinerU 解析失败: {error}")
+            return make_page_result(page_index, "", str(error), elapsed=elapsed)
+        return make_page_result(page_index, markdown, elapsed=elapsed)
+
+
+class PageCollector:
+    # 按页码顺序收集逐页结果：上报进度、记录失败页，结束时合并为整篇 markdown
+    # progress_callback(已完成页数, 总页数) 用于上报逐页进度
+    def __init__(self, page_total: int, progress_callback: ProgressCallback = None):
+        self.page_total = page_total
+        self.progress_callback = progress_callback
+        self.markdown_list = []
+        self.failed_pages = []
+        self.pages_done = 0
+
+    def add(self, result: dict) -> dict:
+        if result["markdown"]:
+            self.markdown_list.append(result["markdown"])
+        if result["error"] is not None:
+            self.failed_pages.append(result["page"] + 1)
+        self.pages_done += result.get("page_count", 1)
+        if self.progress_callback is not None:
+            self.progress_callback(self.pages_done, self.page_total)
+        return result
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.failed_pages)
+
+    @property
+    def markdown(self) -> str:
+        return "\n\n".join(self.markdown_list)
+
+    def merge(self) -> str:
+        if self.failed_pages:
+            raise Exception(f"第 {', '.join(map(str, self.failed_pages))} 页解析失败")
+        return self.markdown
+
+
+class TileCollector:
+    # 收集图片各切片的解析结果，按帧记录失败，结束时按帧去重拼接
+    def __init__(self, tiler: ImageTiler, progress_callback: ProgressCallback = None, report: Optional[dict] = None):
+        self.tile_total = tiler.tile_count
+        self.progress_callback = progress_callback
+        if report is not None:
+            report["engines"] = {"vlm": self.tile_total}
+            report["frames"] = tiler.frame_count
+        self.tiles = []
+        self.image_names = []
+        self.texts = []
+        self.failed_frames = set()
+
+    def track(self, tile: ImageTile) -> bytes:
+        # 切片提交解析时记录所在的帧、序号和文件名，按提交顺序与解析结果对应
+        self.tiles.append((tile.frame, tile.index))
+        self.image_names.append(tile.image_name)
+        return tile.image_bytes
+
+    def add(self, result: dict):
+        self.texts.append(result["markdown"])
+        if result["error"] is not None:
+            self.failed_frames.add(self.tiles[result["page"]][0] + 1)
+        if self.progress_callback is not None:
+            self.progress_callback(len(self.texts), self.tile_total)
+
+    def merge(self) -> str:
+        if self.failed_frames:
+            raise Exception(f"第 {', '.join(map(str, sorted(self.failed_frames)))} 页解析失败")
+        return merge_image_results(self.tiles, self.texts)
+
+
+def get_result_cache_key(
+    file_bytes: bytes,
+    use_llm: bool,
+    return_images: bool,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+) -> str:
+    return make_cache_key(
+        hashlib.sha256(file_bytes).hexdigest(),
+        use_llm,
+        return_images,
+        image_format,
+        image_mode,
+        config.MODEL_NAME,
+    )
+
+
+def get_cached_result(
+    cache_key: str, file_name: str, report: Optional[dict] = None, image_mode: str = "base64"
+) -> Optional[str]:
+    # report 不为空时写入缓存命中情况
+    # url 模式的结果引用图片存储中的图片：命中时持有并刷新这些图片，有图片已被淘汰时视为未命中，重新转换
+    # 需要在 asset_store.hold() 中调用，返回结果之前图片不会被淘汰
+    cached = result_cache.get(cache_key)
+    if cached is not None and image_mode == "url" and not asset_store.refresh(cached):
+        logger.info(f"结果缓存引用的图片已被淘汰，重新转换: {file_name}")
+        cached = None
+    if report is not None:
+        report["cache"] = "miss" if cached is None else "hit"
+    if cached is not None:
+        logger.info(f"命中结果缓存: {file_name}")
+    return cached
+
+
+def set_cached_result(cache_key: str, markdown: str):
+    count_bytes("markdown_output", len(markdown.encode("utf-8")))
+    result_cache.set(cache_key, markdown)
@@ -0,0 +1,75 @@
+import io
+import mmap
+from typing import Union
+
+from fastapi import UploadFile
+
+from utils.metrics import count_bytes
+
+multipart_overhead = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+class BufferReader(io.RawIOBase):
+    # 只读的文件对象包装 bytes / memoryview，httpx 按块读取上传，不复制整个文件
+    def __init__(self, buffer: Union[bytes, memoryview]):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._view[self._pos:self._pos + len(b)]
+        b[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def check_content_length(content_length: str, max_bytes: int):
+    # 在读取请求体之前按 Content-Length 拒绝超出上限的上传，0 表示不限制
+    # 请求体还包含 multipart 边界和其它表单字段，预留少量余量
+    if max_bytes > 0 and content_length and content_length.isdigit():
+        if int(content_length) > max_bytes + multipart_overhead:
+            raise UploadTooLargeError(f"上传文件超过大小上限 {max_bytes} 字节")
+
+
+def read_upload(upload: UploadFile, max_bytes: int = 0) -> Union[bytes, memoryview]:
+    # 读取上传文件内容，超过 max_bytes 时抛出 UploadTooLargeError
+    # 已落盘的 Starlette 临时文件通过 mmap 只读映射后返回 memoryview，不复制到内存
+    # 映射在临时文件关闭后仍然有效，可以交给流式响应和后台任务继续使用
+    file = upload.file
+    size = upload.size
+    if size is None:
+        size = file.seek(0, io.SEEK_END)
+    if 0 < max_bytes < size:
+        raise UploadTooLargeError(f"上传文件超过大小上限 {max_bytes} 字节")
+    count_bytes("upload", size)
+
+    # 未落盘的 SpooledTemporaryFile 调用 fileno 会触发写盘，小文件直接读取
+    if size > 0 and getattr(file, "_rolled", True):
+        try:
+            return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError, io.UnsupportedOperation):
+            pass
+
+    file.seek(0)
+    return file.read()
+
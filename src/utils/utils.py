@@ -1,43 +1,58 @@
-import io
 import re
+import math
+import posixpath
 import httpx
-import magic
+import time
 import fitz
-import tempfile
-import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, Optional
 from loguru import logger
-from PIL import Image
-from pdf2image import convert_from_bytes
 from markitdown_parse.main import convert_office_to_markdown
+from pdf_text_parse.main import classify_pdf_pages, convert_pdf_text_to_markdown
 from qwen_vl_parse.main import parse_image
+from utils.asset_store import asset_store
 from utils.config import config
-
-mineru_url_base = config.MINERU_API_URL
-mineru_timeout = config.MINERU_API_TIMEOUT
-
-pdf_file_types = [
-    "pdf",
-]
-
-image_file_types = [
-    "png",
-    "jpg",
-    "jpeg",
-]
-
-office_file_types = ["doc", "docx", "pptx", "xlsx"]
-
-magic_file_type_map = {
-    "application/pdf": "pdf",
-    "image/png": "png",
-    "image/jpeg": "jpeg",
-    "application/msword": "doc",
-    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
-    "application/vnd.openxmlformats-officedocument.presentationml.presentation": "pptx",
-    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
-}
+from utils.executors import submit_in_context
+from utils.file_types import detect_file_type, get_mime_type
+from utils.fitz_utils import fitz_lock, open_pdf
+from utils.image_pages import ImageTiler, transcode_image_to_png
+from utils.http_client import get_mineru_client
+from utils.libreoffice_pool import libreoffice_pool
+from utils.metrics import count_bytes, stage, timed
+from utils.mineru_balancer import mineru_balancer
+from utils.pipeline import (
+    PageCollector,
+    PagePlan,
+    ProgressCallback,
+    TileCollector,
+    can_retry_mineru,
+    get_cached_result,
+    get_conversion_kind,
+    get_mineru_request,
+    get_result_cache_key,
+    get_retry_delay,
+    get_shard_name,
+    image_file_types,
+    llm_max_concurrency,
+    make_page_result,
+    merge_mineru_results,
+    mineru_shard_concurrency,
+    mineru_shard_pages,
+    page_engine_map,
+    pdf_file_types,
+    result_cache,
+    set_cached_result,
+    should_shard,
+    split_stream_pages,
+)
+
+pdf_render_max_dpi = config.PDF_RENDER_MAX_DPI
+pdf_render_jpeg_quality = 75
+
+# fitz 无法直接打开的图片格式，转换为 pdf 前先转为 png
+fitz_unsupported_image_types = {"webp"}
 
 output_file_types = [
     "markdown",
@@ -46,103 +61,413 @@ output_file_types = [
 ]
 
 
-def detect_file_type(file_bytes, file_name):
-    # 使用magic库检测文件类型
-    if file_name.endswith(".md") or file_name.endswith(".markdown"):
-        return "markdown"
+@timed("mineru_request")
+def post_mineru_pdf_parse(file_bytes: bytes, file_name: str, return_images: bool) -> dict:
+    # 选择最空闲的 MinerU 节点解析 pdf，连接失败时换一个节点重试
+    request = get_mineru_request(file_bytes, file_name, return_images)
+    tried = []
+    while True:
+        try:
+            with mineru_balancer.backend(exclude=tried) as backend:
+                tried.append(backend)
+                res = get_mineru_client().post(backend.base_url + "/pdf_parse", **request)
+                res.raise_for_status()
+                return res.json()
+        except httpx.ConnectError as e:
+            if not can_retry_mineru(tried, e):
+                raise
+
+
+@timed("pdf_split")
+def split_pdf(file_bytes: bytes, shard_pages: int) -> List[bytes]:
+    # 使用fitz按页范围将pdf拆分为多个分片
+    shards = []
+    with open_pdf(file_bytes) as doc:
+        for start in range(0, doc.page_count, shard_pages):
+            end = min(start + shard_pages, doc.page_count) - 1
+            with fitz_lock, fitz.open() as shard:
+                shard.insert_pdf(doc, from_page=start, to_page=end)
+                shards.append(shard.tobytes(garbage=3, deflate=True))
+    return shards
+
+
+def fetch_mineru_shards(file_bytes: bytes, file_name: str, return_images: bool) -> dict:
+    # 大文件拆分为多个分片并行发送给 MinerU，结果按页序合并
+    shards = split_pdf(file_bytes, mineru_shard_pages)
+    logger.info(f"{file_name} 拆分为 {len(shards)} 个分片发送给 MinerU")
+    with ThreadPoolExecutor(max_workers=mineru_shard_concurrency, thread_name_prefix="mineru-shard") as executor:
+        futures = [
+            submit_in_context(
+                executor, post_mineru_pdf_parse, shard, get_shard_name(file_name, f"part{index}"), return_images
+            )
+            for index, shard in enumerate(shards)
+        ]
+        results = [future.result() for future in futures]
+
+    return merge_mineru_results(results)
+
 
-    file_type = magic.Magic(mime=True).from_buffer(file_bytes)
-    return magic_file_type_map.get(file_type, None)
+def fetch_mineru_api(
+    file_bytes: bytes, file_name: str, return_images: bool, image_mode: str = "base64"
+):
+    if should_shard(get_pdf_page_count(file_bytes)):
+        res = fetch_mineru_shards(file_bytes, file_name, return_images)
+    else:
+        res = post_mineru_pdf_parse(file_bytes, file_name, return_images)
+    return format_mineru_result(res, return_images, image_mode)
 
 
-def fetch_mineru_api(file_bytes: bytes, file_name: str, return_images: bool):
-    url = mineru_url_base + "/pdf_parse"
-    headers = {"Content-Type": "application/octet-stream"}
-    files = {"pdf_file": (file_name, file_bytes)}
-    data = {"return_images": return_images}
+def fetch_mineru_markdown(
+    file_bytes: bytes, file_name: str, return_images: bool, image_mode: str = "base64"
+):
+    # 不拆分直接请求 MinerU，可在工作线程中调用(不使用fitz)
+    res = post_mineru_pdf_parse(file_bytes, file_name, return_images)
+    return format_mineru_result(res, return_images, image_mode)
 
-    res = httpx.post(url, headers=headers, files=files, data=data, timeout=mineru_timeout)
 
-    res = res.json()
+@timed("mineru_postprocess")
+def format_mineru_result(res: dict, return_images: bool, image_mode: str = "base64"):
     if return_images:
-        return replace_image_with_base64(res["md_content"], res["images"])
-    
+        return replace_mineru_images(res["md_content"], res.get("images", {}), image_mode)
+
     return res["md_content"]
 
 
-def replace_image_with_base64(markdown_text, image_map):
+def replace_mineru_images(markdown_text, image_map, image_mode: str = "base64"):
+    # MinerU 返回 {图片文件名: data URL}，markdown 中以 images/图片文件名 引用
+    # url 模式下图片写入图片存储，markdown 只保留 URL
+    url_map = {}
+    for name, data_url in image_map.items():
+        # 兼容只返回 base64 内容的旧版本 MinerU 服务
+        if not data_url.startswith("data:"):
+            data_url = f"data:image/jpeg;base64,{data_url}"
+        url_map[name] = asset_store.put_data_url(data_url) if image_mode == "url" else data_url
+
     # 匹配Markdown中的图片标签
     pattern = r'\!\[(?:[^\]]*)\]\(([^)]+)\)'
 
     # 替换图片链接
     def replace(match):
         relative_path = match.group(1)
-        base64_image = image_map.get(relative_path, "")
-        return f'![{relative_path}](data:image/jpeg;base64,{base64_image})'
+        url = url_map.get(posixpath.basename(relative_path), "")
+        return f'![{relative_path}]({url})'
 
     # 应用替换
     return re.sub(pattern, replace, markdown_text)
 
-def convert_pdf_to_markdown(file_bytes: bytes, file_name: str, use_llm: bool = False, return_images: bool = False):
-    # 使用markitdown_parse库将pdf转换为markdown
-    if not use_llm:
-        return fetch_mineru_api(file_bytes, file_name, return_images)
-    else:
-        images_bytes = convert_pdf_to_image(file_bytes)
-        result_list = []
-        for image_bytes in images_bytes:
-            result_list.append(parse_image(image_bytes, file_name, return_images))
-        return "\n\n".join(result_list)
+def parse_page(
+    page_index: int,
+    image_bytes: bytes,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+    image_name: Optional[str] = None,
+) -> dict:
+    # 解析单页图片，失败时按 get_retry_delay 只重试该页
+    # image_name 的扩展名决定发送给模型的 MIME 类型，pdf 页面图片统一为 JPEG，不沿用 pdf 文件名
+    start = time.perf_counter()
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            markdown = parse_image(image_bytes, image_name, return_images, image_format, image_mode)
+            return make_page_result(page_index, markdown, None, attempts, time.perf_counter() - start)
+        except Exception as e:
+            delay = get_retry_delay(page_index, attempts, e)
+            if delay is None:
+                return make_page_result(page_index, "", str(e), attempts, time.perf_counter() - start)
+            time.sleep(delay)
 
 
+def iter_parse_pages(
+    images_bytes: Iterable[bytes],
+    return_images: bool = False,
+    page_numbers: Optional[List[int]] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+    image_names: Optional[List[str]] = None,
+) -> Iterator[dict]:
+    # 有界并发地解析每一页，按页码顺序产出每页结果，page_numbers 为各图片对应的页码
+    # image_names 为各图片的文件名，与 page_numbers 一样在取到图片后按序号读取，可以随图片的产出追加
+    # 提交窗口为并发数的两倍，等待队首页时线程池也不会空闲
+    window = llm_max_concurrency * 2
+    executor = ThreadPoolExecutor(max_workers=llm_max_concurrency, thread_name_prefix="parse-page")
+    pending = deque()
+    try:
+        for index, image_bytes in enumerate(images_bytes):
+            page_index = page_numbers[index] if page_numbers is not None else index
+            image_name = image_names[index] if image_names is not None else None
+            pending.append(
+                submit_in_context(
+                    executor,
+                    parse_page,
+                    page_index,
+                    image_bytes,
+                    return_images,
+                    image_format,
+                    image_mode,
+                    image_name,
+                )
+            )
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_pdf_page_count(file_bytes: bytes) -> int:
+    with open_pdf(file_bytes) as doc:
+        return doc.page_count
+
+
+@timed("pdf_split")
+def extract_pdf_pages(file_bytes: bytes, from_page: int, to_page: int) -> bytes:
+    # 使用fitz抽取 [from_page, to_page] 页生成新的pdf
+    with open_pdf(file_bytes) as doc, open_pdf() as part, fitz_lock:
+        part.insert_pdf(doc, from_page=from_page, to_page=to_page)
+        return part.tobytes(garbage=3, deflate=True)
+
+
+@timed("classify_pages")
+def get_page_engines(
+    file_bytes: bytes, use_llm: bool, return_images: bool, page_numbers: Optional[range] = None
+) -> List[str]:
+    # 逐页分类并选择解析引擎：local / mineru / vlm，page_numbers 为空时处理全部页面
+    if not config.PDF_TEXT_FAST_PATH:
+        page_count = len(page_numbers) if page_numbers is not None else get_pdf_page_count(file_bytes)
+        return [page_engine_map[use_llm]["scanned"]] * page_count
+
+    page_types = classify_pdf_pages(file_bytes, allow_images=not return_images, page_numbers=page_numbers)
+    return [page_engine_map[use_llm][page_type] for page_type in page_types]
+
+
+def iter_pdf_pages_by_engine(
+    file_bytes: bytes,
+    file_name: str,
+    page_engines: List[str],
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+    first_page: int = 0,
+) -> Iterator[dict]:
+    # 按页码顺序产出每页(或每段连续 MinerU 页)的结果，page_engines 从第 first_page 页开始
+    # MinerU 段在后台并行请求，LLM 页只渲染需要的页面并有界并发解析，文本页本地提取
+    plan = PagePlan(page_engines, first_page)
+    local_results = convert_pdf_text_to_markdown(file_bytes, plan.local_pages) if plan.local_pages else {}
+
+    executor = ThreadPoolExecutor(max_workers=mineru_shard_concurrency, thread_name_prefix="mineru-run")
+    vlm_results = iter_parse_pages(
+        convert_pdf_to_image(file_bytes, plan.vlm_pages),
+        return_images,
+        page_numbers=plan.vlm_pages,
+        image_format=image_format,
+        image_mode=image_mode,
+    )
+    try:
+        mineru_futures = {
+            start: submit_in_context(
+                executor,
+                fetch_mineru_markdown,
+                extract_pdf_pages(file_bytes, start, end),
+                plan.get_run_name(file_name, start),
+                return_images,
+                image_mode,
+            )
+            for start, end in plan.mineru_runs.items()
+        }
+
+        for page_index, engine, page_count in plan.steps():
+            if engine == "local":
+                result = make_page_result(page_index, local_results[page_index])
+            elif engine == "vlm":
+                result = next(vlm_results)
+            else:
+                start = time.perf_counter()
+                try:
+                    markdown = mineru_futures[page_index].result()
+                    result = plan.mineru_result(page_index, page_count, time.perf_counter() - start, markdown)
+                except Exception as e:
+                    result = plan.mineru_result(page_index, page_count, time.perf_counter() - start, error=e)
+            yield plan.finish(result, engine, page_count)
+    finally:
+        vlm_results.close()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_pdf_pages_in_stages(
+    file_bytes: bytes,
+    file_name: str,
+    head_engines: List[str],
+    rest: range,
+    use_llm: bool = False,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+) -> Iterator[dict]:
+    # 流式转换：先产出已分类的前几页，其余页面(rest)在解析前几页的同时于后台分类
+    # 两部分分别路由，连续的 MinerU 页不跨两部分合并
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="classify")
+    try:
+        rest_engines = submit_in_context(executor, get_page_engines, file_bytes, use_llm, return_images, rest)
+        yield from iter_pdf_pages_by_engine(
+            file_bytes, file_name, head_engines, return_images, image_format, image_mode
+        )
+        yield from iter_pdf_pages_by_engine(
+            file_bytes, file_name, rest_engines.result(), return_images, image_format, image_mode, rest.start
+        )
+    finally:
+        # 提前关闭时不等待后台分类结束
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def convert_pdf_to_markdown(
+    file_bytes: bytes,
+    file_name: str,
+    use_llm: bool = False,
+    return_images: bool = False,
+    progress_callback: ProgressCallback = None,
+    report: Optional[dict] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+):
+    # 使用markitdown_parse库将pdf转换为markdown
+    # 逐页选择解析引擎后按页码顺序合并结果，report 中记录各引擎处理的页数
+    plan = PagePlan(get_page_engines(file_bytes, use_llm, return_images))
+    plan.report(file_name, report)
+    if plan.all_mineru:
+        result = fetch_mineru_api(file_bytes, file_name, return_images, image_mode)
+        if progress_callback is not None:
+            progress_callback(plan.page_total, plan.page_total)
+        return result
+
+    collector = PageCollector(plan.page_total, progress_callback)
+    for page_result in iter_pdf_pages_by_engine(
+        file_bytes, file_name, plan.page_engines, return_images, image_format, image_mode
+    ):
+        collector.add(page_result)
+    return collector.merge()
+
+
+def convert_image_to_markdown(
+    file_bytes: bytes,
+    file_type: str,
+    return_images: bool = False,
+    progress_callback: ProgressCallback = None,
+    report: Optional[dict] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+) -> str:
+    # 使用 LLM 解析图片：多帧 tiff 按帧拆页，过大的图片切成重叠的横条，各切片并发解析后去重拼接
+    # 切片在解析窗口有空位时才解码和编码，内存中只保留当前帧和窗口内的切片
+    with ImageTiler(file_bytes, file_type) as tiler:
+        collector = TileCollector(tiler, progress_callback, report)
+        tile_images = (collector.track(tile) for tile in tiler)
+        for tile_result in iter_parse_pages(
+            tile_images,
+            return_images,
+            image_format=image_format,
+            image_mode=image_mode,
+            image_names=collector.image_names,
+        ):
+            collector.add(tile_result)
+
+    return collector.merge()
+
+
+@timed("image_to_pdf")
 def convert_image_to_pdf(file_bytes: bytes, file_type: str):
     # 使用fitz库将图片转换为pdf
-    pdf_bytes = fitz.open(stream=file_bytes, filetype=file_type).convert_to_pdf()
-
-    return pdf_bytes
-
-
-def images_to_bytes_readable(
-    images: List[Image.Image], format: str = "JPEG"
-) -> List[bytes]:
-    result = []
-    for img in images:
-        buffer = io.BytesIO()
-        img.save(buffer, format=format)
-        result.append(buffer.getvalue())
-        buffer.close()
-    return result
-
-
-def convert_pdf_to_image(file_bytes: bytes) -> List[bytes]:
-    # 使用fitz库将pdf转换为图片
-    image_bytes = convert_from_bytes(file_bytes, dpi=300)
-    image_bytes = images_to_bytes_readable(image_bytes)
+    if file_type in fitz_unsupported_image_types:
+        file_bytes, file_type = transcode_image_to_png(file_bytes), "png"
+    with open_pdf(file_bytes, file_type) as doc, fitz_lock:
+        return doc.convert_to_pdf()
+
+
+def get_render_matrix(page: fitz.Page) -> fitz.Matrix:
+    # 按页面尺寸和 min_pixels/max_pixels 计算渲染缩放比例
+    # 使渲染尺寸接近 smart_resize 之后模型实际使用的尺寸，且不超过 PDF_RENDER_MAX_DPI
+    max_zoom = pdf_render_max_dpi / 72
+    page_area = page.rect.width * page.rect.height
+    if page_area <= 0:
+        return fitz.Matrix(max_zoom, max_zoom)
+
+    zoom = math.sqrt(config.max_pixels / page_area)
+    zoom = max(zoom, math.sqrt(config.min_pixels / page_area))
+    zoom = min(zoom, max_zoom)
+    return fitz.Matrix(zoom, zoom)
+
+
+def convert_pdf_to_image(file_bytes: bytes, page_numbers: Optional[List[int]] = None) -> Iterator[bytes]:
+    # 使用fitz库逐页将pdf渲染为JPEG图片，同一时刻只持有一页的像素数据
+    # page_numbers 为空时渲染全部页面
+    with open_pdf(file_bytes) as doc:
+        if page_numbers is None:
+            page_numbers = range(doc.page_count)
+        for page_number in page_numbers:
+            with stage("rasterize"), fitz_lock:
+                page = doc[page_number]
+                pix = page.get_pixmap(matrix=get_render_matrix(page))
+                image_bytes = pix.tobytes("jpeg", jpg_quality=pdf_render_jpeg_quality)
+                del pix
+            count_bytes("rendered_page", len(image_bytes))
+            yield image_bytes
+
+@timed("libreoffice")
+def convert_doc_to_docx(file_bytes: bytes):
+    # 使用常驻的 LibreOffice 实例池将 DOC 文件转换为 DOCX 格式
+    try:
+        return libreoffice_pool.convert(file_bytes, "doc", "docx")
+    except Exception as e:
+        logger.error(f"无法将 DOC 文件转换为 DOCX 格式: {e}")
+        raise e
 
-    return image_bytes
 
-def convert_doc_to_docx(file_bytes: bytes):
-    # 使用 LibreOffice 将 DOC 文件转换为 DOCX 格式
-    with tempfile.TemporaryDirectory() as temp_dir:
-        doc_file = Path(temp_dir) / "temp.doc"
-        docx_file = Path(temp_dir) / "temp.docx"
-         # 构建命令
-        cmd = [
-            "soffice",
-            '--headless',
-            '--convert-to', 'docx',
-            '--outdir', doc_file,
-            docx_file
-        ]
-        try:
-            # 执行命令
-            subprocess.run(cmd, check=True)
-            
-            return docx_file.read_bytes()
-        
-        except Exception as e:
-            logger.error(f"无法将 DOC 文件转换为 DOCX 格式: {e}")
-            raise e
+def iter_convert_to_markdown(
+    file_bytes: bytes,
+    file_name: str,
+    use_llm: bool = False,
+    return_images: bool = False,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+) -> Iterator[dict]:
+    # 流式转换：pdf 按页路由后每完成一页就产出该页结果，其余情况整体作为一个分块产出
+    # 只有前几页分类后就开始解析，首页结果不必等待整个文档分类完成
+    with asset_store.hold():
+        start = time.perf_counter()
+        cache_key = get_result_cache_key(
+            file_bytes, use_llm, return_images, image_format, image_mode
+        )
+        markdown = get_cached_result(cache_key, file_name, image_mode=image_mode)
+        if markdown is None and detect_file_type(file_bytes, file_name) in pdf_file_types:
+            page_count = get_pdf_page_count(file_bytes)
+            head, rest = split_stream_pages(page_count)
+            head_engines = get_page_engines(file_bytes, use_llm, return_images, head)
+            # 整个文档都交给 MinerU 时与非流式转换一样直接发送原文件
+            if rest or not PagePlan(head_engines).all_mineru:
+                collector = PageCollector(page_count)
+                for page_result in iter_pdf_pages_in_stages(
+                    file_bytes, file_name, head_engines, rest, use_llm, return_images, image_format, image_mode
+                ):
+                    yield collector.add(page_result)
+
+                if not collector.failed:
+                    set_cached_result(cache_key, collector.markdown)
+                return
+
+        if markdown is None:
+            markdown = convert_to_markdown(
+                file_bytes,
+                file_name,
+                use_llm,
+                return_images,
+                image_format=image_format,
+                image_mode=image_mode,
+            )
+            set_cached_result(cache_key, markdown)
+
+        yield make_page_result(0, markdown, elapsed=time.perf_counter() - start)
 
 
 def convert_to_markdown_main(
@@ -150,30 +475,89 @@ def convert_to_markdown_main(
     file_name: str,
     use_llm: bool = False,
     return_images: bool = False,
+    progress_callback: ProgressCallback = None,
+    report: Optional[dict] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
+):
+    # 按文件内容哈希和解析参数查询结果缓存，未命中时再执行解析
+    # report 不为空时写入缓存命中情况和各解析引擎处理的页数
+    # 转换期间持有写入和引用的图片，返回结果之前不会被图片存储淘汰
+    with asset_store.hold():
+        cache_key = get_result_cache_key(
+            file_bytes, use_llm, return_images, image_format, image_mode
+        )
+        cached = get_cached_result(cache_key, file_name, report, image_mode)
+        if cached is not None:
+            return cached
+
+        result = convert_to_markdown(
+            file_bytes,
+            file_name,
+            use_llm,
+            return_images,
+            progress_callback,
+            report,
+            image_format,
+            image_mode,
+        )
+        set_cached_result(cache_key, result)
+        return result
+
+
+def convert_to_markdown(
+    file_bytes: bytes,
+    file_name: str,
+    use_llm: bool = False,
+    return_images: bool = False,
+    progress_callback: ProgressCallback = None,
+    report: Optional[dict] = None,
+    image_format: str = "jpeg",
+    image_mode: str = "base64",
 ):
     # 检测文件类型
     file_type = detect_file_type(file_bytes, file_name)
-    if file_type is None:
-        raise Exception("Unsupported file type")
-
-    if file_type in pdf_file_types:
-        return convert_pdf_to_markdown(file_bytes, file_name, use_llm, return_images=return_images)
-
-    elif file_type in image_file_types:
-        if use_llm:
-            return parse_image(file_bytes)
-
+    kind = get_conversion_kind(file_type, use_llm)
+
+    if kind == "pdf":
+        return convert_pdf_to_markdown(
+            file_bytes,
+            file_name,
+            use_llm,
+            return_images,
+            progress_callback,
+            report,
+            image_format,
+            image_mode,
+        )
+
+    elif kind == "image_llm":
+        return convert_image_to_markdown(
+            file_bytes,
+            file_type,
+            return_images,
+            progress_callback,
+            report,
+            image_format,
+            image_mode,
+        )
+
+    elif kind == "image_pdf":
         pdf_bytes = convert_image_to_pdf(file_bytes, file_type)
-        new_file_name = Path(file_name).with_suffix(".pdf")
-        return convert_pdf_to_markdown(pdf_bytes, new_file_name, return_images=return_images)
+        new_file_name = str(Path(file_name).with_suffix(".pdf"))
+        return convert_pdf_to_markdown(
+            pdf_bytes,
+            new_file_name,
+            return_images=return_images,
+            progress_callback=progress_callback,
+            report=report,
+            image_format=image_format,
+            image_mode=image_mode,
+        )
 
     else:
         if file_type == "doc":
             file_bytes = convert_doc_to_docx(file_bytes)
             file_type = "docx"
 
-        return convert_office_to_markdown(file_bytes)
-
-
-def get_mime_type(file_bytes: bytes):
-    return magic.Magic(mime=True).from_buffer(file_bytes)
+        return convert_office_to_markdown(file_bytes, file_type)
@@ -0,0 +1,7 @@
+import os
+
+# utils.config 在导入时读取必填配置，测试中不会访问这些服务
+os.environ.setdefault("API_KEY", "test")
+os.environ.setdefault("BASE_URL", "http://127.0.0.1:9/v1")
+os.environ.setdefault("MODEL_NAME", "test")
+os.environ.setdefault("MINERU_API_URL", "http://127.0.0.1:9/v1")
@@ -0,0 +1,46 @@
+import fitz
+
+paragraph = (
+    "The quick brown fox jumps over the lazy dog while the committee reviews "
+    "the quarterly report and discusses the budget for the next fiscal year. "
+)
+
+
+def make_pdf(draw) -> bytes:
+    with fitz.open() as doc:
+        draw(doc.new_page(width=595, height=842))
+        return doc.tobytes()
+
+
+def draw_single_column(page: fitz.Page):
+    page.insert_textbox(fitz.Rect(60, 60, 535, 780), paragraph * 12, fontsize=11)
+
+
+def draw_two_columns(page: fitz.Page):
+    page.insert_textbox(fitz.Rect(50, 60, 285, 780), "Left column. " + paragraph * 6, fontsize=11)
+    page.insert_textbox(fitz.Rect(310, 60, 545, 780), "Right column. " + paragraph * 6, fontsize=11)
+
+
+def draw_ruled_table(page: fitz.Page):
+    page.insert_textbox(fitz.Rect(60, 60, 535, 200), paragraph * 2, fontsize=11)
+    columns = [60, 220, 380, 535]
+    rows = [240 + 24 * i for i in range(6)]
+    for x in columns:
+        page.draw_line((x, rows[0]), (x, rows[-1]))
+    for y in rows:
+        page.draw_line((columns[0], y), (columns[-1], y))
+    for row, (top, bottom) in enumerate(zip(rows, rows[1:])):
+        for column, (left, right) in enumerate(zip(columns, columns[1:])):
+            page.insert_text((left + 6, bottom - 8), f"cell {row}-{column}", fontsize=10)
+
+
+def draw_blank(page: fitz.Page):
+    # 没有文本层的页面，相当于扫描件
+    page.draw_rect(fitz.Rect(60, 60, 535, 780), fill=(0.9, 0.9, 0.9))
+
+
+def make_document(*draws) -> bytes:
+    with fitz.open() as doc:
+        for draw in draws:
+            draw(doc.new_page(width=595, height=842))
+        return doc.tobytes()
@@ -0,0 +1,55 @@
+import contextvars
+import os
+import time
+
+from utils.asset_store import DiskAssetStore
+
+
+def test_disk_store_evicts_oldest_over_size_budget(tmp_path):
+    store = DiskAssetStore(str(tmp_path), "/v1/assets", max_bytes=250)
+    urls = [store.put(bytes([index]) * 100, "png") for index in range(3)]
+    names = [url.rsplit("/", 1)[-1] for url in urls]
+
+    assert not store.path_for(names[0]).exists()
+    assert all(store.path_for(name).exists() for name in names[1:])
+    assert store.stats()["size_bytes"] == 200
+    assert store.stats()["evictions"] == 1
+
+
+def test_disk_store_rewrite_refreshes_entry(tmp_path):
+    store = DiskAssetStore(str(tmp_path), "/v1/assets", max_bytes=250)
+    first = store.put(b"a" * 100, "png").rsplit("/", 1)[-1]
+    store.put(b"b" * 100, "png")
+    # 再次写入相同内容后，最旧的变为第二张
+    store.put(b"a" * 100, "png")
+    store.put(b"c" * 100, "png")
+
+    assert store.path_for(first).exists()
+    assert store.dedup_hits == 1
+
+
+def test_disk_store_removes_expired_assets(tmp_path):
+    store = DiskAssetStore(str(tmp_path), "/v1/assets", ttl=60)
+    old = store.put(b"old" * 10, "png").rsplit("/", 1)[-1]
+    past = time.time() - 120
+    os.utime(store.path_for(old), (past, past))
+
+    # 重新打开时按文件修改时间恢复索引，写入新图片时删除过期的图片
+    store = DiskAssetStore(str(tmp_path), "/v1/assets", ttl=60)
+    store.put(b"new" * 10, "png")
+
+    assert not store.path_for(old).exists()
+    assert store.stats()["entries"] == 1
+
+
+def test_disk_store_keeps_assets_held_by_in_flight_requests(tmp_path):
+    store = DiskAssetStore(str(tmp_path), "/v1/assets", max_bytes=250)
+    with store.hold():
+        held = [store.put(bytes([index]) * 100, "png").rsplit("/", 1)[-1] for index in range(2)]
+        # 另一个请求写入的图片使总量超限，本请求持有的图片不被淘汰
+        contextvars.Context().run(store.put, b"other" * 20, "png")
+        assert all(store.path_for(name).exists() for name in held)
+        assert store.stats()["held"] == 2
+
+    store.put(b"later" * 20, "png")
+    assert not store.path_for(held[0]).exists()
@@ -0,0 +1,179 @@
+import asyncio
+import io
+import json
+import zipfile
+
+import pytest
+
+import utils.batch as batch
+from utils.batch import (
+    aiter_batch_zip,
+    aiter_convert_batch,
+    count_batch_files,
+    get_batch_category,
+    iter_batch_files,
+)
+from utils.uploads import UploadTooLargeError
+
+
+def make_zip(entries: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+pdf_bytes = b"%PDF-1.7\n" + b"\0" * 64
+png_bytes = b"\x89PNG\r\n\x1a\n" + b"\0" * 64
+docx_bytes = make_zip({"[Content_Types].xml": "<Types/>", "word/document.xml": "<w:document/>"})
+
+
+def test_zip_uploads_are_expanded():
+    archive = make_zip(
+        {
+            "a.pdf": pdf_bytes,
+            "dir/b.png": png_bytes,
+            "dir/": "",
+            ".hidden": "x",
+            "__MACOSX/._a.pdf": "x",
+            "big.pdf": b"x" * 200,
+        }
+    )
+    uploads = [("one.pdf", pdf_bytes), ("docs.ZIP", archive), ("bad.zip", b"not a zip")]
+    assert count_batch_files(uploads) == 5
+
+    files = list(iter_batch_files(uploads, 100))
+    assert [name for name, _ in files] == [
+        "one.pdf",
+        "docs.ZIP/a.pdf",
+        "docs.ZIP/dir/b.png",
+        "docs.ZIP/big.pdf",
+        "bad.zip",
+    ]
+    assert files[1][1] == pdf_bytes and files[2][1] == png_bytes
+    # 超过大小上限的成员和无法打开的压缩包以异常代替内容
+    assert isinstance(files[3][1], UploadTooLargeError)
+    assert isinstance(files[4][1], zipfile.BadZipFile)
+
+
+def test_uploads_over_the_limit_are_passed_through():
+    error = UploadTooLargeError("too large")
+    assert list(iter_batch_files([("big.zip", error)], 100)) == [("big.zip", error)]
+    assert count_batch_files([("big.zip", error)]) == 1
+
+
+def test_batch_categories():
+    assert get_batch_category("pdf") == "pdf"
+    assert get_batch_category("png") == "image"
+    assert get_batch_category("jpeg") == "image"
+    assert get_batch_category("docx") == "office"
+    assert get_batch_category("html") == "office"
+
+
+@pytest.fixture
+def conversions(monkeypatch):
+    # 替换实际的转换，按文件类型记录同时进行的转换数
+    state = {"running": {}, "peak": {}, "delays": {}}
+
+    async def convert(file_bytes, file_name, *args, **kwargs):
+        category = get_batch_category(batch.detect_file_type(file_bytes, file_name))
+        running = state["running"]
+        running[category] = running.get(category, 0) + 1
+        state["peak"][category] = max(state["peak"].get(category, 0), running[category])
+        try:
+            await asyncio.sleep(state["delays"].get(category, 0.01))
+        finally:
+            running[category] -= 1
+        if file_name.startswith("fail"):
+            raise RuntimeError("conversion failed")
+        return f"# {file_name}"
+
+    monkeypatch.setattr(batch, "convert_to_markdown_main_async", convert)
+    return state
+
+
+async def collect(files) -> list:
+    return [event async for event in aiter_convert_batch(iter(files))]
+
+
+def test_concurrency_is_limited_per_file_type(conversions, monkeypatch):
+    monkeypatch.setattr(batch, "batch_concurrency", {"pdf": 1, "image": 2, "office": 3})
+    monkeypatch.setattr(batch, "batch_window", 12)
+    files = (
+        [(f"{i}.pdf", pdf_bytes) for i in range(4)]
+        + [(f"{i}.png", png_bytes) for i in range(4)]
+        + [(f"{i}.docx", docx_bytes) for i in range(4)]
+    )
+    events = asyncio.run(collect(files))
+    assert conversions["peak"] == {"pdf": 1, "image": 2, "office": 3}
+    assert [event for event, _ in events] == ["file"] * 12 + ["done"]
+    stats = events[-1][1]
+    assert stats["succeeded"] == 12
+    files_by_type = {file_type: stats["by_type"][file_type]["files"] for file_type in stats["by_type"]}
+    assert files_by_type == {"pdf": 4, "png": 4, "docx": 4}
+
+
+def test_slow_file_types_do_not_block_others(conversions, monkeypatch):
+    monkeypatch.setattr(batch, "batch_concurrency", {"pdf": 1, "image": 1, "office": 1})
+    monkeypatch.setattr(batch, "batch_window", 6)
+    conversions["delays"] = {"pdf": 0.5, "image": 0.01}
+    files = [("slow.pdf", pdf_bytes)] + [(f"{i}.png", png_bytes) for i in range(4)]
+    events = asyncio.run(collect(files))
+    # pdf 占满自己的并发数时图片照常转换，按完成顺序产出
+    assert [data["file_name"] for _, data in events[:-1]] == ["0.png", "1.png", "2.png", "3.png", "slow.pdf"]
+    assert events[-2][1]["wait"] == pytest.approx(0, abs=0.1)
+
+
+def test_failures_are_recorded_per_file(conversions):
+    files = [
+        ("ok.pdf", pdf_bytes),
+        ("fail.pdf", pdf_bytes),
+        ("unknown.bin", b"\x00\x01\x02\x03" * 16),
+        ("big.pdf", UploadTooLargeError("too large")),
+    ]
+    events = asyncio.run(collect(files))
+    results = {data["file_name"]: data for event, data in events if event == "file"}
+    assert results["ok.pdf"]["status"] == "succeeded" and results["ok.pdf"]["markdown"] == "# ok.pdf"
+    assert results["fail.pdf"]["error"] == "conversion failed"
+    assert results["unknown.bin"]["error"] == "Unsupported file type"
+    assert results["big.pdf"]["error"] == "too large" and results["big.pdf"]["file_type"] is None
+    stats = events[-1][1]
+    assert (stats["files"], stats["succeeded"], stats["failed"]) == (4, 1, 3)
+    # 未能识别类型的文件统计在 unknown 中
+    unknown = stats["by_type"]["unknown"]
+    assert (unknown["files"], unknown["failed"]) == (2, 2)
+
+
+def test_batch_zip_output(conversions):
+    files = [
+        ("a/report.pdf", pdf_bytes),
+        ("b/report.pdf", pdf_bytes),
+        ("a/report.png", png_bytes),
+        ("fail.pdf", pdf_bytes),
+    ]
+
+    async def main():
+        chunks = []
+        async for chunk in aiter_batch_zip(aiter_convert_batch(iter(files))):
+            chunks.append(chunk)
+        return chunks
+
+    chunks = asyncio.run(main())
+    # 每个成功的文件写入后立即产出一段数据，最后产出 results.json 和中央目录
+    assert len(chunks) == 4 and all(chunks)
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        names = archive.namelist()
+        summary = json.loads(archive.read("results.json"))
+        outputs = {result["file_name"]: result.get("output") for result in summary["files"]}
+        assert sorted(names) == sorted([*filter(None, outputs.values()), "results.json"])
+        # 转换时只传入文件名，压缩包中保留原来的目录
+        assert outputs["b/report.pdf"] == "b/report.md"
+        assert archive.read("b/report.md") == b"# report.pdf"
+
+    assert [result["index"] for result in summary["files"]] == [0, 1, 2, 3]
+    assert outputs["fail.pdf"] is None and summary["files"][3]["error"] == "conversion failed"
+    # 扩展名替换后重名的文件追加序号
+    assert sorted(filter(None, outputs.values())) == ["a/report.md", "a/report_2.md", "b/report.md"]
+    assert all("markdown" not in result for result in summary["files"])
+    assert summary["stats"]["files"] == 4 and summary["stats"]["succeeded"] == 3
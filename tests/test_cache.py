@@ -0,0 +1,117 @@
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+from utils.cache import DiskCache, MemoryLRUCache, make_cache_key
+
+
+def test_cache_key_separates_fields():
+    # 字段之间有分隔符，拼接结果相同的不同字段组合不会得到同一个键
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+    assert make_cache_key("a", "b") != make_cache_key("b", "a")
+    assert make_cache_key(b"abc", 1, True) == make_cache_key("abc", "1", "True")
+    assert len(make_cache_key(b"\0" * 10)) == 64
+
+
+@pytest.fixture(params=["memory", "disk"])
+def make_cache(request, tmp_path):
+    def make(max_bytes: int):
+        if request.param == "memory":
+            return MemoryLRUCache(max_bytes)
+        return DiskCache(str(tmp_path), max_bytes)
+
+    return make
+
+
+def test_lru_eviction_is_bounded_by_bytes(make_cache):
+    cache = make_cache(10)
+    cache.set("a", "aaaa")
+    cache.set("b", "bbbb")
+    # 读取 a 后 b 成为最久未使用的条目
+    assert cache.get("a") == "aaaa"
+    cache.set("c", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa" and cache.get("c") == "cccc"
+    stats = cache.stats()
+    assert (stats["entries"], stats["size_bytes"], stats["evictions"]) == (2, 8, 1)
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_entries_larger_than_the_budget_are_not_stored(make_cache):
+    cache = make_cache(4)
+    cache.set("a", "aaaaa")
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_replacing_an_entry_updates_its_size(make_cache):
+    cache = make_cache(10)
+    cache.set("a", "aaaa")
+    cache.set("a", "aaaaaaaa")
+    assert cache.stats()["size_bytes"] == 8
+    assert cache.get("a") == "aaaaaaaa"
+
+
+def write_entries(cache_dir: Path, sizes: dict):
+    cache = DiskCache(str(cache_dir), 1024)
+    for index, (key, size) in enumerate(sizes.items()):
+        cache.set_bytes(key, b"x" * size)
+        os.utime(cache._path(key), (1000 + index, 1000 + index))
+
+
+def test_disk_index_is_rebuilt_in_lru_order(tmp_path):
+    write_entries(tmp_path, {"aa01": 4, "bb02": 4, "cc03": 4})
+    (tmp_path / "aa" / "aa01.123.tmp").write_bytes(b"partial")
+
+    cache = DiskCache(str(tmp_path), 1024)
+    assert (cache.stats()["entries"], cache.stats()["size_bytes"]) == (3, 12)
+    cache.get_bytes("aa01")
+    # 按修改时间恢复顺序，读取过的 aa01 移到最后，淘汰时先删除 bb02
+    cache.max_bytes = 12
+    cache.set_bytes("dd04", b"x" * 4)
+    assert not (tmp_path / "bb" / "bb02").exists()
+    assert cache.get_bytes("aa01") is not None and cache.get_bytes("cc03") is not None
+
+
+def test_disk_index_rebuild_evicts_down_to_a_smaller_budget(tmp_path):
+    write_entries(tmp_path, {"aa01": 4, "bb02": 4, "cc03": 4})
+    cache = DiskCache(str(tmp_path), 8)
+    assert cache.stats()["entries"] == 2
+    assert not (tmp_path / "aa" / "aa01").exists()
+
+
+def test_disk_entry_deleted_by_another_process_is_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path), 1024)
+    cache.set_bytes("aa01", b"data")
+    cache._path("aa01").unlink()
+    assert cache.get_bytes("aa01") is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["size_bytes"] == 0
+
+
+def test_disk_reads_do_not_hold_the_lock(tmp_path, monkeypatch):
+    # 读取文件期间其它线程仍可以访问缓存
+    cache = DiskCache(str(tmp_path), 1024)
+    cache.set_bytes("aa01", b"data")
+    reading = threading.Event()
+    release = threading.Event()
+    read_bytes = Path.read_bytes
+
+    def slow_read_bytes(path):
+        reading.set()
+        release.wait(5)
+        return read_bytes(path)
+
+    monkeypatch.setattr(Path, "read_bytes", slow_read_bytes)
+    reader = threading.Thread(target=cache.get_bytes, args=("aa01",))
+    reader.start()
+    assert reading.wait(5)
+    try:
+        assert cache._lock.acquire(timeout=1)
+        cache._lock.release()
+        cache.set_bytes("bb02", b"more")
+    finally:
+        release.set()
+        reader.join()
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,150 @@
+import io
+import threading
+import zipfile
+
+import pytest
+
+import utils.file_types as file_types
+from utils.file_types import MagicPool, detect_file_type, get_mime_type
+
+
+def make_zip(entries: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+content_types = '<?xml version="1.0"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>'
+
+zip_cases = {
+    "docx": {"[Content_Types].xml": content_types, "_rels/.rels": "", "word/document.xml": "<w:document/>"},
+    "xlsx": {"[Content_Types].xml": content_types, "xl/workbook.xml": "<workbook/>"},
+    "pptx": {"[Content_Types].xml": content_types, "ppt/presentation.xml": "<presentation/>"},
+    "epub": {"mimetype": "application/epub+zip", "META-INF/container.xml": "<container/>"},
+}
+
+signature_cases = {
+    "pdf": b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n",
+    "png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR",
+    "jpeg": b"\xff\xd8\xff\xe0\x00\x10JFIF\x00",
+    "tiff": b"II*\x00\x08\x00\x00\x00",
+    "webp": b"RIFF\x24\x00\x00\x00WEBPVP8 ",
+}
+
+
+@pytest.fixture
+def magic_calls(monkeypatch):
+    # 记录交给 libmagic 检测的内容长度，魔数能识别的类型不应调用 libmagic
+    calls = []
+    from_buffer = file_types.magic_pool.from_buffer
+
+    def recording_from_buffer(buffer):
+        calls.append(len(buffer))
+        return from_buffer(buffer)
+
+    monkeypatch.setattr(file_types.magic_pool, "from_buffer", recording_from_buffer)
+    return calls
+
+
+@pytest.mark.parametrize("file_type, header", signature_cases.items(), ids=signature_cases.keys())
+def test_signatures_skip_libmagic(file_type, header, magic_calls):
+    file_bytes = header + b"\0" * 64
+    assert detect_file_type(file_bytes, "upload.bin") == file_type
+    assert detect_file_type(memoryview(file_bytes), "upload.bin") == file_type
+    assert get_mime_type(file_bytes) == file_types.file_type_mimes[file_type]
+    assert magic_calls == []
+
+
+def test_big_endian_tiff_signature(magic_calls):
+    assert detect_file_type(b"MM\x00*\x00\x00\x00\x08" + b"\0" * 64, "scan.tif") == "tiff"
+    assert magic_calls == []
+
+
+@pytest.mark.parametrize("file_type, entries", zip_cases.items(), ids=zip_cases.keys())
+def test_zip_containers_are_told_apart_by_entry_names(file_type, entries, magic_calls):
+    file_bytes = make_zip(entries)
+    # 扩展名不参与 zip 容器的判断
+    assert detect_file_type(file_bytes, "upload.zip") == file_type
+    assert detect_file_type(memoryview(file_bytes), "upload") == file_type
+    assert get_mime_type(file_bytes) == file_types.file_type_mimes[file_type]
+    assert magic_calls == []
+
+
+@pytest.mark.parametrize(
+    "entries",
+    [
+        {"readme.txt": "hello", "data/values.csv": "a,b\n1,2\n"},
+        # 只有 word 目录、没有 [Content_Types].xml 的不是 office 文档
+        {"word/document.xml": "<w:document/>"},
+        {"[Content_Types].xml": content_types, "other/part.xml": "<part/>"},
+        {"mimetype": "text/plain", "META-INF/container.xml": "<container/>"},
+    ],
+    ids=["plain_zip", "no_content_types", "unknown_ooxml_part", "not_epub_mimetype"],
+)
+def test_zip_that_is_not_an_office_document(entries, magic_calls):
+    file_bytes = make_zip(entries)
+    assert detect_file_type(file_bytes, "report.docx") is None
+    assert get_mime_type(file_bytes) == "application/zip"
+    assert magic_calls == []
+
+
+def test_truncated_zip_is_not_supported(magic_calls):
+    # 中央目录在文件末尾，截断后无法读取
+    file_bytes = make_zip(zip_cases["docx"])[:-30]
+    assert detect_file_type(file_bytes, "report.docx") is None
+    assert magic_calls == []
+
+
+def test_markdown_is_detected_by_extension(magic_calls):
+    assert detect_file_type(b"%PDF-1.7", "notes.md") == "markdown"
+    assert detect_file_type(b"# title", "NOTES.MARKDOWN") == "markdown"
+    assert magic_calls == []
+
+
+def test_other_types_fall_back_to_libmagic_on_the_header(magic_calls):
+    # 只把开头 magic_header_bytes 字节交给 libmagic
+    body = b"<p>text</p>" * file_types.magic_header_bytes
+    html = b"<!DOCTYPE html><html><head><title>t</title></head><body>" + body + b"</body></html>"
+    assert detect_file_type(html, "page") == "html"
+    assert magic_calls == [file_types.magic_header_bytes]
+    # libmagic 只能识别为 text/plain 的内容按扩展名区分
+    assert detect_file_type(b"a,b\n1,2\n", "table.csv") == "csv"
+    assert detect_file_type(b"a,b\n1,2\n", "table.txt") is None
+    assert detect_file_type(b"\x00\x01\x02\x03" * 16, "blob.bin") is None
+
+
+def test_ole_documents_pass_a_longer_header_to_libmagic(magic_calls):
+    file_bytes = file_types.ole_signature + b"\0" * (file_types.magic_header_bytes * 4)
+    detect_file_type(file_bytes, "legacy.doc")
+    assert magic_calls == [len(file_bytes)]
+
+
+def test_magic_pool_reuses_detectors():
+    pool = MagicPool(2)
+    with pool.acquire() as first:
+        with pool.acquire() as second:
+            assert first is not second
+    with pool.acquire() as again:
+        assert again in (first, second)
+    assert pool.from_buffer(b"%PDF-1.7\n") == "application/pdf"
+
+
+def test_magic_pool_is_bounded():
+    pool = MagicPool(1)
+    acquired = threading.Event()
+
+    def use_detector():
+        with pool.acquire():
+            acquired.set()
+
+    with pool.acquire() as detector:
+        worker = threading.Thread(target=use_detector)
+        worker.start()
+        # 池中唯一的检测器被占用时，其它线程等待归还
+        assert not acquired.wait(0.2)
+    worker.join(5)
+    assert acquired.is_set()
+    with pool.acquire() as again:
+        assert again is detector
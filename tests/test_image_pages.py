@@ -0,0 +1,49 @@
+import io
+
+from PIL import Image
+
+from qwen_vl_parse.main import build_image_url
+from utils import image_pages, utils
+from utils.image_pages import get_tile_boxes, get_tile_scale
+
+
+def encode(image: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def parse_tiles(monkeypatch, file_bytes: bytes, file_type: str) -> list:
+    image_names = []
+
+    def fake_parse_image(image_bytes, image_name, *args):
+        image_names.append(image_name)
+        return "text"
+
+    monkeypatch.setattr(utils, "parse_image", fake_parse_image)
+    utils.convert_image_to_markdown(file_bytes, file_type)
+    return image_names
+
+
+def test_png_tiles_and_transcoded_tiff_are_sent_as_png(monkeypatch):
+    scan = Image.new("L", (3000, 6000), 255)
+    names = parse_tiles(monkeypatch, encode(scan, "PNG"), "png")
+    assert len(names) > 1
+    assert all(name.endswith(".png") for name in names)
+    assert build_image_url(b"", names[0]).startswith("data:image/png;")
+
+    names = parse_tiles(monkeypatch, encode(Image.new("RGB", (400, 300), "white"), "TIFF"), "tiff")
+    assert names == ["image.png"]
+
+    names = parse_tiles(monkeypatch, encode(Image.new("RGB", (3000, 6000), "white"), "JPEG"), "jpeg")
+    assert all(build_image_url(b"", name).startswith("data:image/jpeg;") for name in names)
+
+
+def test_wide_images_are_cut_into_columns_above_min_scale():
+    width, height = 20000, 1200
+    boxes = get_tile_boxes(width, height)
+    assert len({(left, right) for left, _, right, _ in boxes}) > 1
+    assert all(get_tile_scale(right - left) >= image_pages.image_tile_min_scale for left, _, right, _ in boxes)
+    assert min(left for left, _, _, _ in boxes) == 0
+    assert max(right for _, _, right, _ in boxes) == width
+    assert max(bottom for _, _, _, bottom in boxes) == height
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import utils.jobs as jobs
+from utils.jobs import JobManager, QueueFullError
+
+
+@pytest.fixture
+def blocked_conversions(monkeypatch):
+    # 转换在 release 之前一直阻塞，使任务保持运行或排队状态
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def convert_to_markdown_main(file_bytes, file_name, *args, **kwargs):
+        started.release()
+        release.wait(10)
+        if file_name.startswith("fail"):
+            raise RuntimeError("conversion failed")
+        return {"markdown": f"# {file_name}"}
+
+    monkeypatch.setattr(jobs, "convert_to_markdown_main", convert_to_markdown_main)
+    yield started, release
+    release.set()
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1, max_queue=1, result_ttl=3600)
+    yield manager
+    manager.shutdown()
+
+
+def wait_finished(manager: JobManager, job):
+    # 单个工作线程按提交顺序执行，空任务完成时之前提交的任务都已结束
+    manager._executor.submit(lambda: None).result(10)
+    assert job.finished
+
+
+def test_full_queue_rejects_new_jobs(manager, blocked_conversions):
+    started, release = blocked_conversions
+    running = manager.submit(b"", "a.pdf")
+    assert started.acquire(timeout=5)
+    queued = manager.submit(b"", "b.pdf")
+    assert (running.status, queued.status) == ("running", "pending")
+    # 运行中 + 排队的任务数达到上限后拒绝新任务
+    with pytest.raises(QueueFullError):
+        manager.submit(b"", "c.pdf")
+    stats = manager.stats()
+    assert (stats["active"], stats["running"], stats["queued"], stats["total"]) == (2, 1, 1, 2)
+
+    release.set()
+    wait_finished(manager, queued)
+    assert running.result == {"markdown": "# a.pdf"} and queued.status == "succeeded"
+    # 任务完成后释放名额
+    assert manager.stats()["active"] == 0
+    manager.submit(b"", "c.pdf")
+
+
+def test_failed_jobs_release_their_slot(manager, blocked_conversions):
+    _, release = blocked_conversions
+    release.set()
+    job = manager.submit(b"", "fail.pdf")
+    wait_finished(manager, job)
+    assert (job.status, job.error) == ("failed", "conversion failed")
+    assert manager.stats()["active"] == 0
+
+
+def test_finished_jobs_expire(manager, blocked_conversions):
+    _, release = blocked_conversions
+    release.set()
+    job = manager.submit(b"", "a.pdf")
+    wait_finished(manager, job)
+    assert manager.get(job.job_id) is job
+    manager.result_ttl = 0
+    job.finished_at -= 1
+    # 过期的任务在下一次提交时清理
+    manager.submit(b"", "b.pdf")
+    assert manager.get(job.job_id) is None
+
+
+def test_submit_returns_429_when_the_queue_is_full(manager, blocked_conversions, monkeypatch):
+    started, _ = blocked_conversions
+    monkeypatch.setattr(main, "job_manager", manager)
+    client = TestClient(main.app)
+    responses = [client.post("/v1/jobs", files={"file": (f"{i}.pdf", b"%PDF-1.7\n")}) for i in range(3)]
+    assert [response.status_code for response in responses] == [202, 202, 429]
+    assert responses[2].json()["code"] == 429
+
+    job_id = responses[0].json()["data"]["job_id"]
+    assert started.acquire(timeout=5)
+    response = client.get(f"/v1/jobs/{job_id}/result")
+    assert response.status_code == 409
@@ -0,0 +1,11 @@
+import os
+
+from utils.libreoffice_pool import LibreOfficePool
+
+
+def test_workers_use_per_process_pipes():
+    # 管道名带进程号，各工作进程的实例池不像固定端口那样互相冲突
+    pool = LibreOfficePool(size=2, timeout=10)
+    assert [worker.pipe_name for worker in pool.workers] == [f"lo_{os.getpid()}_0", f"lo_{os.getpid()}_1"]
+    assert pool.workers[0].connection == f"pipe,name=lo_{os.getpid()}_0;urp;StarOffice.ComponentContext"
+    pool.shutdown()
@@ -0,0 +1,15 @@
+from utils import utils
+from utils.metrics import collect_timings, timed
+
+
+def test_sync_page_workers_record_into_request_timings(monkeypatch):
+    @timed("vlm_inference")
+    def fake_parse_image(image_bytes, *args):
+        return image_bytes.decode()
+
+    monkeypatch.setattr(utils, "parse_image", fake_parse_image)
+    with collect_timings() as timings:
+        results = list(utils.iter_parse_pages([b"a", b"b", b"c"]))
+
+    assert [r["markdown"] for r in results] == ["a", "b", "c"]
+    assert timings["vlm_inference"]["count"] == 3
@@ -0,0 +1,48 @@
+import asyncio
+
+import httpx
+import pytest
+
+from utils.mineru_balancer import MineruBalancer
+
+
+def test_cancelled_request_releases_backend():
+    balancer = MineruBalancer(["http://a", "http://b"])
+    started = asyncio.Event()
+
+    async def request():
+        with balancer.backend():
+            started.set()
+            await asyncio.sleep(60)
+
+    async def main():
+        task = asyncio.create_task(request())
+        await started.wait()
+        assert sum(b.in_flight for b in balancer.backends) == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert [b.in_flight for b in balancer.backends] == [0, 0]
+    assert all(b.consecutive_failures == 0 and b.latency_ewma is None for b in balancer.backends)
+
+
+def test_server_errors_open_circuit_but_client_errors_do_not():
+    balancer = MineruBalancer(["http://a"], failure_threshold=2)
+    backend = balancer.backends[0]
+
+    def fail(status_code: int):
+        request = httpx.Request("POST", "http://a/pdf_parse")
+        response = httpx.Response(status_code, request=request)
+        with pytest.raises(httpx.HTTPStatusError):
+            with balancer.backend():
+                response.raise_for_status()
+
+    fail(400)
+    fail(400)
+    assert backend.available and backend.consecutive_failures == 0
+    fail(500)
+    fail(500)
+    assert not backend.available
+    assert backend.in_flight == 0
@@ -0,0 +1,30 @@
+import asyncio
+
+import httpx
+
+from benchmark.mock_servers import create_mineru_app
+from pdf_samples import draw_single_column, make_document
+from utils.pipeline import get_mineru_request
+
+
+def post_pdf_parse(return_images: bool) -> dict:
+    app = create_mineru_app(latency=0, page_latency=0, jitter=0)
+    request = get_mineru_request(make_document(draw_single_column), "sample.pdf", return_images)
+
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mineru") as client:
+            res = await client.post("/v1/pdf_parse", **request)
+            res.raise_for_status()
+            return res.json()
+
+    return asyncio.run(post())
+
+
+def test_return_images_is_sent_as_query_parameter():
+    request = get_mineru_request(b"%PDF-", "sample.pdf", True)
+    assert request["params"] == {"return_images": True}
+    assert "data" not in request
+
+    assert "images" in post_pdf_parse(return_images=True)
+    assert "images" not in post_pdf_parse(return_images=False)
@@ -0,0 +1,13 @@
+from pdf_samples import draw_blank, draw_ruled_table, draw_single_column, draw_two_columns, make_document
+from utils.utils import get_page_engines
+
+
+def test_mixed_document_routes_layout_pages_away_from_local():
+    file_bytes = make_document(draw_single_column, draw_two_columns, draw_ruled_table, draw_blank)
+    assert get_page_engines(file_bytes, use_llm=True, return_images=False) == ["local", "vlm", "vlm", "vlm"]
+    assert get_page_engines(file_bytes, use_llm=False, return_images=False) == [
+        "local",
+        "mineru",
+        "mineru",
+        "mineru",
+    ]
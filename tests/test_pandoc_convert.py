@@ -0,0 +1,157 @@
+import base64
+import io
+import os
+import shutil
+import subprocess
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz
+import httpx
+import pytest
+from PIL import Image
+
+from pandoc_convert import main as pandoc_convert
+from pandoc_convert.main import collect_images, render_docx, render_pdf, typst_compiler_pool
+from utils.pandoc_server import PandocServer
+
+requires_pandoc = pytest.mark.skipif(shutil.which("pandoc") is None, reason="pandoc is not installed")
+
+
+def image_bytes(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 20), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def image_data_url(color: str) -> str:
+    return "data:image/png;base64," + base64.b64encode(image_bytes(color)).decode()
+
+
+@pytest.fixture
+def image_server():
+    # 本地 http 服务，/red.png 返回 png 图片，其余路径返回 404
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/red.png":
+                self.send_error(404)
+                return
+            body = image_bytes("red")
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def docx_media(docx_bytes: bytes) -> list:
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as archive:
+        return [name for name in archive.namelist() if name.startswith("word/media/")]
+
+
+def cgi_pandoc_server(tmp_path) -> PandocServer:
+    # 以 pandoc-server.cgi 为名运行 pandoc 时按 CGI 方式处理单个请求，与 pandoc server 的转换逻辑相同
+    script = tmp_path / "pandoc-server.cgi"
+    script.symlink_to(shutil.which("pandoc"))
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        env = dict(
+            os.environ,
+            REQUEST_METHOD="POST",
+            CONTENT_TYPE="application/json",
+            CONTENT_LENGTH=str(len(request.content)),
+            PATH_INFO="/",
+            SERVER_NAME="localhost",
+            SERVER_PORT="80",
+            SCRIPT_NAME="",
+            QUERY_STRING="",
+            REMOTE_ADDR="127.0.0.1",
+            REMOTE_HOST="localhost",
+            HTTP_HOST="localhost",
+            HTTP_ACCEPT=request.headers["accept"],
+        )
+        output = subprocess.run([str(script)], input=request.content, env=env, capture_output=True).stdout
+        # CGI 输出为响应头 + 空行 + 正文
+        header, _, body = output.partition(b"\n\n")
+        status = int(header.split(b"\n", 1)[0].split()[1])
+        return httpx.Response(status, content=body)
+
+    server = PandocServer(url="http://pandoc.test", port=0, timeout=60, startup_timeout=1)
+    server._client = httpx.Client(base_url=server.url, transport=httpx.MockTransport(handler))
+    return server
+
+
+def test_compiler_pool_reuses_compilers(tmp_path):
+    pytest.importorskip("typst")
+    first = typst_compiler_pool.compile(b"= First", str(tmp_path))
+    second = typst_compiler_pool.compile(b"= Second", str(tmp_path))
+    assert first.startswith(b"%PDF") and second.startswith(b"%PDF")
+    assert typst_compiler_pool._idle.qsize() == 1
+
+
+def test_data_url_images_are_collected_as_media_files():
+    red = image_data_url("red")
+    text = f"![a]({red})\n\n![b]({red} \"title\")\n\n![c]({image_data_url('blue')})"
+    result, files = collect_images(text)
+    assert "data:" not in result
+    assert len(files) == 2
+    assert result.count("](media/") == 3
+    assert '.png "title")' in result
+
+
+def test_remote_images_are_downloaded_and_unreachable_ones_become_alt_text(image_server):
+    text = f"![red]({image_server}/red.png)\n\n![missing]({image_server}/missing.png)\n\n![local](figure.png)"
+    result, files = collect_images(text)
+    assert list(files.values()) == [image_bytes("red")]
+    assert f"![red]({next(iter(files))})" in result
+    assert "missing\n\nlocal" in result
+
+
+def test_remote_images_over_the_size_limit_are_skipped(image_server, monkeypatch):
+    monkeypatch.setattr(pandoc_convert.config, "PANDOC_IMAGE_MAX_BYTES", 16)
+    result, files = collect_images(f"![red]({image_server}/red.png)")
+    assert files == {}
+    assert result == "red"
+
+
+@requires_pandoc
+def test_markdown_with_remote_images_renders_to_pdf(image_server, monkeypatch):
+    monkeypatch.setattr(pandoc_convert.pandoc_server, "is_available", lambda: False)
+    markdown = f"# Report\n\n![figure]({image_server}/red.png)\n\n![gone](images/gone.png)\n"
+    pdf_bytes = render_pdf(markdown.encode("utf-8"))
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        assert any(page.get_images() for page in doc)
+
+
+@requires_pandoc
+def test_docx_embeds_remote_images_through_server_and_cli(image_server, monkeypatch, tmp_path):
+    markdown = f"# Report\n\n![figure]({image_server}/red.png)\n\n![inline]({image_data_url('blue')})\n"
+    monkeypatch.setattr(pandoc_convert.pandoc_server, "is_available", lambda: False)
+    cli_docx = render_docx(markdown.encode("utf-8"))
+
+    server = cgi_pandoc_server(tmp_path)
+    monkeypatch.setattr(pandoc_convert, "pandoc_server", server)
+    server_docx = render_docx(markdown.encode("utf-8"))
+
+    assert len(docx_media(cli_docx)) == 2
+    assert len(docx_media(server_docx)) == 2
+
+
+@requires_pandoc
+def test_markdown_with_data_url_images_renders_to_pdf(monkeypatch):
+    monkeypatch.setattr(pandoc_convert.pandoc_server, "is_available", lambda: False)
+    markdown = f"# Report\n\nSome text.\n\n![figure]({image_data_url('red')})\n"
+    pdf_bytes = render_pdf(markdown.encode("utf-8"))
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        assert any(page.get_images() for page in doc)
@@ -0,0 +1,91 @@
+import fitz
+import pytest
+
+from pdf_samples import (
+    draw_ruled_table,
+    draw_single_column,
+    draw_two_columns,
+    make_document,
+    make_pdf,
+    paragraph,
+)
+from pdf_text_parse.main import (
+    analyze_page,
+    classify_page,
+    classify_pdf_pages,
+    convert_pdf_text_to_markdown,
+)
+
+
+def classify(draw) -> str:
+    with fitz.open(stream=make_pdf(draw), filetype="pdf") as doc:
+        return classify_page(doc[0])
+
+
+def test_single_column_page_is_text():
+    assert classify(draw_single_column) == "text"
+
+
+def test_two_column_page_is_complex():
+    # 按坐标排序会把左右两栏的段落交错输出，交给 MinerU
+    assert classify(draw_two_columns) == "complex"
+
+
+def test_ruled_table_page_is_complex():
+    # 本地提取会把表格拆成零散的段落，交给 MinerU
+    assert classify(draw_ruled_table) == "complex"
+
+
+def draw_underlined_heading(page: fitz.Page):
+    page.insert_text((60, 80), "Summary", fontsize=14)
+    page.draw_line((60, 86), (535, 86))
+    page.insert_textbox(fitz.Rect(60, 110, 535, 780), paragraph * 6, fontsize=11)
+
+
+def test_ruling_lines_are_counted():
+    with fitz.open(stream=make_pdf(draw_ruled_table), filetype="pdf") as doc:
+        stats = analyze_page(doc[0])
+    assert stats["horizontal_rules"] == 6
+    assert stats["vertical_rules"] == 4
+
+
+@pytest.fixture
+def find_tables_calls(monkeypatch):
+    calls = []
+    find_tables = fitz.Page.find_tables
+
+    def counting_find_tables(page, *args, **kwargs):
+        calls.append(page.number)
+        return find_tables(page, *args, **kwargs)
+
+    monkeypatch.setattr(fitz.Page, "find_tables", counting_find_tables)
+    return calls
+
+
+def test_table_detection_only_runs_on_pages_with_ruling_lines(find_tables_calls):
+    # 没有线条或只有水平线的页面不可能识别出表格，不调用 find_tables
+    file_bytes = make_document(draw_single_column, draw_underlined_heading, draw_ruled_table)
+    assert classify_pdf_pages(file_bytes) == ["text", "text", "complex"]
+    assert find_tables_calls == [2]
+
+
+def test_classify_pdf_pages_keeps_page_order():
+    file_bytes = make_document(draw_single_column, draw_two_columns, draw_ruled_table)
+    assert classify_pdf_pages(file_bytes) == ["text", "complex", "complex"]
+
+
+def draw_heading_page(page: fitz.Page):
+    page.insert_text((60, 80), "Quarterly Report", fontsize=22)
+    page.insert_textbox(fitz.Rect(60, 110, 535, 780), paragraph * 6, fontsize=11)
+
+
+def draw_large_text(page: fitz.Page):
+    page.insert_textbox(fitz.Rect(60, 60, 535, 780), paragraph * 4, fontsize=22)
+
+
+def test_body_font_size_only_counts_converted_pages():
+    # 第二页全部是大字号正文，不转换该页时不应影响第一页的标题识别
+    file_bytes = make_document(draw_heading_page, draw_large_text)
+    result = convert_pdf_text_to_markdown(file_bytes, [0])
+    assert list(result) == [0]
+    assert result[0].startswith("# Quarterly Report\n\nThe quick brown fox")
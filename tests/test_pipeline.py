@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+import pytest
+
+from pdf_samples import draw_single_column, make_document
+from utils import pipeline, utils
+from utils.async_convert import aiter_convert_to_markdown
+from utils.cache import create_cache
+from utils.pipeline import PageCollector, PagePlan, get_mineru_runs, split_stream_pages
+from utils.utils import iter_convert_to_markdown
+
+
+def test_mineru_runs_split_long_runs_into_shards(monkeypatch):
+    monkeypatch.setattr(pipeline, "mineru_shard_threshold_pages", 3)
+    monkeypatch.setattr(pipeline, "mineru_shard_pages", 2)
+    engines = ["local", "mineru", "mineru", "vlm", "mineru", "mineru", "mineru", "mineru", "mineru"]
+    assert get_mineru_runs(engines) == {1: 2, 4: 5, 6: 7, 8: 8}
+    assert [(page, engine, count) for page, engine, count in PagePlan(engines).steps()] == [
+        (0, "local", 1),
+        (1, "mineru", 2),
+        (3, "vlm", 1),
+        (4, "mineru", 2),
+        (6, "mineru", 2),
+        (8, "mineru", 1),
+    ]
+
+
+def test_page_plan_keeps_document_page_numbers():
+    plan = PagePlan(["mineru", "mineru", "local", "vlm"], first_page=8)
+    assert plan.mineru_runs == {8: 9}
+    assert plan.local_pages == [10]
+    assert plan.vlm_pages == [11]
+    assert [step for step in plan.steps()] == [(8, "mineru", 2), (10, "local", 1), (11, "vlm", 1)]
+
+
+def test_split_stream_pages(monkeypatch):
+    monkeypatch.setattr(pipeline, "stream_head_pages", 2)
+    assert split_stream_pages(5) == (range(0, 2), range(2, 5))
+    assert split_stream_pages(1) == (range(0, 1), range(1, 1))
+
+
+def test_first_page_does_not_wait_for_the_rest_to_be_classified(monkeypatch):
+    # 其余页面的分类阻塞到收到首页结果之后，首页必须先于其余页面的分类产出
+    monkeypatch.setattr(pipeline, "result_cache", create_cache("none", 0))
+    monkeypatch.setattr(pipeline, "stream_head_pages", 1)
+    first_page_received = threading.Event()
+    classified = []
+    get_page_engines = utils.get_page_engines
+
+    def slow_get_page_engines(file_bytes, use_llm, return_images, page_numbers=None):
+        if page_numbers is not None and page_numbers.start > 0:
+            classified.append(first_page_received.wait(5))
+        return get_page_engines(file_bytes, use_llm, return_images, page_numbers)
+
+    monkeypatch.setattr(utils, "get_page_engines", slow_get_page_engines)
+    file_bytes = make_document(draw_single_column, draw_single_column, draw_single_column)
+    pages = iter_convert_to_markdown(file_bytes, "sample.pdf")
+    first = next(pages)
+    first_page_received.set()
+    rest = list(pages)
+    assert classified == [True]
+    assert [first["page"]] + [page["page"] for page in rest] == [0, 1, 2]
+    assert all(page["engine"] == "local" for page in [first] + rest)
+
+
+def test_page_collector_reports_progress_and_failed_pages():
+    progress = []
+    collector = PageCollector(4, lambda done, total: progress.append((done, total)))
+    collector.add({"page": 0, "markdown": "a", "error": None, "page_count": 2})
+    collector.add({"page": 2, "markdown": "", "error": "timeout"})
+    collector.add({"page": 3, "markdown": "b", "error": None})
+    assert progress == [(2, 4), (3, 4), (4, 4)]
+    assert collector.markdown == "a\n\nb"
+    with pytest.raises(Exception, match="第 3 页解析失败"):
+        collector.merge()
+
+
+def test_sync_and_async_streams_yield_the_same_pages(monkeypatch):
+    monkeypatch.setattr(pipeline, "result_cache", create_cache("none", 0))
+    monkeypatch.setattr(pipeline, "stream_head_pages", 1)
+    file_bytes = make_document(draw_single_column, draw_single_column)
+    options = {"use_llm": False, "return_images": False, "image_format": "png"}
+    sync_pages = list(iter_convert_to_markdown(file_bytes, "sample.pdf", **options))
+
+    async def collect():
+        return [page async for page in aiter_convert_to_markdown(file_bytes, "sample.pdf", **options)]
+
+    async_pages = asyncio.run(collect())
+    assert [(p["page"], p["engine"], p["markdown"]) for p in sync_pages] == [
+        (p["page"], p["engine"], p["markdown"]) for p in async_pages
+    ]
+    assert [p["page"] for p in sync_pages] == [0, 1]
@@ -0,0 +1,286 @@
+import asyncio
+import io
+import threading
+
+import pytest
+from bs4 import BeautifulSoup
+from PIL import Image
+
+import qwen_vl_parse.main as qwen_vl_parse
+from benchmark.mock_servers import canned_vlm_html
+from qwen_vl_parse.main import crop_figures, html_parser, postprocess_html, soup_to_markdown
+from utils.cache import MemoryLRUCache
+
+
+def to_markdown(html: str) -> str:
+    soup = BeautifulSoup(html, html_parser)
+    postprocess_html(soup)
+    return soup_to_markdown(soup)
+
+
+# 与改写前 save_images + clean_and_format_html + html_to_markdown 的输出逐字相同
+unchanged_cases = {
+    "simple_tables": (
+        """<html><body>
+<table data-bbox="1 2 3 4"><tr><th>Item</th><th>Value</th></tr><tr><td>alpha</td><td>1.25</td></tr><tr><td>beta</td><td>2.50</td></tr></table>
+<table><thead><tr><th>Name</th><th>Age</th></tr></thead><tbody><tr><td>Ann</td><td>31</td></tr><tr><td>Bob</td><td>27</td></tr></tbody></table>
+</body></html>""",
+        "| Item | Value |\n| --- | --- |\n| alpha | 1.25 |\n| beta | 2.50 |\n\n"
+        "| Name | Age |\n| --- | --- |\n| Ann | 31 |\n| Bob | 27 |",
+    ),
+    "flat_lists": (
+        """<html><body>
+<ul data-bbox="1 2 3 4"><li>apples</li><li>pears</li></ul>
+<ol><li>first step</li><li>second step</li></ol>
+<p>after</p>
+</body></html>""",
+        "* apples\n* pears\n\n1. first step\n2. second step\n\nafter",
+    ),
+    "blocks": (
+        """<html><body>
+<h1 data-bbox="10 10 500 40">Annual Report</h1>
+<h2 style="color:#333;">1. Overview</h2>
+<div class="formula machine_printed" data-bbox="80 500 600 560">E = mc^2</div>
+<div class="image caption" data-bbox="1 2 3 4"><img src="img-1.jpg" alt="fig"/>Figure caption text</div>
+<div class="chart" format="bar">chart data</div>
+<pre>def f():
+    return 1</pre>
+<blockquote>A single quoted line.</blockquote>
+<hr/>
+<address>Beijing, China</address>
+</body></html>""",
+        "# Annual Report\n\n## 1. Overview\n\nE = mc^2\n\n```\ndef f():\n    return 1\n```\n\n"
+        "> A single quoted line.\n\n---\n\n*Beijing, China*",
+    ),
+    "canned_model_response": (
+        canned_vlm_html,
+        "# Benchmark Report\n\n"
+        "The quick brown fox jumps over the lazy dog. This paragraph stands in for the body text of a scanned "
+        "page and is long enough to exercise the markdown post-processing.\n\n"
+        "| Item | Value |\n| --- | --- |\n| alpha | 1.25 |\n| beta | 2.50 |\n\n"
+        "E = mc^2\n\n![](img-1.jpg)\n\n"
+        "Figure 1: a synthetic figure cropped from the page image.",
+    ),
+}
+
+# 改写时有意修正的行为，注释中为改写前的输出
+changed_cases = {
+    # * fruitapplepearconferencewilliams，ol 的 start 被忽略
+    "nested_lists": (
+        """<html><body>
+<ul><li>fruit<ul><li>apple</li><li>pear<ol><li>conference</li><li>williams</li></ol></li></ul></li><li>vegetables</li></ul>
+<ol start="3"><li>third</li><li>fourth</li></ol>
+</body></html>""",
+        "* fruit\n    * apple\n    * pear\n        1. conference\n        2. williams\n* vegetables\n\n"
+        "3. third\n4. fourth",
+    ),
+    # 表头只有两列，后续行的单元格错位
+    "colspan_and_rowspan": (
+        """<html><body><table>
+<tr><th colspan="2">Name</th><th>Score</th></tr>
+<tr><td rowspan="2">Ann</td><td>Lee</td><td>90</td></tr>
+<tr><td>Smith</td><td>85</td></tr>
+</table></body></html>""",
+        "| Name |  | Score |\n| --- | --- | --- |\n| Ann | Lee | 90 |\n|  | Smith | 85 |",
+    ),
+    "rowspan_in_last_column": (
+        """<html><body><table>
+<tr><th>A</th><th>B</th><th>C</th></tr>
+<tr><td>1</td><td>2</td><td rowspan="3">x</td></tr>
+<tr><td>3</td><td>4</td></tr>
+<tr><td rowspan="2" colspan="2">5</td></tr>
+<tr><td>6</td></tr>
+</table></body></html>""",
+        "| A | B | C |\n| --- | --- | --- |\n| 1 | 2 | x |\n| 3 | 4 |  |\n| 5 |  |  |\n|  |  | 6 |",
+    ),
+    # | a | b | a or b |，单元格中的 | 被当作分隔符
+    "pipes_in_cells": (
+        """<html><body>
+<table><tr><th>Expr</th><th>Meaning</th></tr><tr><td>a | b</td><td>a or <b>b</b></td></tr></table>
+</body></html>""",
+        "| Expr | Meaning |\n| --- | --- |\n| a \\| b | a or **b** |",
+    ),
+    # > First quoted paragraph.Second quoted paragraph.
+    "blockquote_paragraphs": (
+        "<html><body><blockquote><p>First quoted paragraph.</p><p>Second quoted paragraph.</p></blockquote></body></html>",
+        "> First quoted paragraph.\n>\n> Second quoted paragraph.",
+    ),
+    # ## Results for 2024，段落中的链接、代码和强调只保留文本
+    "inline_formatting": (
+        """<html><body>
+<h2>Results for <b>2024</b></h2>
+<p>Growth was <em>strong</em>, see <a href="https://example.com">the report</a> and <code> x = 1 </code>.</p>
+</body></html>""",
+        "## Results for **2024**\n\nGrowth was *strong*, see [the report](https://example.com) and `x = 1`.",
+    ),
+    # 改写前段落中的换行和连续空格原样保留，与压缩后的渲染结果相同
+    "paragraph_whitespace": (
+        "<html><body><p>The   company grew\n steadily this year.</p></body></html>",
+        "The company grew steadily this year.",
+    ),
+}
+
+
+@pytest.mark.parametrize("html, expected", unchanged_cases.values(), ids=unchanged_cases.keys())
+def test_output_matches_previous_implementation(html, expected):
+    assert to_markdown(html) == expected
+
+
+@pytest.mark.parametrize("html, expected", changed_cases.values(), ids=changed_cases.keys())
+def test_intended_changes(html, expected):
+    assert to_markdown(html) == expected
+
+
+def test_postprocess_canned_model_response():
+    soup = BeautifulSoup(canned_vlm_html, html_parser)
+    figures = postprocess_html(soup)
+    assert [(tag["src"], bbox) for tag, bbox in figures] == [("img-1.jpg", "100 600 700 1000")]
+    assert not soup.find_all(attrs={"data-bbox": True})
+
+
+def test_postprocess_cleans_attributes_and_classes():
+    html = """<html><body>
+<p style="color:red;font-size:12px" data-polygon="1 2 3 4">styled</p>
+<p style="color:blue">plain</p>
+<div class="formula.handwritten formula.machine_printed">x^2</div>
+<div class="image caption" data-bbox="0 0 10 10"><img data-bbox="0 0 10 10"/>Figure 2</div>
+<div class="chart" format="line">1 2 3</div>
+<div data-bbox="5 5 50 50"><img data-bbox="5 5 50 50"/><div>duplicated layout box</div></div>
+<img data-bbox="60 60 90 90"/>
+</body></html>"""
+    soup = BeautifulSoup(html, html_parser)
+    figures = postprocess_html(soup)
+    styled, plain = soup.find_all("p")
+    assert styled.attrs == {"style": "font-size:12px"}
+    assert plain.attrs == {}
+    assert soup.find("div", class_="formula").get("class") == ["formula"]
+    caption = soup.find("div", class_="image")
+    assert caption.contents == []
+    chart = soup.find("div", class_="chart")
+    assert chart.contents == [] and "format" not in chart.attrs
+    # 与父元素 bbox 相同且父元素中还有其它 div 的图片是版面框，不作为插图
+    assert [(tag["src"], bbox) for tag, bbox in figures] == [("img-1.jpg", "60 60 90 90")]
+
+
+def make_page(mode: str) -> Image.Image:
+    # 200x100 的页面，左半红色、右半蓝色
+    image = Image.new("RGB", (200, 100), "blue")
+    image.paste((255, 0, 0), (0, 0, 100, 100))
+    if mode == "RGBA":
+        image.putalpha(128)
+    elif mode == "P":
+        image = image.convert("P", palette=Image.Palette.ADAPTIVE, colors=4)
+    elif mode == "L":
+        image = image.convert("L")
+    return image
+
+
+def crop(image: Image.Image, *bboxes: str, image_format: str = "jpeg") -> dict:
+    # bbox 为模型输入尺寸(100x50)下的坐标，原图是其两倍
+    figures = [({"src": f"img-{index + 1}.jpg"}, bbox) for index, bbox in enumerate(bboxes)]
+    return {
+        src: Image.open(io.BytesIO(data))
+        for src, data in crop_figures(image, 100, 50, figures, image_format).items()
+    }
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "P", "L"])
+def test_crop_figures_from_non_rgb_pages(mode):
+    page = make_page(mode)
+    figure = crop(page, "0 0 50 50")["img-1.jpg"]
+    assert figure.format == "JPEG"
+    assert figure.size == (100, 100)
+    assert figure.mode == ("L" if mode == "L" else "RGB")
+    expected = page.convert(figure.mode).getpixel((50, 50))
+    assert figure.getpixel((50, 50)) == pytest.approx(expected, abs=8)
+
+
+def test_crop_figures_scales_and_normalizes_boxes():
+    figures = crop(make_page("RGB"), "50 50 0 0", "50 0 100 50", image_format="png")
+    assert figures["img-1.jpg"].size == (100, 100)
+    assert figures["img-1.jpg"].getpixel((10, 10)) == (255, 0, 0)
+    assert figures["img-2.jpg"].getpixel((10, 10)) == (0, 0, 255)
+
+
+def test_crop_figures_clips_out_of_bounds_boxes():
+    figures = crop(make_page("RGB"), "-20 -20 60 500", "150 10 300 40", "0 0 0 40", "1 2 3", "a b c d")
+    # 部分越界的框裁剪到页面范围内，完全越界、面积为零或无法解析的框跳过
+    assert list(figures) == ["img-1.jpg"]
+    assert figures["img-1.jpg"].size == (120, 100)
+
+
+def test_page_cache_key_covers_model_inputs(monkeypatch):
+    key = qwen_vl_parse.get_page_cache_key(b"page")
+    assert qwen_vl_parse.get_page_cache_key(b"page") == key
+    assert qwen_vl_parse.get_page_cache_key(b"other page") != key
+    # 提示词、模型或像素范围变化后，旧的模型输出不能再命中
+    for name, value in [
+        ("prompt", "another prompt"),
+        ("system_prompt", "another system prompt"),
+        ("MODEL_NAME", "another-model"),
+        ("min_pixels", 1),
+        ("max_pixels", 1),
+    ]:
+        with monkeypatch.context() as patch:
+            patch.setattr(qwen_vl_parse, name, value)
+            assert qwen_vl_parse.get_page_cache_key(b"page") != key, name
+
+
+@pytest.fixture
+def inference_calls(monkeypatch):
+    # 用内存缓存和假的模型调用替换全局单例，记录实际发出的请求
+    calls = []
+
+    def inference_with_api(image_url, *args, **kwargs):
+        calls.append(image_url)
+        return canned_vlm_html
+
+    async def inference_with_api_async(image_url, *args, **kwargs):
+        return inference_with_api(image_url)
+
+    monkeypatch.setattr(qwen_vl_parse, "page_cache", MemoryLRUCache(1024 * 1024))
+    monkeypatch.setattr(qwen_vl_parse, "inference_with_api", inference_with_api)
+    monkeypatch.setattr(qwen_vl_parse, "inference_with_api_async", inference_with_api_async)
+    return calls
+
+
+def page_bytes(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (200, 200), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_parse_image_reuses_cached_model_output(inference_calls):
+    red, blue = page_bytes("red"), page_bytes("blue")
+    first = qwen_vl_parse.parse_image(red, "page.png")
+    assert qwen_vl_parse.parse_image(red, "page.png") == first
+    assert "# Benchmark Report" in first
+    assert len(inference_calls) == 1
+    qwen_vl_parse.parse_image(blue, "page.png")
+    assert len(inference_calls) == 2
+    # 缓存的是模型输出，命中后仍按本次请求的参数渲染插图
+    markdown = qwen_vl_parse.parse_image(red, "page.png", return_images=True)
+    assert "](data:image/jpeg;base64," in markdown and len(inference_calls) == 2
+
+
+def test_parse_image_async_shares_the_page_cache(inference_calls, monkeypatch):
+    red = page_bytes("red")
+    sync_markdown = qwen_vl_parse.parse_image(red, "page.png")
+    loop_thread = []
+    cache_threads = []
+    get = qwen_vl_parse.page_cache.get
+
+    def recording_get(key):
+        cache_threads.append(threading.current_thread())
+        return get(key)
+
+    monkeypatch.setattr(qwen_vl_parse.page_cache, "get", recording_get)
+
+    async def main():
+        loop_thread.append(threading.current_thread())
+        return await qwen_vl_parse.parse_image_async(red, "page.png")
+
+    assert asyncio.run(main()) == sync_markdown
+    assert len(inference_calls) == 1
+    # 磁盘缓存的读写不在事件循环线程中执行
+    assert cache_threads and loop_thread[0] not in cache_threads
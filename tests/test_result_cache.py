@@ -0,0 +1,33 @@
+from utils import pipeline, utils
+from utils.asset_store import DiskAssetStore
+from utils.cache import create_cache
+
+
+def test_url_mode_cache_hit_after_eviction_converts_again(monkeypatch, tmp_path):
+    store = DiskAssetStore(str(tmp_path), "/v1/assets", max_bytes=250)
+    monkeypatch.setattr(pipeline, "asset_store", store)
+    monkeypatch.setattr(utils, "asset_store", store)
+    monkeypatch.setattr(pipeline, "result_cache", create_cache("memory", 1024 * 1024))
+    calls = []
+
+    def fake_convert(file_bytes, file_name, *args, **kwargs):
+        calls.append(file_name)
+        return f"![]({store.put(b'figure' * 20, 'png')})"
+
+    monkeypatch.setattr(utils, "convert_to_markdown", fake_convert)
+    first = utils.convert_to_markdown_main(b"%PDF-", "a.pdf", image_mode="url")
+    name = first.rsplit("/", 1)[-1].rstrip(")")
+
+    report = {}
+    assert utils.convert_to_markdown_main(b"%PDF-", "a.pdf", report=report, image_mode="url") == first
+    assert report["cache"] == "hit" and len(calls) == 1
+
+    # 其它请求写入的图片把结果引用的图片挤出存储后，命中的缓存不再可用
+    store.put(b"x" * 200, "png")
+    store.put(b"y" * 200, "png")
+    assert not store.path_for(name).exists()
+
+    report = {}
+    assert utils.convert_to_markdown_main(b"%PDF-", "a.pdf", report=report, image_mode="url") == first
+    assert report["cache"] == "miss" and len(calls) == 2
+    assert store.path_for(name).exists()
@@ -0,0 +1,148 @@
+import io
+import zipfile
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers, UploadFile
+
+import main
+from utils.uploads import (
+    BufferReader,
+    UploadTooLargeError,
+    check_content_length,
+    multipart_overhead,
+    read_upload,
+)
+
+
+def test_buffer_reader_reads_in_requested_chunks():
+    reader = BufferReader(b"0123456789")
+    assert reader.read(4) == b"0123"
+    assert reader.tell() == 4
+    buffer = bytearray(4)
+    assert reader.readinto(buffer) == 4 and buffer == bytearray(b"4567")
+    # 最后一块不足时只返回剩余内容，读到末尾后返回空
+    assert reader.readinto(buffer) == 2 and buffer[:2] == bytearray(b"89")
+    assert reader.read(4) == b""
+    assert reader.read() == b""
+
+
+def test_buffer_reader_seek():
+    reader = BufferReader(memoryview(b"0123456789"))
+    assert reader.seekable() and reader.readable()
+    assert reader.seek(-3, io.SEEK_END) == 7
+    assert reader.read() == b"789"
+    assert reader.seek(2) == 2
+    assert reader.seek(3, io.SEEK_CUR) == 5
+    assert reader.read(2) == b"56"
+    # 越过开头时停在 0，越过末尾时读到空内容
+    assert reader.seek(-100, io.SEEK_CUR) == 0
+    assert reader.seek(100) == 100 and reader.read(1) == b""
+
+
+def test_buffer_reader_does_not_copy_the_buffer():
+    data = bytearray(b"abcdef")
+    reader = BufferReader(memoryview(data))
+    data[0:1] = b"X"
+    assert reader.read(3) == b"Xbc"
+    # 多维 memoryview 按字节读取
+    matrix = memoryview(bytearray(range(6))).cast("B", (2, 3))
+    assert BufferReader(matrix).read() == bytes(range(6))
+
+
+def test_buffer_reader_works_with_buffered_and_zip_readers():
+    payload = bytes(range(256)) * 1024
+    buffered = io.BufferedReader(BufferReader(payload), buffer_size=4096)
+    chunks = iter(lambda: buffered.read(1000), b"")
+    assert b"".join(chunks) == payload
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as writer:
+        writer.writestr("a.txt", "hello")
+    with zipfile.ZipFile(BufferReader(archive.getvalue())) as reader:
+        assert reader.read("a.txt") == b"hello"
+
+
+def test_check_content_length():
+    check_content_length(str(10 + multipart_overhead), 10)
+    with pytest.raises(UploadTooLargeError):
+        check_content_length(str(11 + multipart_overhead), 10)
+    # 0 表示不限制，缺少或无法解析的 Content-Length 交给接口读取时检查
+    check_content_length(str(10**12), 0)
+    check_content_length(None, 10)
+    check_content_length("-1", 10)
+
+
+def make_upload(data: bytes, max_size: int = 1024 * 1024, size=None) -> UploadFile:
+    file = SpooledTemporaryFile(max_size=max_size)
+    file.write(data)
+    file.seek(0)
+    return UploadFile(file, size=size, filename="upload.bin", headers=Headers())
+
+
+def test_read_upload_returns_small_files_as_bytes():
+    upload = make_upload(b"small")
+    file_bytes = read_upload(upload, 10)
+    assert isinstance(file_bytes, bytes) and file_bytes == b"small"
+    # 读取内存中的小文件不会触发写盘
+    assert not upload.file._rolled
+
+
+def test_read_upload_maps_spooled_files():
+    data = b"x" * 4096
+    upload = make_upload(data, max_size=1024)
+    assert upload.file._rolled
+    file_bytes = read_upload(upload)
+    assert isinstance(file_bytes, memoryview)
+    upload.file.close()
+    # 临时文件关闭后映射仍然可以读取
+    assert file_bytes == data
+
+
+def test_read_upload_rejects_files_over_the_limit():
+    with pytest.raises(UploadTooLargeError):
+        read_upload(make_upload(b"x" * 11), 10)
+    # 没有 size 时按文件长度判断
+    with pytest.raises(UploadTooLargeError):
+        read_upload(make_upload(b"x" * 11, max_size=4), 10)
+    assert read_upload(make_upload(b"x" * 10, size=None), 10) == b"x" * 10
+    assert read_upload(make_upload(b""), 10) == b""
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_oversized_content_length_is_rejected_before_the_endpoint(client, monkeypatch):
+    def read_upload(*args, **kwargs):
+        raise AssertionError("请求体不应被读取")
+
+    monkeypatch.setattr(main, "read_upload", read_upload)
+    monkeypatch.setitem(main.upload_limits, "/v1/convert", 10)
+    response = client.post("/v1/convert", files={"file": ("a.pdf", b"x" * (multipart_overhead + 100))})
+    assert response.status_code == 413
+    assert response.json()["code"] == 413
+
+
+def test_oversized_upload_is_rejected_by_the_endpoint(client, monkeypatch):
+    # Content-Length 在余量之内时由接口按文件实际大小检查
+    monkeypatch.setattr(main.config, "UPLOAD_MAX_BYTES", 10)
+    monkeypatch.setitem(main.upload_limits, "/v1/convert", 10)
+    response = client.post("/v1/convert", files={"file": ("a.pdf", b"x" * 100)})
+    assert response.status_code == 413
+    assert response.json()["code"] == 413
+
+    monkeypatch.setattr(main.config, "MARKDOWN_UPLOAD_MAX_BYTES", 10)
+    monkeypatch.setitem(main.upload_limits, "/v1/markdown", 0)
+    response = client.post("/v1/markdown", files={"file": ("a.md", b"# title\n" * 10)})
+    assert response.status_code == 413
+
+
+def test_upload_within_the_limit_reaches_the_endpoint(client, monkeypatch):
+    monkeypatch.setattr(main.config, "UPLOAD_MAX_BYTES", 1000)
+    monkeypatch.setitem(main.upload_limits, "/v1/convert", 1000)
+    # 未知类型的文件在读取后才被拒绝
+    response = client.post("/v1/convert", files={"file": ("a.bin", b"\x00\x01" * 50)})
+    assert response.status_code == 400